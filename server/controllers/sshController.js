@@ -7,6 +7,10 @@ import Session from '../models/Session.js';
 import { createContainerForUser, docker } from '../docker/dockerManager.js';
 import path from 'path';
 import { fileURLToPath } from 'url';
+import { evaluationCacheKey, getCachedResult, isCacheableResult, storeResult } from '../utils/evaluationCache.js';
+import {
+  TIER_EXPENSIVE, caseTier, executionOrder, parseFatal, stopsEvaluation, skippedResult
+} from '../utils/failFast.js';
 
 dotenv.config();
 
@@ -325,6 +329,28 @@ async function execSSH(userId, command, sshPortOverride = null) {
   }
 }
 
+/**
+ * Aggregates per-case evaluator phase timings into per-phase count/total/mean/max (seconds).
+ */
+function summarizeTimings(results) {
+  const phases = {};
+  let total = 0;
+  for (const result of results) {
+    if (!result.timings) continue;
+    total += result.timings.total || 0;
+    for (const entry of result.timings.phases || []) {
+      const stats = phases[entry.phase] || (phases[entry.phase] = { count: 0, total: 0, max: 0 });
+      stats.count += 1;
+      stats.total += entry.duration;
+      stats.max = Math.max(stats.max, entry.duration);
+    }
+  }
+  for (const stats of Object.values(phases)) {
+    stats.mean = stats.total / stats.count;
+  }
+  return { total, phases };
+}
+
 /**
  * Runs code and evaluation script inside user's container.
  * Returns combined stdout, stderr and exit code.
@@ -338,7 +364,9 @@ export async function runAndEvaluate({
   testCases = [],
   clientCount = 1,
   clientDelay = 0.5,
-  codeType = 'server' // Default to server evaluation
+  codeType = 'server', // Default to server evaluation
+  failFast = true, // Run cheap cases first and stop on compile/bind/crash failures
+  sanitize = null // 'address' or 'thread': also run the server under sanitizers
 }) {
   // Determine relative directory and workingDir in container
   // The path inside the container always starts at /home/labuser
@@ -362,6 +390,32 @@ export async function runAndEvaluate({
     const actualTestCases = Array.isArray(testCases) 
       ? testCases 
       : (testCases[codeType] || []);
+    const safeTestCases = Array.isArray(actualTestCases) ? actualTestCases : [];
+
+    // Reuse earlier results for unchanged code (ignoring comments/whitespace) and test cases
+    const cacheKeys = safeTestCases.map((testCase) => evaluationCacheKey({
+      code, language, codeType, testCase, clientCount, clientDelay
+    }));
+    const cachedResults = cacheKeys.map((key, i) => {
+      const cached = getCachedResult(key);
+      return cached && {
+        ...cached,
+        description: safeTestCases[i].description,
+        points: safeTestCases[i].points,
+        timings: null,
+        limits: null,
+        cached: true
+      };
+    });
+    const cacheHits = cachedResults.filter(Boolean).length;
+    if (!sanitize && safeTestCases.length > 0 && cacheHits === safeTestCases.length) {
+      console.log(`[EVAL] All ${cacheHits} test cases served from the result cache`);
+      return {
+        results: cachedResults,
+        timingSummary: summarizeTimings(cachedResults),
+        cache: { hits: cacheHits, misses: 0 }
+      };
+    }
     
     const testDataObj = {
       testCases: actualTestCases,  // Pass only the relevant test cases (server or client)
@@ -387,6 +441,41 @@ export async function runAndEvaluate({
     const srcMainScriptPath = `${process.cwd()}/evaluation_scripts/${mainEvalScript}`;
     const destMainScriptPath = `/tmp/.eval_scripts/${mainEvalScript}`;
     await uploadLocalFile(userId, srcMainScriptPath, destMainScriptPath);
+
+    // Copy shared modules used by both the server and client evaluators
+    await execSSH(userId, `mkdir -p /tmp/.eval_scripts/common_scripts`).catch(err => {
+      console.warn('[EVAL] Failed to create common_scripts directory:', err);
+    });
+
+    const commonModules = [
+      'net_impairment.py',
+      'scheduler.py',
+      'eval_logging.py',
+      'phase_timer.py',
+      'fail_fast.py',
+      'test_plan.py',
+      'sanitizers.py',
+      'supervisor.py',
+      'worker_pool.py',
+      'output_capture.py',
+      'stream_match.py',
+      'deadlines.py',
+      'build_cache.py'
+    ];
+
+    for (const module of commonModules) {
+      const srcModulePath = `${process.cwd()}/evaluation_scripts/common_scripts/${module}`;
+      const destModulePath = `/tmp/.eval_scripts/common_scripts/${module}`;
+
+      try {
+        await uploadLocalFile(userId, srcModulePath, destModulePath);
+        console.log(`[EVAL] Successfully copied ${module}`);
+      } catch (err) {
+        console.warn(`[EVAL] Failed to copy module ${module}:`, err);
+      }
+    }
+
+    await uploadFileContent(userId, '', '/tmp/.eval_scripts/common_scripts/__init__.py');
     
     // Copy supporting modules based on the code type (server or client)
     if (codeType === 'server') {
@@ -399,7 +488,13 @@ export async function runAndEvaluate({
         'evaluate_server.py',
         'utils.py',
         'validators.py',
-        'client_actions.py'
+        'client_actions.py',
+        'protocol_fuzzer.py',
+        'transcript.py',
+        'concurrency_probe.py',
+        'http_load.py',
+        'output_summary.py',
+        'sanitize_server.py'
       ];
       
       // Copy each supporting module
@@ -428,7 +523,8 @@ export async function runAndEvaluate({
         'evaluate_client.py',
         'utils.py',
         'validators.py',
-        'test_servers.py'
+        'test_servers.py',
+        'mock_rules.py'
       ];
       
       // Copy each supporting module
@@ -450,13 +546,17 @@ export async function runAndEvaluate({
     }
     
     // Make all scripts executable
-    await execSSH(userId, `chmod +x /tmp/.eval_scripts/*.py /tmp/.eval_scripts/*_scripts/*.py`);    // Run the evaluation for each test case
-    const safeTestCases = Array.isArray(actualTestCases) ? actualTestCases : [];
+    await execSSH(userId, `chmod +x /tmp/.eval_scripts/*.py /tmp/.eval_scripts/*_scripts/*.py`);
+    // Warm up the evaluation worker pool (a no-op while one for these scripts is already running)
+    await execSSH(userId, `python3 /tmp/.eval_scripts/common_scripts/worker_pool.py start ${codeType}`).catch(err => {
+      console.warn('[EVAL] Failed to start the worker pool:', err);
+    });
+
+    // Run the evaluation for each test case
     console.log(`[EVAL] Number of test cases: ${safeTestCases.length}, Code type: ${codeType}`);
     
-    const results = [];
-    
-    for (let i = 0; i < safeTestCases.length; i++) {
+    // Runs one test case in the container and parses the evaluator's output
+    const runTestCase = async (i) => {
       // Make sure we're using an absolute path to the file
       // If filename is already absolute, use it; otherwise prepend workingDir
       const fullFilePath = filename.startsWith('/') ? filename : 
@@ -474,6 +574,50 @@ export async function runAndEvaluate({
         
         // Extract just the RESULT line for clean output to frontend
         const resultLine = (stdout.match(/RESULT:[^:\n]+:[^\n]+/m) || [''])[0];
+
+        // Phase timings reported by the evaluator (TIMING:<json>)
+        let timings = null;
+        const timingLine = (stdout.match(/^TIMING:(.+)$/m) || [])[1];
+        if (timingLine) {
+          try {
+            timings = JSON.parse(timingLine);
+          } catch (err) {
+            console.warn(`[EVAL][TestCase ${i}] Could not parse timings:`, err);
+          }
+        }
+        
+        // Excerpt of the server's own stdout/stderr on failures (SERVER_OUTPUT:<json>)
+        let serverOutput = null;
+        const serverOutputLine = (stdout.match(/^SERVER_OUTPUT:(.+)$/m) || [])[1];
+        if (serverOutputLine) {
+          try {
+            serverOutput = JSON.parse(serverOutputLine);
+          } catch (err) {
+            console.warn(`[EVAL][TestCase ${i}] Could not parse server output:`, err);
+          }
+        }
+        
+        // Scale factor and effective timeouts of this run (LIMITS:<json>)
+        let limits = null;
+        const limitsLine = (stdout.match(/^LIMITS:(.+)$/m) || [])[1];
+        if (limitsLine) {
+          try {
+            limits = JSON.parse(limitsLine);
+          } catch (err) {
+            console.warn(`[EVAL][TestCase ${i}] Could not parse limits:`, err);
+          }
+        }
+        
+        // Every client's reply, only printed when the test case asks for it (CLIENT_OUTPUTS:<json>)
+        let clientOutputs = null;
+        const clientOutputsLine = (stdout.match(/^CLIENT_OUTPUTS:(.+)$/m) || [])[1];
+        if (clientOutputsLine) {
+          try {
+            clientOutputs = JSON.parse(clientOutputsLine);
+          } catch (err) {
+            console.warn(`[EVAL][TestCase ${i}] Could not parse client outputs:`, err);
+          }
+        }
         
         // Parse the result line
         let status = 'FAIL';
@@ -500,7 +644,7 @@ export async function runAndEvaluate({
           status = 'PASS';
         }
         
-        results.push({
+        const result = {
           stdout: resultLine || stdout,
           stderr: stderr,
           exitCode: exitCode,
@@ -509,11 +653,24 @@ export async function runAndEvaluate({
           // Add these fields so they persist in the frontend 
           description: safeTestCases[i].description,
           points: safeTestCases[i].points,
-          actualOutput: message
-        });
+          actualOutput: message,
+          timings,
+          fatal: parseFatal(stdout),
+          serverOutput,
+          limits,
+          clientOutputs
+        };
+
+        // Only deterministic verdicts the evaluator actually reported are worth remembering;
+        // the per-client detail can be large and is only wanted for the run that asked for it
+        if (resultLine && isCacheableResult(result)) {
+          const { timings: _timings, limits: _limits, clientOutputs: _clientOutputs, ...cacheable } = result;
+          storeResult(cacheKeys[i], cacheable);
+        }
+        return result;
       } catch (error) {
         console.error(`[EVAL] Error running test case ${i}:`, error);
-        results.push({
+        return {
           stdout: '',
           stderr: String(error),
           exitCode: 1,
@@ -522,16 +679,73 @@ export async function runAndEvaluate({
           description: safeTestCases[i].description,
           points: safeTestCases[i].points,
           actualOutput: `Error during evaluation: ${error.message || 'Unknown error'}`
-        });
+        };
+      }
+    };
+
+    // Cheap cases run first; results are still reported in the authored order
+    const results = new Array(safeTestCases.length);
+    const order = failFast ? executionOrder(safeTestCases) : safeTestCases.map((_, i) => i);
+    let fatal = null;         // { cause, detail, sourceIndex } once the submission is known to be broken
+    let earlierFailure = null; // first failing smoke/functional case, gates the expensive tier
+
+    for (const i of order) {
+      const tier = caseTier(safeTestCases[i]);
+      if (fatal) {
+        results[i] = skippedResult(safeTestCases[i], fatal.cause, fatal.sourceIndex, fatal.detail);
+        continue;
+      }
+      if (failFast && tier >= TIER_EXPENSIVE && earlierFailure !== null) {
+        console.log(`[EVAL][TestCase ${i}] Skipped: test case ${earlierFailure} failed`);
+        results[i] = skippedResult(safeTestCases[i], 'earlier_failures', earlierFailure);
+        continue;
+      }
+
+      if (cachedResults[i]) {
+        console.log(`[EVAL][TestCase ${i}] Served from the result cache`);
+        results[i] = cachedResults[i];
+      } else {
+        results[i] = await runTestCase(i);
+      }
+
+      if (tier < TIER_EXPENSIVE && results[i].status !== 'PASS' && earlierFailure === null) {
+        earlierFailure = i;
+      }
+      if (failFast && stopsEvaluation(results[i].fatal, tier)) {
+        console.log(`[EVAL][TestCase ${i}] Fatal: ${results[i].fatal.cause}, skipping remaining test cases`);
+        fatal = { ...results[i].fatal, sourceIndex: i };
       }
     }
-    
+
+    // Optional sanitizer tier; its findings are reported next to the verdicts, not scored
+    let diagnostics = null;
+    if (sanitize && codeType === 'server' && !fatal) {
+      const fullFilePath = filename.startsWith('/') ? filename :
+                          `${workingDir}/${filename.split('/').pop()}`;
+      const sanitizeCmd = `cd ${workingDir} && python3 /tmp/.eval_scripts/server_scripts/sanitize_server.py ` +
+        `${fullFilePath} ${testFilePath} --mode ${sanitize === 'thread' ? 'thread' : 'address'}`;
+      console.log(`[EVAL] Sanitizer command: ${sanitizeCmd}`);
+      try {
+        const { stdout } = await execSSH(userId, sanitizeCmd);
+        const sanitizerLine = (stdout.match(/^SANITIZER:(.+)$/m) || [])[1];
+        diagnostics = sanitizerLine ? JSON.parse(sanitizerLine) : null;
+        console.log(`[EVAL] Sanitizer findings: ${diagnostics ? diagnostics.findings.length : 'none reported'}`);
+      } catch (err) {
+        console.warn('[EVAL] Sanitizer run failed:', err);
+      }
+    }
+
     // Clean up - don't fail if cleanup fails
     execSSH(userId, `rm -rf ${testFilePath} /tmp/.eval_scripts`).catch(err => {
       console.warn('[EVAL] Cleanup failed:', err);
     });
     
-    return { results };
+    return {
+      results,
+      timingSummary: summarizeTimings(results),
+      cache: { hits: cacheHits, misses: safeTestCases.length - cacheHits },
+      diagnostics
+    };
 
   } catch (error) {
     console.error('[EVAL] Error:', error);
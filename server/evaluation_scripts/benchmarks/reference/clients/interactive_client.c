@@ -0,0 +1,39 @@
+/* Interactive calculator client: prints the server prompt, then one result per stdin expression. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <arpa/inet.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+int main(void) {
+    int fd = socket(AF_INET, SOCK_STREAM, 0);
+    struct sockaddr_in addr;
+    char line[256], buf[1024];
+    ssize_t n;
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_port = htons(PORT);
+    inet_pton(AF_INET, "127.0.0.1", &addr.sin_addr);
+    if (connect(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("connect");
+        return 1;
+    }
+    setvbuf(stdout, NULL, _IONBF, 0);
+
+    n = recv(fd, buf, sizeof(buf) - 1, 0);
+    buf[n > 0 ? n : 0] = '\0';
+    printf("%s", buf);
+    while (fgets(line, sizeof(line), stdin)) {
+        send(fd, line, strlen(line), 0);
+        n = recv(fd, buf, sizeof(buf) - 1, 0);
+        if (n <= 0)
+            break;
+        buf[n] = '\0';
+        printf("Result from server: %s", buf);
+    }
+    close(fd);
+    return 0;
+}
@@ -0,0 +1,44 @@
+/* TCP client: sends each stdin line, prints each reply, then prints anything else until the server closes. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <arpa/inet.h>
+#include <sys/socket.h>
+#include <sys/time.h>
+
+#define PORT 8080
+
+int main(void) {
+    int fd = socket(AF_INET, SOCK_STREAM, 0);
+    struct sockaddr_in addr;
+    struct timeval tv = {2, 0};
+    char line[1024], buf[4096];
+    ssize_t n;
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_port = htons(PORT);
+    inet_pton(AF_INET, "127.0.0.1", &addr.sin_addr);
+    if (connect(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("connect");
+        return 1;
+    }
+    setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &tv, sizeof(tv));
+    setvbuf(stdout, NULL, _IONBF, 0);
+
+    while (fgets(line, sizeof(line), stdin)) {
+        line[strcspn(line, "\n")] = '\0';
+        send(fd, line, strlen(line), 0);
+        n = recv(fd, buf, sizeof(buf) - 1, 0);
+        if (n <= 0)
+            break;
+        buf[n] = '\0';
+        printf("Server: %s\n", buf);
+    }
+    while ((n = recv(fd, buf, sizeof(buf) - 1, 0)) > 0) {
+        buf[n] = '\0';
+        printf("Server: %s\n", buf);
+    }
+    close(fd);
+    return 0;
+}
@@ -0,0 +1,34 @@
+/* UDP client: sends "ping" and prints the reply. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <arpa/inet.h>
+#include <sys/socket.h>
+#include <sys/time.h>
+
+#define PORT 8080
+
+int main(void) {
+    int fd = socket(AF_INET, SOCK_DGRAM, 0);
+    struct sockaddr_in addr;
+    struct timeval tv = {2, 0};
+    char buf[2048];
+    ssize_t n;
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_port = htons(PORT);
+    inet_pton(AF_INET, "127.0.0.1", &addr.sin_addr);
+    setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &tv, sizeof(tv));
+
+    sendto(fd, "ping", 4, 0, (struct sockaddr *)&addr, sizeof(addr));
+    n = recvfrom(fd, buf, sizeof(buf) - 1, 0, NULL, NULL);
+    if (n < 0) {
+        perror("recvfrom");
+        return 1;
+    }
+    buf[n] = '\0';
+    printf("Reply: %s\n", buf);
+    close(fd);
+    return 0;
+}
@@ -0,0 +1,9 @@
+/* Does not compile: missing semicolon. */
+#include <stdio.h>
+
+#define PORT 8080
+
+int main(void) {
+    printf("port %d\n", PORT)
+    return 0;
+}
@@ -0,0 +1,33 @@
+/* Buggy server: dereferences NULL as soon as the first client connects. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+int main(void) {
+    int listen_fd = socket(AF_INET, SOCK_STREAM, 0), opt = 1;
+    struct sockaddr_in addr;
+    volatile char *name = NULL;
+
+    setsockopt(listen_fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt));
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = INADDR_ANY;
+    addr.sin_port = htons(PORT);
+    if (bind(listen_fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("bind");
+        return 1;
+    }
+    listen(listen_fd, 16);
+
+    for (;;) {
+        int conn = accept(listen_fd, NULL, NULL);
+        if (conn < 0)
+            continue;
+        name[0] = 'x';
+        close(conn);
+    }
+}
@@ -0,0 +1,35 @@
+/* Iterative TCP echo server: serves one client at a time. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+int main(void) {
+    int listen_fd = socket(AF_INET, SOCK_STREAM, 0), opt = 1;
+    struct sockaddr_in addr;
+    char buf[4096];
+
+    setsockopt(listen_fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt));
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = INADDR_ANY;
+    addr.sin_port = htons(PORT);
+    if (bind(listen_fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("bind");
+        return 1;
+    }
+    listen(listen_fd, 16);
+
+    for (;;) {
+        int conn = accept(listen_fd, NULL, NULL);
+        ssize_t n;
+        if (conn < 0)
+            continue;
+        while ((n = recv(conn, buf, sizeof(buf), 0)) > 0)
+            send(conn, buf, n, 0);
+        close(conn);
+    }
+}
@@ -0,0 +1,59 @@
+/* Line protocol server: HELLO -> WORLD, BYE -> SEE YOU, TIME -> ctime(), anything else -> ERROR. */
+#include <signal.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+static void reply(int conn, const char *msg) {
+    send(conn, msg, strlen(msg), 0);
+}
+
+int main(void) {
+    int listen_fd = socket(AF_INET, SOCK_STREAM, 0), opt = 1;
+    struct sockaddr_in addr;
+
+    signal(SIGCHLD, SIG_IGN);
+    setsockopt(listen_fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt));
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = INADDR_ANY;
+    addr.sin_port = htons(PORT);
+    if (bind(listen_fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("bind");
+        return 1;
+    }
+    listen(listen_fd, 256);
+
+    for (;;) {
+        int conn = accept(listen_fd, NULL, NULL);
+        if (conn < 0)
+            continue;
+        if (fork() == 0) {
+            char buf[1024];
+            ssize_t n;
+            close(listen_fd);
+            while ((n = recv(conn, buf, sizeof(buf) - 1, 0)) > 0) {
+                buf[n] = '\0';
+                buf[strcspn(buf, "\r\n")] = '\0';
+                if (strcmp(buf, "HELLO") == 0) {
+                    reply(conn, "WORLD");
+                } else if (strcmp(buf, "BYE") == 0) {
+                    reply(conn, "SEE YOU");
+                } else if (strcmp(buf, "TIME") == 0) {
+                    time_t now = time(NULL);
+                    reply(conn, ctime(&now));
+                } else {
+                    reply(conn, "ERROR");
+                }
+            }
+            close(conn);
+            _exit(0);
+        }
+        close(conn);
+    }
+}
@@ -0,0 +1,58 @@
+/* Single-process select() based TCP echo server. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <sys/select.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+int main(void) {
+    int listen_fd = socket(AF_INET, SOCK_STREAM, 0), opt = 1, max_fd, fd;
+    struct sockaddr_in addr;
+    fd_set all, ready;
+    char buf[4096];
+
+    setsockopt(listen_fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt));
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = INADDR_ANY;
+    addr.sin_port = htons(PORT);
+    if (bind(listen_fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("bind");
+        return 1;
+    }
+    listen(listen_fd, 1024);
+
+    FD_ZERO(&all);
+    FD_SET(listen_fd, &all);
+    max_fd = listen_fd;
+    for (;;) {
+        ready = all;
+        if (select(max_fd + 1, &ready, NULL, NULL, NULL) < 0)
+            continue;
+        for (fd = 0; fd <= max_fd; fd++) {
+            if (!FD_ISSET(fd, &ready))
+                continue;
+            if (fd == listen_fd) {
+                int conn = accept(listen_fd, NULL, NULL);
+                if (conn >= 0 && conn < FD_SETSIZE) {
+                    FD_SET(conn, &all);
+                    if (conn > max_fd)
+                        max_fd = conn;
+                } else if (conn >= 0) {
+                    close(conn);
+                }
+            } else {
+                ssize_t n = recv(fd, buf, sizeof(buf), 0);
+                if (n <= 0) {
+                    close(fd);
+                    FD_CLR(fd, &all);
+                } else {
+                    send(fd, buf, n, 0);
+                }
+            }
+        }
+    }
+}
@@ -0,0 +1,32 @@
+/* UDP echo server. */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+int main(void) {
+    int fd = socket(AF_INET, SOCK_DGRAM, 0);
+    struct sockaddr_in addr, peer;
+    socklen_t peer_len;
+    char buf[65536];
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = INADDR_ANY;
+    addr.sin_port = htons(PORT);
+    if (bind(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("bind");
+        return 1;
+    }
+
+    for (;;) {
+        ssize_t n;
+        peer_len = sizeof(peer);
+        n = recvfrom(fd, buf, sizeof(buf), 0, (struct sockaddr *)&peer, &peer_len);
+        if (n > 0)
+            sendto(fd, buf, n, 0, (struct sockaddr *)&peer, peer_len);
+    }
+}
@@ -0,0 +1,30 @@
+/* UDP server that answers every datagram with "pong". */
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <netinet/in.h>
+#include <sys/socket.h>
+
+#define PORT 8080
+
+int main(void) {
+    int fd = socket(AF_INET, SOCK_DGRAM, 0);
+    struct sockaddr_in addr, peer;
+    socklen_t peer_len;
+    char buf[2048];
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = INADDR_ANY;
+    addr.sin_port = htons(PORT);
+    if (bind(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("bind");
+        return 1;
+    }
+
+    for (;;) {
+        peer_len = sizeof(peer);
+        if (recvfrom(fd, buf, sizeof(buf), 0, (struct sockaddr *)&peer, &peer_len) > 0)
+            sendto(fd, "pong", 4, 0, (struct sockaddr *)&peer, peer_len);
+    }
+}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the CN Lab evaluators.
+
+Runs every case in cases.json (reference C servers/clients plus a test case
+for each evaluator mode) through the real evaluate_server.py /
+evaluate_client.py at several parallelism levels and records:
+- end-to-end evaluation latency (p50/p90/p99/max)
+- CPU time of each evaluation process tree (user + system, via wait4)
+- throughput in evaluations per minute
+- whether each verdict matched the expected PASS/FAIL
+- per-phase timings from the evaluators' TIMING line
+
+Results can be saved as a named JSON baseline and later runs compared
+against it; the exit code is 1 when a regression is found.
+
+    python3 run_benchmarks.py --levels 1,8,64 --save-baseline main
+    python3 run_benchmarks.py --compare main --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCH_DIR)
+REFERENCE_DIR = os.path.join(BENCH_DIR, "reference")
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+EVALUATORS = {
+    "server": os.path.join(SCRIPTS_DIR, "server_scripts", "evaluate_server.py"),
+    "client": os.path.join(SCRIPTS_DIR, "client_scripts", "evaluate_client.py"),
+}
+
+sys.path.append(os.path.join(SCRIPTS_DIR, "common_scripts"))
+from phase_timer import summarize_timings  # noqa: E402
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[rank]
+
+def load_cases(path, name_filter=None):
+    with open(path) as f:
+        cases = json.load(f)["cases"]
+    if name_filter:
+        cases = [case for case in cases if name_filter in case["name"]]
+    return cases
+
+def run_case(case, env, timeout):
+    """Evaluate one reference program in its own scratch directory"""
+    workdir = tempfile.mkdtemp(prefix=f"bench_{case['name']}_")
+    try:
+        src = os.path.join(workdir, os.path.basename(case["source"]))
+        shutil.copy(os.path.join(REFERENCE_DIR, case["source"]), src)
+        test_file = os.path.join(workdir, "testcases.json")
+        with open(test_file, "w") as f:
+            json.dump({"testCases": [case["testCase"]]}, f)
+
+        cmd = [sys.executable, EVALUATORS[case["role"]], src, test_file, "0"]
+        out_path = os.path.join(workdir, "stdout.txt")
+        start = time.perf_counter()
+        with open(out_path, "wb") as out:
+            proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=out, stderr=subprocess.DEVNULL)
+            timer = threading.Timer(timeout, proc.kill)
+            timer.start()
+            try:
+                # wait4 gives the CPU usage of the evaluator and everything it reaped
+                _, _, usage = os.wait4(proc.pid, 0)
+            finally:
+                timer.cancel()
+        latency = time.perf_counter() - start
+
+        status, timings = "ERROR", None
+        with open(out_path, errors="replace") as f:
+            for line in f:
+                if line.startswith("TIMING:"):
+                    try:
+                        timings = json.loads(line[len("TIMING:"):])
+                    except ValueError:
+                        pass
+                elif line.startswith("RESULT:"):
+                    status = line.split(":", 2)[1]
+        return {
+            "name": case["name"],
+            "status": status,
+            "expected": case.get("expect"),
+            "latency": latency,
+            "cpu": usage.ru_utime + usage.ru_stime,
+            "timings": timings,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_level(cases, level, jobs, env, timeout):
+    """Run `jobs` evaluations (cycling through the cases) with `level` in parallel"""
+    work = [cases[i % len(cases)] for i in range(jobs)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        runs = list(pool.map(lambda case: run_case(case, env, timeout), work))
+    wall = time.perf_counter() - start
+
+    latencies = [run["latency"] for run in runs]
+    cpus = [run["cpu"] for run in runs]
+    mismatches = sorted({run["name"] for run in runs
+                         if run["expected"] and run["status"] != run["expected"]})
+    per_case = {}
+    for run in runs:
+        per_case.setdefault(run["name"], []).append(run)
+    return {
+        "jobs": len(runs),
+        "wall": round(wall, 3),
+        "throughputPerMin": round(len(runs) / wall * 60, 2) if wall else 0.0,
+        "latency": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p90": round(percentile(latencies, 90), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies), 4),
+        },
+        "cpu": {"mean": round(sum(cpus) / len(cpus), 4), "total": round(sum(cpus), 3)},
+        "verdictMismatches": mismatches,
+        "cases": {
+            name: {
+                "latencyP50": round(percentile([r["latency"] for r in case_runs], 50), 4),
+                "cpuMean": round(sum(r["cpu"] for r in case_runs) / len(case_runs), 4),
+                "statuses": sorted({r["status"] for r in case_runs}),
+                "phases": summarize_timings([r["timings"] for r in case_runs if r["timings"]]),
+            }
+            for name, case_runs in sorted(per_case.items())
+        },
+    }
+
+def compare(current, baseline, tolerance, min_delta=0.05):
+    """Return a list of human-readable regressions of `current` against `baseline`
+
+    Per-case latencies only count as a regression when they also grew by more
+    than `min_delta` seconds, so sub-second cases do not trip on scheduler noise.
+    """
+    regressions = []
+    for level, result in current["levels"].items():
+        base = baseline["levels"].get(level)
+        if not base:
+            continue
+        for name in result["verdictMismatches"]:
+            regressions.append(f"level {level}: {name} verdict differs from expected")
+        checks = [
+            ("p50 latency", result["latency"]["p50"], base["latency"]["p50"], True),
+            ("p99 latency", result["latency"]["p99"], base["latency"]["p99"], True),
+            ("mean CPU", result["cpu"]["mean"], base["cpu"]["mean"], True),
+            ("throughput", result["throughputPerMin"], base["throughputPerMin"], False),
+        ]
+        for label, now, before, lower_is_better in checks:
+            if not before:
+                continue
+            change = (now - before) / before
+            if (lower_is_better and change > tolerance) or (not lower_is_better and -change > tolerance):
+                regressions.append(f"level {level}: {label} {before} -> {now} ({change:+.0%})")
+        for name, case in result["cases"].items():
+            base_case = base["cases"].get(name)
+            if base_case and base_case["latencyP50"]:
+                delta = case["latencyP50"] - base_case["latencyP50"]
+                change = delta / base_case["latencyP50"]
+                if change > tolerance and delta > min_delta:
+                    regressions.append(f"level {level}: {name} p50 latency "
+                                       f"{base_case['latencyP50']} -> {case['latencyP50']} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="CN Lab evaluator benchmark")
+    parser.add_argument("--cases", default=os.path.join(BENCH_DIR, "cases.json"), help="Benchmark case file")
+    parser.add_argument("--levels", default="1,8,64", help="Comma separated parallelism levels")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each case per level")
+    parser.add_argument("--jobs", type=int, default=0,
+                        help="Evaluations per level (default: every case --repeat times, at least twice the level)")
+    parser.add_argument("--filter", default=None, help="Only run cases whose name contains this")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-evaluation timeout in seconds")
+    parser.add_argument("--time-mode", default=None, choices=["real", "fast"], help="Evaluator wait mode")
+    parser.add_argument("--output", default=None, help="Write the results JSON here")
+    parser.add_argument("--save-baseline", default=None, help="Store the results as this named baseline")
+    parser.add_argument("--compare", default=None, help="Compare against this named baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="Per-case slowdowns below this many seconds are ignored")
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases, args.filter)
+    if not cases:
+        print("No benchmark cases selected")
+        sys.exit(2)
+
+    env = os.environ.copy()
+    env.setdefault("CN_EVAL_LOG_LEVEL", "WARNING")
+    if args.time_mode:
+        env["CN_EVAL_TIME_MODE"] = args.time_mode
+
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "timeMode": env.get("CN_EVAL_TIME_MODE", "real"),
+            "cases": [case["name"] for case in cases],
+            "repeat": args.repeat,
+        },
+        "levels": {},
+    }
+    for level in [int(x) for x in args.levels.split(",") if x.strip()]:
+        jobs = args.jobs or max(len(cases) * args.repeat, 2 * level)
+        result = run_level(cases, level, jobs, env, args.timeout)
+        results["levels"][str(level)] = result
+        print(f"level {level:>3}: {result['jobs']} evaluations in {result['wall']}s, "
+              f"{result['throughputPerMin']}/min, latency p50={result['latency']['p50']}s "
+              f"p99={result['latency']['p99']}s, cpu mean={result['cpu']['mean']}s, "
+              f"verdict mismatches: {result['verdictMismatches'] or 'none'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {path}")
+
+    failed = any(result["verdictMismatches"] for result in results["levels"].values())
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if not regressions:
+            print(f"No regressions against baseline '{args.compare}'")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
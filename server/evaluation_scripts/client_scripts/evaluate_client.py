@@ -1,66 +1,98 @@
 import argparse
-import json
+import os
 import sys
+
+# Shared evaluator modules live next to this directory in common_scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common_scripts"))
+
 from utils import find_free_port, compile_program, patch_client_port
 from test_servers import (
     start_tcp_server, start_udp_server, start_chatroom_server, 
     start_stop_and_wait_server, start_multistep_server
 )
 from validators import validate_output
+from net_impairment import start_impairment_proxy
+from eval_logging import get_logger, setup_logging
+from phase_timer import PhaseTimer
+from fail_fast import report_fatal, is_compiler_error, COMPILE_ERROR
+from test_plan import load_plan, PlanError
+from deadlines import report_limits
+from build_cache import cached_build
+
+logger = get_logger("evaluate_client")
 
-def log_debug(msg):
-    with open('/tmp/evaluate_client_debug.log', 'a') as f:
-        f.write(msg + '\n')
-    print(msg)
+# Mock server for each plan runner
+MOCK_SERVERS = {
+    "chatroom": lambda port, case: start_chatroom_server(port, case.testcase, case.client_count),
+    "stopAndWait": lambda port, case: start_stop_and_wait_server(port, case.testcase),
+    "multiStep": lambda port, case: start_multistep_server(port, case.testcase),
+    "udp": lambda port, case: start_udp_server(port, case.testcase),
+    "tcp": lambda port, case: start_tcp_server(port, case.testcase),
+}
 
-def evaluate_client(client_src, testcase):
+def evaluate_client(client_src, case, timer=None, build_dir=None):
+    timer = timer or PhaseTimer()
     port = find_free_port()
-    protocol = testcase.get("protocol", "tcp")
-    client_count = testcase.get("clientCount", 1)
-    client_delay = testcase.get("clientDelay", 0.2)
-    chatroom = testcase.get("chatroom", False)
-    stop_and_wait = testcase.get("stopAndWait", False)
-    multistep = testcase.get("multiStep", False)
-    periodic = testcase.get("periodicSend", False)
+    testcase = case.testcase
+    protocol = case.protocol
+
+    # With an impairment profile the client talks to a proxy in front of the mock server
+    impairment = testcase.get("impairment")
+    client_port = find_free_port() if impairment else port
 
     # Always patch client source code to use the test port
     patch_pattern = testcase.get("portPattern", r'#define\s+PORT\s+\d+')
-    try:
-        patch_client_port(client_src, patch_pattern, port)
-    except Exception as e:
-        log_debug(f"Warning: Failed to patch client port: {e}")
 
-    # Compile client
-    success, _, stderr = compile_program(client_src, output_name="client_exec")
+    def patch(path, patch_port):
+        try:
+            patch_client_port(path, patch_pattern, patch_port)
+        except Exception as e:
+            logger.warning(f"Failed to patch client port: {e}")
+
+    if build_dir:
+        # A shared build comes with the port it was patched for
+        with timer.phase("compile"):
+            success, client_port, stderr = cached_build(client_src, build_dir, "client_exec", find_free_port,
+                                                        patch, compile_program, key_parts=(patch_pattern,))
+        if not impairment:
+            port = client_port
+    else:
+        with timer.phase("port_patch"):
+            patch(client_src, client_port)
+
+        # Compile client
+        with timer.phase("compile"):
+            success, _, stderr = compile_program(client_src, output_name="client_exec")
     if not success:
+        if is_compiler_error(stderr):
+            report_fatal(COMPILE_ERROR, stderr.decode(errors="replace"))
         return "FAIL", f"Compilation failed: {stderr.decode()}"
     
     # Start the reference/mock server for testing
-    log_debug(f"Setting up mock server for client test: {testcase.get('description', '')}")
-    if chatroom:
-        server, server_thread, server_state = start_chatroom_server(port, testcase, client_count)
-    elif stop_and_wait:
-        server, server_thread, server_state = start_stop_and_wait_server(port, testcase)
-    elif multistep:
-        server, server_thread, server_state = start_multistep_server(port, testcase)
-    elif protocol == "udp":
-        server, server_thread, server_state = start_udp_server(port, testcase)
-    else:
-        # Default TCP server with scripted responses
-        if "serverScript" in testcase:
-            log_debug(f"Using serverScript: {testcase['serverScript']}")
-        else:
-            log_debug("Warning: No serverScript defined for TCP test")
-        server, server_thread, server_state = start_tcp_server(port, testcase)
+    with timer.phase("mock_server_start"):
+        logger.info(f"Setting up mock server for client test: {testcase.get('description', '')}")
+        if case.runner == "tcp" and "serverScript" not in testcase:
+            logger.warning("No serverScript defined for TCP test")
+        server, server_thread, server_state = MOCK_SERVERS[case.runner](port, case)
+
+    proxy = None
+    if impairment:
+        with timer.phase("proxy_start"):
+            proxy = start_impairment_proxy(client_port, port, protocol, impairment)
 
     # Run clients (concurrent if needed)
     from utils import run_clients
-    status, msg = run_clients(port, client_count, client_delay, periodic, testcase, server_state)
+    with timer.phase("client_run"):
+        status, msg = run_clients(client_port, case.client_count, case.client_delay, case.periodic,
+                                  testcase, server_state)
 
-    # Clean up server
-    server.shutdown()
-    server.server_close()
-    server_thread.join(timeout=2)
+    # Clean up proxy and server
+    with timer.phase("teardown"):
+        if proxy:
+            proxy.stop()
+        server.shutdown()
+        server.server_close()
+        server_thread.join(timeout=2)
 
     return status, msg
 
@@ -69,18 +101,28 @@ def main():
     parser.add_argument("client_file", help="Client source code file")
     parser.add_argument("test_file", help="Test case file (JSON)")
     parser.add_argument("test_idx", type=int, help="Test case index")
+    parser.add_argument("--profile", choices=["cpu", "memory", "all"], default=None,
+                        help="Profile the evaluation (also CN_EVAL_PROFILE)")
+    parser.add_argument("--build-dir", default=os.environ.get("CN_EVAL_BUILD_DIR"),
+                        help="Share compiled builds between evaluations (see build_cache.py)")
+    parser.add_argument("--no-plan-cache", action="store_true",
+                        help="Compile the test file without the plan cache (one-shot test files)")
     args = parser.parse_args()
+    setup_logging("evaluate_client")
+    timer = PhaseTimer(args.profile)
     
-    with open(args.test_file, "r") as f:
-        data = json.load(f)
-    testcase = data["testCases"]["client"][args.test_idx] if "client" in data["testCases"] else data["testCases"][args.test_idx]
-
-    status, message = evaluate_client(args.client_file, testcase)
-    log_debug(f"RESULT:{status}:{message}")
-    if status != "PASS":
-        log_debug(f"[DEBUG] Exiting with code 1 due to status: {status}, message: {message}")
-    else:
-        log_debug(f"[DEBUG] Exiting with code 0 (PASS)")
+    with timer.phase("plan_load"):
+        try:
+            case = load_plan(args.test_file, "client", cache=not args.no_plan_cache).case(args.test_idx)
+        except (OSError, PlanError) as e:
+            case = None
+            status, message = "FAIL", str(e)
+    if case is not None:
+        status, message = evaluate_client(args.client_file, case, timer, args.build_dir)
+    timer.emit()
+    report_limits()
+    print(f"RESULT:{status}:{message}")
+    logger.info(f"Evaluation finished with status {status}", extra={"fields": {"status": status}})
     sys.exit(0 if status == "PASS" else 1)
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""
+Compiled serverScript rules for the mock servers.
+
+A test case's serverScript is compiled once, when its mock server starts,
+instead of being interpreted again for every datagram or connection.
+
+RuleTable answers "which step responds to this request" for the UDP mock.
+Every step with an "expect" is a rule, and the first matching step in
+script order wins, as before. Rules are indexed by their matchType:
+
+- exact (UDP default): a dict from request to the first step with that text
+- prefix: a character trie, walked once along the request
+- contains: one Aho-Corasick automaton over all the literals, walked once
+  along the request; the lowest step index among its hits wins
+- regex: searched one by one in script order, stopping at the first hit or
+  at the first rule after one that already matched
+
+Exact, prefix and contains lookups cost time in proportion to the request
+length, not to the number of rules, so protocol labs with hundreds of
+commands stay cheap per datagram. Only regex rules are paid for one by one.
+
+TCPScript is the per-connection state machine of the TCP mock: a tuple of
+receive/send operations with their matchers, prompts and delays already
+resolved, which each connection simply walks.
+"""
+import re
+from typing import NamedTuple, Optional
+
+from eval_logging import get_logger
+from stream_match import Automaton
+from test_plan import SCRIPT_MATCH_TYPES
+
+logger = get_logger("mock_rules")
+
+INTERACTIVE_DELAY = 0.3
+DEFAULT_DELAY = 0.1
+GREETING_DELAY = 0.2
+
+def ensure_newline(msg):
+    return msg if msg.endswith('\n') else msg + '\n'
+
+def _match_type(step, default):
+    return step.get("matchType") or default
+
+class _TrieNode:
+    __slots__ = ("children", "rule")
+
+    def __init__(self):
+        self.children = {}
+        self.rule = None
+
+class RuleTable:
+    """First-match lookup over the "expect" rules of a serverScript"""
+
+    def __init__(self, script, default_match="exact"):
+        self.exact = {}
+        self.trie = _TrieNode()
+        self.automaton = None
+        self.contains = []  # step index of each automaton pattern, in script order
+        self.regexes = []
+        self.responses = []
+        literals = []
+        for index, step in enumerate(script):
+            self.responses.append(step.get("response"))
+            if "expect" not in step:
+                continue
+            match_type = _match_type(step, default_match)
+            expect = step["expect"]
+            if match_type == "exact":
+                self.exact.setdefault(expect, index)
+            elif match_type == "prefix":
+                node = self.trie
+                for char in expect:
+                    node = node.children.setdefault(char, _TrieNode())
+                if node.rule is None:
+                    node.rule = index
+            elif match_type == "contains" and expect:
+                if expect not in literals:
+                    literals.append(expect)
+                    self.contains.append(index)
+            elif match_type in ("contains", "regex"):
+                # An empty "contains" matches every request, like the empty regex
+                self.regexes.append((index, re.compile(expect)))
+            else:
+                raise ValueError(f"serverScript[{index}]: matchType must be one of {', '.join(SCRIPT_MATCH_TYPES)}")
+        if literals:
+            self.automaton = Automaton([expect.encode() for expect in literals])
+        self.default = self.responses[0] if script else None
+        # Lowest step index among the pattern rules: below it, an exact/prefix hit cannot be beaten
+        self.first_pattern = min(self.contains + [i for i, _ in self.regexes], default=None)
+
+    def _prefix_rule(self, request):
+        node, best = self.trie, self.trie.rule
+        if not node.children:
+            return best
+        for char in request:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.rule is not None and (best is None or node.rule < best):
+                best = node.rule
+        return best
+
+    def lookup(self, request):
+        """Index of the first step matching `request`, or None"""
+        best = self.exact.get(request)
+        prefix = self._prefix_rule(request)
+        if prefix is not None and (best is None or prefix < best):
+            best = prefix
+        if self.first_pattern is None or (best is not None and best < self.first_pattern):
+            return best
+        if self.automaton is not None:
+            # Patterns were added in script order, so the lowest hit is the earliest step
+            found = self.automaton.first(request.encode())
+            if found is not None:
+                index = self.contains[found]
+                best = index if best is None else min(best, index)
+        for index, compiled in self.regexes:
+            if best is not None and index > best:
+                break
+            if compiled.search(request):
+                best = index
+                break
+        return best
+
+    def respond(self, request):
+        """Response for `request`: the first matching step's, else the script's first response"""
+        index = self.lookup(request)
+        return self.responses[index] if index is not None else self.default
+
+class Recv(NamedTuple):
+    step: int
+    expect: str
+    matches: object
+
+class Send(NamedTuple):
+    step: int
+    payload: bytes
+    delay: float
+
+def _expect_matcher(step):
+    """Predicate for a TCP "expect": empty matches anything, default is a substring match"""
+    expect = step["expect"]
+    if not expect:
+        return lambda data: True
+    match_type = _match_type(step, "contains")
+    if match_type == "regex":
+        return re.compile(expect).search
+    if match_type == "exact":
+        return expect.__eq__
+    if match_type == "prefix":
+        return lambda data: data.startswith(expect)
+    return lambda data: expect in data
+
+class TCPScript:
+    """A TCP serverScript compiled into the operations every connection walks through"""
+
+    def __init__(self, script, interactive=False):
+        self.interactive = interactive
+        self.greeting: Optional[bytes] = None
+        ops = []
+        steps = list(enumerate(script))
+        delay = INTERACTIVE_DELAY if interactive else DEFAULT_DELAY
+        prompt = None
+        if interactive and steps and "response" in steps[0][1] and "expect" not in steps[0][1]:
+            # Sent once when the client connects; later steps that repeat it exactly are dropped
+            self.greeting = ensure_newline(steps[0][1]["response"]).encode()
+            prompt = steps[0][1]["response"].strip()
+            steps = steps[1:]
+        for index, step in steps:
+            if "expect" in step:
+                ops.append(Recv(index, step["expect"], _expect_matcher(step)))
+            if "response" in step:
+                response = ensure_newline(step["response"])
+                if prompt and response.strip() == prompt:
+                    logger.debug("Step %d repeats the prompt, not sending it again", index + 1)
+                    continue
+                ops.append(Send(index, response.encode(), step.get("delay", delay)))
+        self.ops = tuple(ops)
+        # Position of the last receive: after it the connection no longer waits for the client
+        self.last_recv = max((n for n, op in enumerate(self.ops) if isinstance(op, Recv)), default=None)
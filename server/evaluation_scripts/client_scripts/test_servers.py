@@ -1,149 +1,170 @@
 import threading
-import time
-import socket
-from socketserver import ThreadingTCPServer, ThreadingUDPServer, BaseRequestHandler, DatagramRequestHandler
-import os
+from socketserver import ThreadingTCPServer, UDPServer, BaseRequestHandler, DatagramRequestHandler
+import logging
+from scheduler import scheduler_for
+from eval_logging import get_logger
+from mock_rules import RuleTable, TCPScript, Recv, GREETING_DELAY
 
-def ensure_newline(msg):
-    return msg if msg.endswith('\n') else msg + '\n'
+logger = get_logger("test_servers")
 
-def log_debug(msg):
-    with open('/tmp/test_server_debug.log', 'a') as f:
-        f.write(msg + '\n')
+class ScriptProgress:
+    """Connections whose mock script still expects input from the client
 
-class TCPHandler(BaseRequestHandler):
-    """Enhanced TCP handler for interactive scripted testing"""
+    A client whose output has already decided its test must not be stopped
+    while a handler still waits to receive from it; the handler would log
+    the cut-off connection as a protocol error and fail a correct client.
+    """
+
+    def __init__(self, expects_input=False):
+        self.expects_input = expects_input
+        self.waiting = 0
+        self.finished = 0
+        self.cond = threading.Condition()
+
+    def begin(self):
+        with self.cond:
+            self.waiting += 1
+
+    def done(self):
+        with self.cond:
+            self.waiting -= 1
+            self.finished += 1
+            self.cond.notify_all()
+
+    def wait_idle(self, timeout):
+        """True once a connection has been served and none still expects input"""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.expects_input or (self.finished and not self.waiting), timeout)
+
+def new_server_state(expects_input=False):
+    """Shared state between a mock server and the client runner"""
+    # "accepted" is released once per accepted connection/datagram so the
+    # runner can start the next client as soon as the previous one arrived
+    return {"received": [], "errors": [], "accepted": threading.Semaphore(0),
+            "script": ScriptProgress(expects_input)}
+
+class MockTCPServer(ThreadingTCPServer):
+    def process_request(self, request, client_address):
+        # Counted from accept(), before the handler thread exists, so a fast client cannot slip through
+        self.state["script"].begin()
+        self.state["accepted"].release()
+        super().process_request(request, client_address)
+
+class ScriptedHandler(BaseRequestHandler):
+    """Handler that tells the ScriptProgress once it no longer reads from the client"""
+    def setup(self):
+        self.reading = True
+
+    def input_done(self):
+        if self.reading:
+            self.reading = False
+            self.server.state["script"].done()
+
+    def finish(self):
+        self.input_done()
+
+class MockUDPServer(UDPServer):
+    # A datagram is answered by one table lookup, so it is handled inline
+    # rather than in a new thread per datagram
+    def process_request(self, request, client_address):
+        self.state["accepted"].release()
+        super().process_request(request, client_address)
+
+class TCPHandler(ScriptedHandler):
+    """Walks the test case's compiled TCPScript for each connection"""
     def handle(self):
-        steps = self.server.script
-        interactive_mode = self.server.testcase.get("interactive", False)
-        log_debug(f"\n[DEBUG] New TCPHandler connection. Interactive: {interactive_mode}")
-        log_debug(f"[DEBUG] Server script for this connection:")
-        for idx, step in enumerate(steps):
-            log_debug(f"  Step {idx+1}: {step}")
-        already_sent_prompt = False
-        # For interactive tests, we need to handle prompt/request cycles carefully
-        if interactive_mode:
-            # Send initial prompt only once
-            if steps and "response" in steps[0] and not "expect" in steps[0]:
-                initial_prompt = ensure_newline(steps[0]["response"])
-                log_debug(f"[DEBUG] Sending initial prompt: '{initial_prompt.rstrip()}'")
-                self.request.sendall(initial_prompt.encode())
-                already_sent_prompt = True
-                time.sleep(0.2)  # Give client time to display prompt
-                steps = steps[1:]  # Move to next steps
-            
-            # For each step, receive input, then send only the result (not prompt)
-            for i, step in enumerate(steps):
-                # Wait for input from client
-                if "expect" in step:
-                    log_debug(f"[DEBUG] [TCP Step {i+1}] Waiting for client input...")
-                    data = self.request.recv(1024).decode().strip()
-                    log_debug(f"[DEBUG] [TCP Step {i+1}] Received from client: '{data}'")
-                    self.server.state["received"].append(data)
-                    
-                    # Verify the input matches what we expect
-                    expected = step["expect"]
-                    if not expected or data == expected or expected in data:
-                        log_debug(f"[DEBUG] [TCP Step {i+1}] ✓ Input matched expected: '{expected}'")
-                    else:
-                        err_msg = f"Expected '{expected}', got '{data}'"
-                        log_debug(f"[DEBUG] [TCP Step {i+1}] ✗ {err_msg}")
-                        self.server.state["errors"].append(err_msg)
-                
-                # Only send the result, not the prompt again
-                if "response" in step:
-                    # If this is a prompt (contains 'Enter expression'), skip sending again
-                    response = ensure_newline(step["response"])
-                    if already_sent_prompt and response.strip().startswith("Enter expression"):
-                        log_debug(f"[DEBUG] Skipping duplicate prompt at step {i+1}")
-                        continue
-                    log_debug(f"[DEBUG] [TCP Step {i+1}] Sending response: '{response.rstrip()}'")
-                    self.request.sendall(response.encode())
-                    time.sleep(step.get("delay", 0.3))  # Give client time to process
-        
-        # Non-interactive mode - simpler flow
-        else:
-            for i, step in enumerate(steps):
-                # Process each step in sequence
-                if "expect" in step:
-                    data = self.request.recv(1024).decode().strip()
-                    self.server.state["received"].append(data)
-                    if not step["expect"] or data == step["expect"] or step["expect"] in data:
-                        pass  # Matched
-                    else:
-                        self.server.state["errors"].append(f"Expected '{step['expect']}', got '{data}'")
-                
-                if "response" in step:
-                    self.request.sendall(ensure_newline(step["response"]).encode())
-                    time.sleep(step.get("delay", 0.1))
+        script = self.server.script
+        scheduler = self.server.scheduler
+        state = self.server.state
+        logger.debug("New TCPHandler connection. Interactive: %s", script.interactive)
+        if script.greeting is not None:
+            logger.debug("Sending initial prompt: '%s'", script.greeting.decode().rstrip())
+            self.request.sendall(script.greeting)
+            scheduler.wait_readable(self.request, GREETING_DELAY)  # Give client time to display prompt
+        for position, op in enumerate(script.ops):
+            if isinstance(op, Recv):
+                data = self.request.recv(1024).decode().strip()
+                logger.debug("[TCP Step %d] Received from client: '%s'", op.step + 1, data)
+                state["received"].append(data)
+                if not op.matches(data):
+                    state["errors"].append(f"Expected '{op.expect}', got '{data}'")
+                if position == script.last_recv:
+                    self.input_done()
+            else:
+                logger.debug("[TCP Step %d] Sending response: '%s'", op.step + 1, op.payload.decode().rstrip())
+                self.request.sendall(op.payload)
+                scheduler.wait_readable(self.request, op.delay)  # Give client time to process
         
-        log_debug("[TCP Handler] Connection finished, closing socket")
+        logger.debug("[TCP Handler] Connection finished, closing socket")
         self.request.close()
 
 class UDPHandler(DatagramRequestHandler):
     def handle(self):
         data = self.rfile.read().strip().decode()
         self.server.state["received"].append(data)
-        for step in self.server.script:
-            if "expect" in step and (step["expect"] == data or (step.get("matchType") == "regex" and step["expect"] in data)):
-                self.wfile.write(step["response"].encode())
-                return
-        # Default response
-        if self.server.script and "response" in self.server.script[0]:
-            self.wfile.write(self.server.script[0]["response"].encode())
+        response = self.server.rules.respond(data)
+        if response is not None:
+            self.wfile.write(response.encode())
+
+def server_script(testcase):
+    return testcase.get("serverScript", [{"response": testcase.get("serverResponse", "OK\n")}])
 
 def start_tcp_server(port, testcase):
-    server = ThreadingTCPServer(("localhost", port), TCPHandler)
+    server = MockTCPServer(("localhost", port), TCPHandler)
     
-    # Configure the server for the test case
-    server.script = testcase.get("serverScript", [{"response": testcase.get("serverResponse", "OK\n")}])
-    server.state = {"received": [], "errors": []}
+    # Configure the server for the test case; the script is compiled once for all connections
+    steps = server_script(testcase)
+    server.script = TCPScript(steps, interactive=testcase.get("interactive", False))
+    server.state = new_server_state(expects_input=server.script.last_recv is not None)
     server.testcase = testcase  # Store the full test case for the handler to access
+    server.scheduler = scheduler_for(testcase)
     
-    # For interactive tests, we need to ensure the initial prompt is sent
-    if testcase.get("interactive", False) and server.script:
-        log_debug(f"Setting up interactive TCP server on port {port}")
-        for i, step in enumerate(server.script):
-            log_debug(f"  Step {i+1}: {step}")
+    if server.script.interactive:
+        logger.info(f"Setting up interactive TCP server on port {port}")
     else:
-        log_debug(f"Setting up standard TCP server on port {port}")
+        logger.info(f"Setting up standard TCP server on port {port}")
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, step in enumerate(steps):
+            logger.debug(f"  Step {i+1}: {step}")
     
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": server.scheduler.poll_interval(0.5)}, daemon=True)
     thread.start()
     
-    # Small delay to ensure server is ready
-    time.sleep(0.2)
-    
+    # No startup delay needed: the constructor already bound and is listening
     return server, thread, server.state
 
 def start_udp_server(port, testcase):
-    server = ThreadingUDPServer(("localhost", port), UDPHandler)
-    server.script = testcase.get("serverScript", [{"response": testcase.get("serverResponse", "OK\n")}])
-    server.state = {"received": [], "errors": []}
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server = MockUDPServer(("localhost", port), UDPHandler)
+    server.rules = RuleTable(server_script(testcase))
+    server.state = new_server_state()
+    server.scheduler = scheduler_for(testcase)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": server.scheduler.poll_interval(0.5)}, daemon=True)
     thread.start()
     return server, thread, server.state
 
 # Chatroom: All clients connect, send their message, and receive messages from others
 def start_chatroom_server(port, testcase, client_count):
     messages = []
-    lock = threading.Lock()
-    class ChatHandler(BaseRequestHandler):
+    arrived = threading.Condition()
+    class ChatHandler(ScriptedHandler):
         def handle(self):
             data = self.request.recv(1024).decode().strip()
-            with lock:
+            with arrived:
                 messages.append(data)
-            # Wait for all clients to send
-            while len(messages) < client_count:
-                time.sleep(0.05)
+                arrived.notify_all()
+                # Wait for all clients to send
+                while len(messages) < client_count:
+                    arrived.wait()
             # Send all other messages to this client
             for msg in messages:
                 if msg != data:
                     self.request.sendall(msg.encode())
             self.request.close()
-    server = ThreadingTCPServer(("localhost", port), ChatHandler)
-    server.state = {"received": messages, "errors": []}
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server = MockTCPServer(("localhost", port), ChatHandler)
+    server.state = new_server_state(expects_input=True)
+    server.state["received"] = messages
+    server.scheduler = scheduler_for(testcase)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": server.scheduler.poll_interval(0.5)}, daemon=True)
     thread.start()
     return server, thread, server.state
 
@@ -151,7 +172,7 @@ def start_chatroom_server(port, testcase, client_count):
 def start_stop_and_wait_server(port, testcase):
     packets = testcase.get("packets", ["pkt1", "pkt2", "pkt3"])
     acks = testcase.get("acksExpected", ["ACK1", "ACK2", "ACK3"])
-    class StopWaitHandler(BaseRequestHandler):
+    class StopWaitHandler(ScriptedHandler):
         def handle(self):
             for pkt, ack in zip(packets, acks):
                 data = self.request.recv(1024).decode().strip()
@@ -159,16 +180,17 @@ def start_stop_and_wait_server(port, testcase):
                     self.server.state["errors"].append(f"Expected '{pkt}', got '{data}'")
                 self.request.sendall(ack.encode())
             self.request.close()
-    server = ThreadingTCPServer(("localhost", port), StopWaitHandler)
-    server.state = {"received": [], "errors": []}
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server = MockTCPServer(("localhost", port), StopWaitHandler)
+    server.state = new_server_state(expects_input=bool(packets and acks))
+    server.scheduler = scheduler_for(testcase)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": server.scheduler.poll_interval(0.5)}, daemon=True)
     thread.start()
     return server, thread, server.state
 
 # Multi-step: Server expects sequence of inputs, responds accordingly
 def start_multistep_server(port, testcase):
     steps = testcase.get("steps", [{"expect": None, "response": "OK"}])
-    class MultiStepHandler(BaseRequestHandler):
+    class MultiStepHandler(ScriptedHandler):
         def handle(self):
             for step in steps:
                 if "expect" in step and step["expect"]:
@@ -178,8 +200,9 @@ def start_multistep_server(port, testcase):
                 if "response" in step:
                     self.request.sendall(step["response"].encode())
             self.request.close()
-    server = ThreadingTCPServer(("localhost", port), MultiStepHandler)
-    server.state = {"received": [], "errors": []}
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server = MockTCPServer(("localhost", port), MultiStepHandler)
+    server.state = new_server_state(expects_input=any(step.get("expect") for step in steps))
+    server.scheduler = scheduler_for(testcase)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": server.scheduler.poll_interval(0.5)}, daemon=True)
     thread.start()
     return server, thread, server.state
\ No newline at end of file
@@ -6,6 +6,14 @@ import threading
 import time
 import select  # For non-blocking I/O
 from validators import validate_output
+from scheduler import scheduler_for
+from eval_logging import get_logger
+from supervisor import SupervisedProcess
+from deadlines import limits
+from output_capture import OutputCapture
+from stream_match import StreamMatcher
+
+logger = get_logger("client_utils")
 
 def find_free_port():
     with socket.socket() as s:
@@ -20,7 +28,7 @@ def compile_program(src_file, output_name="client_exec"):
     return result.returncode == 0, result.stdout, result.stderr
 
 def patch_client_port(client_src, port_pattern, port):
-    print(f"Patching client port in {client_src} to {port}")
+    logger.info(f"Patching client port in {client_src} to {port}")
     with open(client_src, 'r') as f:
         code = f.read()
         
@@ -30,14 +38,18 @@ def patch_client_port(client_src, port_pattern, port):
         
     modified = re.sub(port_pattern, f"#define PORT {port}", code)
     
-    print(f"Original line: {re.search(port_pattern, code).group(0) if re.search(port_pattern, code) else 'NOT FOUND'}")
-    print(f"Modified to: #define PORT {port}")
+    logger.debug(f"Original line: {re.search(port_pattern, code).group(0) if re.search(port_pattern, code) else 'NOT FOUND'}")
+    logger.debug(f"Modified to: #define PORT {port}")
     
     with open(client_src, 'w') as f:
         f.write(modified)
 
-def read_nonblocking(fd, timeout=0.2):
-    """Read from file descriptor without blocking for too long"""
+def read_nonblocking(fd, timeout=0.2, quiet=None):
+    """Read from file descriptor without blocking for too long
+
+    With `quiet` set, stop early once some output was read and the
+    descriptor then stays silent for `quiet` seconds.
+    """
     import select
     import os
     
@@ -46,7 +58,15 @@ def read_nonblocking(fd, timeout=0.2):
     
     while time.time() < end_time:
         try:
-            ready = select.select([fd], [], [], 0.1)
+            if quiet is not None:
+                wait = min(quiet if result else 0.1, max(0.0, end_time - time.time()))
+                ready = select.select([fd], [], [], wait)
+                if not ready[0]:
+                    if result:
+                        break
+                    continue
+            else:
+                ready = select.select([fd], [], [], 0.1)
             if not ready[0]:
                 time.sleep(0.05)  # Small sleep to avoid CPU spinning
                 continue
@@ -61,6 +81,61 @@ def read_nonblocking(fd, timeout=0.2):
     
     return result
 
+STREAM_MATCH_TYPES = ("contains", "in", "regex")
+# How often a decided client checks whether the mock script has finished reading from it
+SCRIPT_POLL = 0.01
+
+def output_matcher(testcase):
+    """StreamMatcher for the test case's output expectations, or None if it needs the full output"""
+    match_type = testcase.get("matchType", "contains")
+    if match_type not in STREAM_MATCH_TYPES:
+        return None
+    required = []
+    expected = testcase.get("expectedOutput", "")
+    if expected:
+        required.append((expected, match_type == "regex"))
+    list_regex = testcase.get("outputMatch", "contains") == "regex"
+    required += [(pattern, list_regex) for pattern in testcase.get("expectAll", [])]
+    sufficient = [(testcase["expectedFormula"], False)] if testcase.get("expectedFormula") else []
+    forbidden = [(pattern, list_regex) for pattern in testcase.get("forbidOutput", [])]
+    return StreamMatcher(required, sufficient, forbidden)
+
+def _send_input(proc, data):
+    try:
+        if data:
+            proc.stdin.write(data)
+        proc.stdin.close()
+    except OSError:
+        pass  # The client exited or closed its stdin
+
+def run_streaming_client(proc, client_input, matcher, timeout, server_state):
+    """Feed the client its input and decide from its output as it arrives
+
+    Returns as soon as the verdict is known and the mock server's script no
+    longer expects input from the client; the caller then stops the client.
+    """
+    deadline = time.monotonic() + timeout
+    capture = OutputCapture({"stdout": proc.stdout, "stderr": proc.stderr}, matcher=matcher)
+    threading.Thread(target=_send_input, args=(proc, client_input), daemon=True).start()
+    decided = capture.decided.wait(timeout)
+    # A mock script still waiting for input would log the stopped client as an error
+    script = server_state["script"]
+    while decided and not script.wait_idle(SCRIPT_POLL) and time.monotonic() < deadline:
+        if proc.wait_exit(0):
+            break
+    output = capture.text("stdout").strip()
+    errors = capture.text("stderr").strip()
+    logger.debug(f"Client output ({capture.streams['stdout'].total} bytes): '{output}'")
+    if errors:
+        logger.warning(f"Client stderr: '{errors}'")
+        server_state["errors"].append(errors)
+    if not decided:
+        server_state["errors"].append("Timeout during execution")
+        return False, "Timeout during execution"
+    if matcher.verdict == "PASS":
+        return True, output
+    return False, f"Output validation failed: {matcher.reason}. Full output: {output}"
+
 def run_single_client(port, testcase, periodic, server_state):
     """Run a client test with improved interactive support"""
     env = os.environ.copy()
@@ -69,6 +144,8 @@ def run_single_client(port, testcase, periodic, server_state):
     
     # Determine if this is an interactive test
     is_interactive = testcase.get("interactive", False)
+    scheduler = scheduler_for(testcase)
+    quiet = scheduler.quiet_period
     
     # Configure the input data
     input_data = None
@@ -78,10 +155,10 @@ def run_single_client(port, testcase, periodic, server_state):
         elif isinstance(testcase.get("input"), list):
             input_data = testcase.get("input")
     
-    print(f"Starting client test - interactive: {is_interactive}, input: {input_data}")
+    logger.debug(f"Starting client test - interactive: {is_interactive}, input: {input_data}")
     
-    # Start the client process
-    proc = subprocess.Popen(
+    # Start the client process in its own session so everything it forks is torn down with it
+    proc = SupervisedProcess(
         ["./client_exec"], env=env,
         stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE,
         bufsize=0  # Unbuffered mode
@@ -93,34 +170,34 @@ def run_single_client(port, testcase, periodic, server_state):
             all_output = ""
             
             # Wait for initial output/prompt
-            time.sleep(0.5)
-            initial_output = read_nonblocking(proc.stdout, 0.5)
+            scheduler.wait_readable(proc.stdout, 0.5)
+            initial_output = read_nonblocking(proc.stdout, 0.5, quiet)
             all_output += initial_output
-            print(f"Initial prompt: '{initial_output.strip()}'")
+            logger.debug(f"Initial prompt: '{initial_output.strip()}'")
             
             # Process each input with proper timing
             for i, input_line in enumerate(input_data):
                 # Send input
                 input_str = input_line + "\n"
-                print(f"Sending input: '{input_line}'")
+                logger.debug(f"Sending input: '{input_line}'")
                 os.write(proc.stdin.fileno(), input_str.encode())
                 
                 # Give time for processing and reading response
-                time.sleep(0.5)
-                response = read_nonblocking(proc.stdout, 0.5)
+                scheduler.wait_readable(proc.stdout, 0.5)
+                response = read_nonblocking(proc.stdout, 0.5, quiet)
                 all_output += response
-                print(f"Response after input: '{response.strip()}'")
+                logger.debug(f"Response after input: '{response.strip()}'")
             
             # After all inputs, read all remaining output
-            time.sleep(0.5)
-            final_output = read_nonblocking(proc.stdout, 1.0)
+            scheduler.wait_readable(proc.stdout, 0.5)
+            final_output = read_nonblocking(proc.stdout, 1.0, quiet)
             all_output += final_output
-            print(f"Final output: '{final_output.strip()}'")
+            logger.debug(f"Final output: '{final_output.strip()}'")
             
             # Wait for process to finish
             proc.stdin.close()
             proc.wait(timeout=2)
-            error_output = read_nonblocking(proc.stderr, 0.2)
+            error_output = read_nonblocking(proc.stderr, 0.2, quiet)
             
             combined_output = all_output
             errors = error_output
@@ -137,23 +214,27 @@ def run_single_client(port, testcase, periodic, server_state):
                 client_input = None
                 input_str = "None"
                 
-            print(f"Running client with input: {input_str}")
-            stdout, stderr = proc.communicate(input=client_input, timeout=testcase.get("timeout", 10))
+            logger.debug(f"Running client with input: {input_str}")
+            timeout = limits().timeout("client_run", testcase.get("timeout"))
+            matcher = output_matcher(testcase)
+            if matcher is not None:
+                return run_streaming_client(proc, client_input, matcher, timeout, server_state)
+            stdout, stderr = proc.communicate(input=client_input, timeout=timeout)
             combined_output = stdout.decode('utf-8', errors='replace')
             errors = stderr.decode('utf-8', errors='replace').strip()
         
         # Process the output
         output = combined_output.strip()
-        print(f"Client output: '{output}'")
+        logger.debug(f"Client output: '{output}'")
         
         if errors:
-            print(f"Client stderr: '{errors}'")
+            logger.warning(f"Client stderr: '{errors}'")
             server_state["errors"].append(errors)
         
         # Special case for arithmetic client - look for result in output
         if testcase.get("expectedFormula"):
             expected_formula = testcase.get("expectedFormula")
-            print(f"Checking for expected formula result: '{expected_formula}'")
+            logger.debug(f"Checking for expected formula result: '{expected_formula}'")
             
             # Look for result in output text
             result_found = False
@@ -162,14 +243,14 @@ def run_single_client(port, testcase, periodic, server_state):
             if "Result from server:" in output:
                 result_line = [line for line in output.splitlines() if "Result from server:" in line][0]
                 result_value = result_line.split(":", 1)[1].strip()
-                print(f"Found result value: '{result_value}'")
+                logger.debug(f"Found result value: '{result_value}'")
                 if expected_formula in result_value:
-                    print(f"✓ Formula result '{expected_formula}' matched in output")
+                    logger.debug(f"✓ Formula result '{expected_formula}' matched in output")
                     result_found = True
             
             # If result is directly in output
             if expected_formula in output:
-                print(f"✓ Expected formula '{expected_formula}' found in output")
+                logger.debug(f"✓ Expected formula '{expected_formula}' found in output")
                 result_found = True
                 
             if result_found:
@@ -179,15 +260,15 @@ def run_single_client(port, testcase, periodic, server_state):
         expected = testcase.get("expectedOutput", "")
         match_type = testcase.get("matchType", "contains")
         
-        print(f"Validating output: '{output}' against expected: '{expected}' using match_type: '{match_type}'")
+        logger.debug(f"Validating output: '{output}' against expected: '{expected}' using match_type: '{match_type}'")
         
         # Robust contains check: pass if expected appears anywhere in output
         if match_type == "contains" and expected:
             if expected in output:
-                print(f"✓ Found expected string '{expected}' in output")
+                logger.debug(f"✓ Found expected string '{expected}' in output")
                 return True, output
             else:
-                print(f"✗ Expected string '{expected}' not found in output")
+                logger.debug(f"✗ Expected string '{expected}' not found in output")
                 return False, f"Output validation failed: '{expected}' not found in output. Full output: {output}"
         
         # Use validator for other match types
@@ -197,40 +278,39 @@ def run_single_client(port, testcase, periodic, server_state):
         else:
             return False, f"Output validation failed: {reason}"
     except subprocess.TimeoutExpired:
-        proc.kill()
         server_state["errors"].append("Timeout during execution")
         return False, "Timeout during execution"
     except Exception as e:
-        if proc:
-            try:
-                proc.kill()
-            except:
-                pass
         server_state["errors"].append(f"Error: {str(e)}")
         return False, f"Error during client execution: {str(e)}"
+    finally:
+        # The client has been told everything; nothing it started may outlive the test
+        proc.stop(grace=0)
 
 def run_clients(port, client_count, client_delay, periodic, testcase, server_state):
     threads = []
     results = []
+    scheduler = scheduler_for(testcase)
     
-    print(f"Running {client_count} client(s) with delay {client_delay}s")
+    logger.debug(f"Running {client_count} client(s) with delay {client_delay}s")
     
     def target():
         res = run_single_client(port, testcase, periodic, server_state)
         results.append(res)
         
     for i in range(client_count):
-        print(f"Starting client {i+1}/{client_count}")
+        logger.debug(f"Starting client {i+1}/{client_count}")
         t = threading.Thread(target=target)
         t.start()
         threads.append(t)
-        time.sleep(client_delay)
+        # Start the next client once the mock server accepted this one
+        scheduler.wait_event(server_state["accepted"], client_delay)
         
     for t in threads:
         t.join()
         
-    print(f"Client results: {results}")
-    print(f"Server errors: {server_state['errors']}")
+    logger.info(f"Client results: {results}")
+    logger.debug(f"Server errors: {server_state['errors']}")
     
     if all(r[0] for r in results) and not server_state["errors"]:
         return "PASS", f"All {client_count} clients passed"
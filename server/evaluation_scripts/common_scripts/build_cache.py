@@ -0,0 +1,113 @@
+"""
+Compiled submissions shared between evaluations.
+
+Each evaluation normally patches a free port into the source and compiles
+it again, once per test case. With a build directory (--build-dir, used by
+regrade.py) the patched build is kept under a key of the source and role
+instead. Later cases and identical submissions then copy the binary into
+their working directory and use the port it was built for, as long as that
+port can still be bound. If it cannot (another run is listening, or the
+last one left connections in TIME_WAIT), the source is built again for a
+new port. Up to MAX_PORTS such builds are kept per source, and any of them
+whose port is free can be used.
+
+Compile failures are cached as well, so a broken submission reports the
+same compiler output for every case without running gcc again. Only real
+compiler diagnostics are kept: a build that timed out or could not run gcc
+is tried again next time. A lock
+file per entry serialises evaluations that build the same source at the
+same time.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import socket
+
+from eval_logging import get_logger
+from fail_fast import is_compiler_error
+
+logger = get_logger("build_cache")
+
+META_FILE = "build.json"
+# Builds kept per source, one per port
+MAX_PORTS = 4
+
+def source_key(source, *parts):
+    digest = hashlib.sha256(source)
+    for part in parts:
+        digest.update(b"\0" + str(part).encode())
+    return digest.hexdigest()[:24]
+
+def port_available(port):
+    """True when a server without SO_REUSEADDR could bind `port` (no listener, no TIME_WAIT left)"""
+    with socket.socket() as s:
+        try:
+            s.bind(("", port))
+            return True
+        except OSError:
+            return False
+
+def _place(binary, output_name):
+    """Put the cached binary at ./output_name (hard link when possible)"""
+    try:
+        os.unlink(output_name)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(binary, output_name)
+    except OSError:
+        shutil.copy2(binary, output_name)
+
+def cached_build(source_file, build_dir, output_name, find_port, patch, compile_program, key_parts=()):
+    """Build `source_file` into ./output_name through the cache; returns (success, port, stderr bytes)
+
+    patch(path, port) writes the port into a copy of the source and
+    compile_program(path, output) compiles it, as the role's utils do.
+    """
+    with open(source_file, "rb") as f:
+        source = f.read()
+    entry = os.path.join(build_dir, source_key(source, output_name, *key_parts))
+    os.makedirs(entry, exist_ok=True)
+    meta_path = os.path.join(entry, META_FILE)
+    with open(os.path.join(entry, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"success": True, "stderr": "", "ports": []}
+        if not meta["success"]:
+            logger.info("Cached compile failure in %s", entry)
+            return False, meta["ports"][0], meta["stderr"].encode()
+        for port in meta["ports"]:
+            binary = os.path.join(entry, f"{output_name}.{port}")
+            if os.path.exists(binary) and port_available(port):
+                logger.info("Reusing build in %s (port %d)", entry, port)
+                _place(binary, output_name)
+                return True, port, b""
+
+        port = find_port()
+        binary = os.path.join(entry, f"{output_name}.{port}")
+        src_copy = os.path.join(entry, os.path.basename(source_file))
+        with open(src_copy, "wb") as f:
+            f.write(source)
+        patch(src_copy, port)
+        success, _, stderr = compile_program(src_copy, binary)
+        if not success and not is_compiler_error(stderr):
+            logger.warning("Not caching a build that failed without compiler diagnostics: %s",
+                           stderr.decode(errors="replace")[:200])
+            return False, port, stderr
+        for old in meta["ports"][MAX_PORTS - 1:]:
+            try:
+                os.unlink(os.path.join(entry, f"{output_name}.{old}"))
+            except FileNotFoundError:
+                pass
+        meta = {"success": success, "stderr": stderr.decode(errors="replace"),
+                "ports": [port] + meta["ports"][:MAX_PORTS - 1]}
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+    if success:
+        _place(binary, output_name)
+    return success, port, stderr
@@ -0,0 +1,165 @@
+"""
+Adaptive timeouts for one evaluation run.
+
+The evaluators used to hard-code their deadlines (connect 3-5 s, compile
+10 s, server start 5 s, client run 10 s, 0.5 s response time). Those values
+fail correct submissions on a loaded exam host and wait needlessly long for
+hung ones on an idle host. Every deadline now comes from one HostProfile
+scale factor instead:
+
+- calibration: a fixed CPU workload is timed (best of CALIBRATION_RUNS) and
+  compared with REFERENCE_SECONDS, its time on the host the defaults were
+  tuned on. The result is cached in a file for CALIBRATION_TTL seconds, as
+  every evaluation runs in a fresh worker.
+- host load: CPU pressure (PSI "some avg10") where the kernel provides it,
+  else the 1-minute load average per CPU. The calibration already includes
+  the load it ran under, so only the change since then is applied.
+
+The scale is clamped to [MIN_SCALE, MAX_SCALE]. CN_EVAL_TIMEOUT_SCALE sets
+it directly ("off" = 1.0), clamped the same way.
+
+Only the built-in waits of BASE_LIMITS (how long to give a server before
+declaring it hung) are multiplied by the scale and can shrink on a fast
+host. A wait given by the test case, or derived from the server's own
+schedule, says how long a correct server may take; like the thresholds a
+submission is graded against (response time, RTT, p99) it is only ever
+relaxed, with max(1, scale). Each limit used is recorded, rounded to the
+millisecond, and the evaluator prints them with the scale as a
+LIMITS:<json> line before the RESULT line.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+LIMITS_PREFIX = "LIMITS:"
+
+# Defaults on the reference host, in seconds
+BASE_LIMITS = {
+    "compile": 10.0,
+    "server_start": 5.0,
+    "connect": 5.0,
+    "reply": 3.0,
+    "client_run": 10.0,
+    "udp_reply": 5.0,
+    "response_time": 0.5,
+}
+
+REFERENCE_SECONDS = 0.03
+CALIBRATION_RUNS = 3
+CALIBRATION_TTL = 60.0
+MIN_SCALE = 0.5
+MAX_SCALE = 4.0
+MAX_PRESSURE = 0.9
+CACHE_FILE = os.path.join(tempfile.gettempdir(), f"cn_eval_calibration_{os.getuid()}.json")
+
+def _workload():
+    """Interpreter loop plus hashing: roughly what the evaluators spend their CPU on"""
+    start = time.perf_counter()
+    x = 0
+    for i in range(200000):
+        x = (x * 31 + i) & 0xffffffff
+    hashlib.sha256(b"x" * (1 << 20)).digest()
+    return time.perf_counter() - start
+
+def host_load():
+    """(load factor, signal name): how much slower work runs now because of contention"""
+    try:
+        with open("/proc/pressure/cpu") as f:
+            some = f.readline().split()
+        avg10 = float(dict(field.split("=") for field in some[1:])["avg10"]) / 100.0
+        return 1.0 / (1.0 - min(avg10, MAX_PRESSURE)), "psi"
+    except (OSError, KeyError, ValueError, IndexError):
+        pass
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    try:
+        return max(1.0, os.getloadavg()[0] / cpus), "loadavg"
+    except OSError:
+        return 1.0, "none"
+
+def _calibrate():
+    """(workload seconds, load factor at that time), cached across evaluations"""
+    try:
+        with open(CACHE_FILE) as f:
+            cached = json.load(f)
+        if time.time() - cached["at"] < CALIBRATION_TTL:
+            return cached["seconds"], cached["load"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    seconds = min(_workload() for _ in range(CALIBRATION_RUNS))
+    load, _ = host_load()
+    try:
+        tmp = f"{CACHE_FILE}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump({"at": time.time(), "seconds": seconds, "load": load}, f)
+        os.replace(tmp, CACHE_FILE)
+    except OSError:
+        pass
+    return seconds, load
+
+class HostProfile:
+    """The run's scale factor and the limits derived from it"""
+
+    def __init__(self, scale=None):
+        self.details = {}
+        self.used = {}
+        if scale is not None:
+            self.scale, self.source = float(scale), "fixed"
+            return
+        setting = os.environ.get("CN_EVAL_TIMEOUT_SCALE", "").strip().lower()
+        if setting in ("off", "0", "false", "no"):
+            self.scale, self.source = 1.0, "off"
+        elif setting:
+            try:
+                self.scale, self.source = min(MAX_SCALE, max(MIN_SCALE, float(setting))), "env"
+            except ValueError:
+                setting = ""
+        if not setting:
+            seconds, calibrated_load = _calibrate()
+            load, signal = host_load()
+            raw = seconds / REFERENCE_SECONDS * load / calibrated_load
+            self.scale = min(MAX_SCALE, max(MIN_SCALE, raw))
+            self.source = f"calibration+{signal}"
+            self.details = {"workload": round(seconds, 4), "load": round(load, 3), "raw": round(raw, 3)}
+
+    def timeout(self, name, value=None):
+        """A wait scaled to this host
+
+        Without `value` it is the built-in default for `name`, which shrinks on
+        a fast host. A `value` from the test case or the server's schedule is
+        only ever extended.
+        """
+        if value is None:
+            return self._record(name, BASE_LIMITS[name] * self.scale)
+        return self._record(name, value * max(1.0, self.scale))
+
+    def threshold(self, name, value=None):
+        """A graded limit: scaled up on a slow host, never tightened on a fast one"""
+        base = BASE_LIMITS[name] if value is None else value
+        return self._record(name, base * max(1.0, self.scale))
+
+    def _record(self, name, effective):
+        effective = round(effective, 3)
+        self.used[name] = effective
+        return effective
+
+    def report(self):
+        return {"scale": round(self.scale, 3), "source": self.source, **self.details, "limits": self.used}
+
+_profile = None
+
+def limits():
+    """The HostProfile of this evaluation, built on first use"""
+    global _profile
+    if _profile is None:
+        _profile = HostProfile()
+    return _profile
+
+def report_limits(prefix=LIMITS_PREFIX):
+    """Print the scale and the effective limits as a <prefix><json> line for the backend"""
+    if _profile is not None:
+        print(prefix + json.dumps(_profile.report(), separators=(",", ":")))
@@ -0,0 +1,132 @@
+"""
+Logging setup shared by the server and client evaluators.
+
+setup_logging() is called once from an evaluator's main(). Records are
+handed to a QueueHandler, so hot paths only pay for a queue put, and a
+QueueListener thread formats them and writes them out:
+
+- a per-evaluation JSON-lines file with a size cap
+  (CN_EVAL_LOG_DIR, default /tmp/cn_eval_logs; CN_EVAL_LOG_MAX_BYTES); only
+  the CN_EVAL_LOG_KEEP (default 100) newest files are kept
+- warnings and errors on stderr (CN_EVAL_LOG_CONSOLE, default WARNING)
+
+CN_EVAL_LOG_LEVEL sets the level (default INFO). Set it to OFF to drop
+every record at the isEnabledFor() check, with no listener thread at all.
+Evaluator results are still printed to stdout as RESULT lines.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+ROOT_LOGGER = "cn_evaluator"
+DEFAULT_LOG_DIR = "/tmp/cn_eval_logs"
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_KEEP = 100
+
+_listener = None
+_atexit_registered = False
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed as extra={"fields": {...}} are merged in"""
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def _parse_level(value, default):
+    if value is None or value == "":
+        return default
+    value = str(value).upper()
+    if value in ("OFF", "NONE", "0"):
+        return None
+    if value.isdigit():
+        return int(value)
+    return logging.getLevelName(value) if isinstance(logging.getLevelName(value), int) else default
+
+def get_logger(name=None):
+    """Logger below the shared evaluator root"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}" if name else ROOT_LOGGER)
+
+def prune_logs(log_dir, keep):
+    """Drop the oldest log files beyond `keep`; every pooled or re-graded evaluation adds one"""
+    try:
+        entries = sorted((os.path.join(log_dir, name) for name in os.listdir(log_dir)),
+                         key=os.path.getmtime, reverse=True)
+    except OSError:
+        return
+    for path in entries[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def setup_logging(name, level=None, log_dir=None, max_bytes=None, console_level=None):
+    """Configure the evaluator loggers for one evaluation run; returns the log file path"""
+    global _listener, _atexit_registered
+    root = logging.getLogger(ROOT_LOGGER)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    shutdown_logging()
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+
+    level = _parse_level(level if level is not None else os.environ.get("CN_EVAL_LOG_LEVEL"), logging.INFO)
+    if level is None:
+        # Switched off: every logger call returns at the level check
+        root.setLevel(logging.CRITICAL + 1)
+        root.addHandler(logging.NullHandler())
+        return None
+    root.setLevel(level)
+
+    handlers = []
+    log_path = None
+    log_dir = log_dir or os.environ.get("CN_EVAL_LOG_DIR", DEFAULT_LOG_DIR)
+    max_bytes = int(max_bytes or os.environ.get("CN_EVAL_LOG_MAX_BYTES", DEFAULT_MAX_BYTES))
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        prune_logs(log_dir, int(os.environ.get("CN_EVAL_LOG_KEEP", DEFAULT_KEEP)))
+        log_path = os.path.join(log_dir, f"{name}_{os.getpid()}.log")
+        file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=1)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError:
+        log_path = None
+
+    console_level = _parse_level(console_level if console_level is not None
+                                 else os.environ.get("CN_EVAL_LOG_CONSOLE"), logging.WARNING)
+    if console_level is not None:
+        console = logging.StreamHandler()
+        console.setLevel(console_level)
+        console.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handlers.append(console)
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return log_path
+
+def shutdown_logging():
+    """Flush queued records and close the log file; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
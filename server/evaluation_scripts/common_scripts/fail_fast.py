@@ -0,0 +1,37 @@
+"""
+Fatal-condition reporting for fail-fast evaluation.
+
+Some failures say nothing about one test case and everything about the
+submission: it does not compile, the server never binds its port, or the
+server dies on its first connection. When an evaluator hits one of these
+it prints a FATAL:<json> line before the RESULT line:
+
+    FATAL:{"cause":"compile_error","detail":"..."}
+
+The backend runs the cheap cases first and, on a fatal line, marks the
+remaining cases as skipped with that cause instead of repeating the same
+compile or bind timeout for each of them.
+"""
+import json
+import re
+
+FATAL_PREFIX = "FATAL:"
+
+COMPILE_ERROR = "compile_error"
+NO_BIND = "no_bind"
+SERVER_CRASHED = "server_crashed"
+
+MAX_DETAIL = 2000
+# What gcc and the linker print about the source; a timeout or a missing compiler prints none of it
+COMPILER_DIAGNOSTIC = re.compile(rb"\b(?:fatal )?error:|undefined reference to|ld returned \d+ exit status")
+
+def is_compiler_error(stderr):
+    """Whether a failed build's stderr is the compiler rejecting the source"""
+    return COMPILER_DIAGNOSTIC.search(stderr) is not None
+
+def report_fatal(cause, detail=""):
+    """Print the FATAL line for the backend to pick up"""
+    detail = str(detail)
+    if len(detail) > MAX_DETAIL:
+        detail = detail[:MAX_DETAIL] + "..."
+    print(FATAL_PREFIX + json.dumps({"cause": cause, "detail": detail}, separators=(",", ":")))
@@ -0,0 +1,440 @@
+"""
+Userspace network impairment proxy for the CN Lab evaluators.
+
+The proxy listens on a front port, relays every byte (TCP) or datagram (UDP)
+to the program under test on a back port and can apply delay, jitter,
+bandwidth limits, datagram loss and TCP segment splitting/coalescing on the
+way. It runs an asyncio loop in a background thread so the threaded
+evaluators can use it without changes, and needs neither root nor tc netem.
+
+Impairment is configured per test case with an "impairment" object:
+
+    "impairment": {
+        "delay": 0.05,        # one-way delay in seconds
+        "jitter": 0.01,       # +/- uniform jitter in seconds
+        "bandwidth": 65536,   # bytes per second, 0 = unlimited
+        "loss": 5,            # UDP datagram loss in percent
+        "splitSize": 1,       # TCP: forward writes in chunks of this size
+        "splitDelay": 0.002,  # TCP: gap between split chunks
+        "coalesce": 0.02,     # TCP: merge writes arriving within this window
+        "seed": 42            # make jitter/loss reproducible
+    }
+
+With no impairment configured, the relay forwards data straight from
+data_received() to the peer transport, so it only costs one extra hop.
+"""
+import asyncio
+import collections
+import logging
+import random
+import socket
+import threading
+
+logger = logging.getLogger('cn_evaluator.proxy')
+
+IMPAIRMENT_KEYS = ("delay", "jitter", "bandwidth", "loss", "splitSize", "coalesce")
+
+def impairment_enabled(profile):
+    """Return True if the profile asks for any impairment at all"""
+    if not profile:
+        return False
+    return any(profile.get(key) for key in IMPAIRMENT_KEYS)
+
+class _Shaper:
+    """Per-direction scheduler that turns a profile into delivery times"""
+    def __init__(self, loop, profile, rng, ordered):
+        self.loop = loop
+        self.delay = float(profile.get("delay", 0) or 0)
+        self.jitter = float(profile.get("jitter", 0) or 0)
+        self.bandwidth = float(profile.get("bandwidth", 0) or 0)
+        self.loss = float(profile.get("loss", 0) or 0) / 100.0
+        self.split_size = int(profile.get("splitSize", 0) or 0)
+        self.split_delay = float(profile.get("splitDelay", 0.002) or 0)
+        self.coalesce = float(profile.get("coalesce", 0) or 0)
+        self.rng = rng
+        self.ordered = ordered
+        self.link_free_at = 0.0
+        self.last_delivery = 0.0
+
+    def drop(self):
+        return self.loss > 0 and self.rng.random() < self.loss
+
+    def schedule(self, size):
+        """Return the loop time at which a message of `size` bytes arrives"""
+        now = self.loop.time()
+        start = max(now, self.link_free_at)
+        if self.bandwidth > 0:
+            self.link_free_at = start + size / self.bandwidth
+            start = self.link_free_at
+        deliver_at = start + self.delay
+        if self.jitter:
+            deliver_at += self.rng.uniform(-self.jitter, self.jitter)
+        deliver_at = max(deliver_at, now)
+        if self.ordered:
+            # TCP is a byte stream, so jitter may never reorder data
+            deliver_at = max(deliver_at, self.last_delivery)
+        self.last_delivery = deliver_at
+        return deliver_at
+
+class _Pipe:
+    """Ordered delivery queue for one direction of a TCP connection"""
+    def __init__(self, loop, shaper, stats):
+        self.loop = loop
+        self.shaper = shaper
+        self.stats = stats
+        self.queue = collections.deque()
+        self.timer = None
+        self.pending = bytearray()
+        self.coalesce_timer = None
+        self.eof = False
+        self.transport = None
+        self.on_drained = None
+
+    def push(self, data):
+        if self.shaper.coalesce:
+            self.pending += data
+            if self.coalesce_timer is None:
+                self.coalesce_timer = self.loop.call_later(self.shaper.coalesce, self._flush_coalesced)
+            return
+        self._enqueue(data)
+
+    def _flush_coalesced(self):
+        self.coalesce_timer = None
+        if self.pending:
+            data = bytes(self.pending)
+            self.pending.clear()
+            self._enqueue(data)
+        if self.eof:
+            self._maybe_finish()
+
+    def _enqueue(self, data):
+        size = self.shaper.split_size
+        if size and len(data) > size:
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        else:
+            chunks = [data]
+        for n, chunk in enumerate(chunks):
+            when = self.shaper.schedule(len(chunk))
+            if n:
+                when = max(when, self.shaper.last_delivery + self.shaper.split_delay)
+                self.shaper.last_delivery = when
+            self.queue.append((when, chunk))
+        self._arm()
+
+    def _arm(self):
+        if self.timer is None and self.queue:
+            self.timer = self.loop.call_at(self.queue[0][0], self._deliver)
+
+    def _deliver(self):
+        self.timer = None
+        now = self.loop.time()
+        while self.queue and self.queue[0][0] <= now:
+            _, chunk = self.queue.popleft()
+            if self.transport is not None and not self.transport.is_closing():
+                self.transport.write(chunk)
+                self.stats["messages"] += 1
+                self.stats["bytes"] += len(chunk)
+        self._arm()
+        self._maybe_finish()
+
+    def close(self):
+        """Mark the direction finished; deliver what is queued first"""
+        self.eof = True
+        self._maybe_finish()
+
+    def _maybe_finish(self):
+        if self.eof and not self.queue and not self.pending and self.coalesce_timer is None:
+            if self.on_drained:
+                callback, self.on_drained = self.on_drained, None
+                callback()
+
+    def cancel(self):
+        if self.timer:
+            self.timer.cancel()
+        if self.coalesce_timer:
+            self.coalesce_timer.cancel()
+        self.queue.clear()
+
+class _TCPSide(asyncio.Protocol):
+    """One end of a relayed TCP connection; forwards to its peer"""
+    def __init__(self, proxy, pipe=None):
+        self.proxy = proxy
+        self.transport = None
+        self.peer = None
+        self.pipe = pipe  # queue towards the peer, None on the fast path
+        self.buffered = []
+        self.eof = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+
+    def data_received(self, data):
+        if self.peer is None or self.peer.transport is None:
+            # Back connection not established yet
+            self.buffered.append(data)
+            return
+        if self.pipe is None:
+            self.peer.transport.write(data)
+            stats = self.proxy.stats
+            stats["messages"] += 1
+            stats["bytes"] += len(data)
+        else:
+            self.pipe.push(data)
+
+    def attach(self, peer):
+        self.peer = peer
+        if self.pipe is not None:
+            self.pipe.transport = peer.transport
+        for data in self.buffered:
+            self.data_received(data)
+        self.buffered = []
+        if self.eof:
+            # Half-closed before the back connection was up
+            self._forward_eof()
+
+    def eof_received(self):
+        self.eof = True
+        if self.peer is not None:
+            self._forward_eof()
+        return True  # keep our own write side open
+
+    def _forward_eof(self):
+        if self.pipe is None:
+            self._shutdown_peer()
+        else:
+            self.pipe.on_drained = self._shutdown_peer
+            self.pipe.close()
+
+    def _shutdown_peer(self):
+        peer = self.peer
+        if peer and peer.transport and not peer.transport.is_closing():
+            if peer.transport.can_write_eof():
+                peer.transport.write_eof()
+            else:
+                peer.transport.close()
+
+    def pause_writing(self):
+        if self.peer and self.peer.transport:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        if self.peer and self.peer.transport:
+            self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        self.proxy.connections.discard(self)
+        if self.pipe is None:
+            if self.peer and self.peer.transport:
+                self.peer.transport.close()
+        else:
+            def close_peer():
+                if self.peer and self.peer.transport:
+                    self.peer.transport.close()
+            self.pipe.on_drained = close_peer
+            self.pipe.close()
+
+class _UDPFront(asyncio.DatagramProtocol):
+    """Front UDP socket; one back socket is opened per client address"""
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.transport = None
+        self.backs = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        back = self.backs.get(addr)
+        if back is None:
+            back = _UDPBack(self.proxy, self, addr)
+            self.backs[addr] = back
+            coro = self.proxy.loop.create_datagram_endpoint(
+                lambda: back, remote_addr=(self.proxy.target_host, self.proxy.target_port))
+            self.proxy.loop.create_task(coro)
+        back.send(data)
+
+class _UDPBack(asyncio.DatagramProtocol):
+    def __init__(self, proxy, front, client_addr):
+        self.proxy = proxy
+        self.front = front
+        self.client_addr = client_addr
+        self.transport = None
+        self.waiting = []
+        self.up = proxy.make_shaper(ordered=False)
+        self.down = proxy.make_shaper(ordered=False)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        for data in self.waiting:
+            self.send(data)
+        self.waiting = []
+
+    def send(self, data):
+        if self.transport is None:
+            self.waiting.append(data)
+            return
+        self.proxy.forward_datagram(self.up, data, self.transport.sendto, None)
+
+    def datagram_received(self, data, addr):
+        self.proxy.forward_datagram(self.down, data, self.front.transport.sendto, self.client_addr)
+
+    def error_received(self, exc):
+        logger.debug(f"UDP back socket error for {self.client_addr}: {exc}")
+
+class ImpairmentProxy:
+    """TCP/UDP relay from listen_port to target_port with optional impairment"""
+    def __init__(self, listen_port, target_port, protocol="tcp", profile=None,
+                 host="127.0.0.1", target_host="127.0.0.1"):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.protocol = protocol.lower()
+        self.profile = profile or {}
+        self.host = host
+        self.target_host = target_host
+        self.enabled = impairment_enabled(self.profile)
+        self.rng = random.Random(self.profile.get("seed"))
+        self.stats = {"messages": 0, "bytes": 0, "dropped": 0, "connections": 0}
+        self.connections = set()
+        self.loop = None
+        self._server = None
+        self._udp_front = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    def make_shaper(self, ordered):
+        return _Shaper(self.loop, self.profile, self.rng, ordered)
+
+    def forward_datagram(self, shaper, data, send, addr):
+        if not self.enabled:
+            send(data, addr)
+            self.stats["messages"] += 1
+            self.stats["bytes"] += len(data)
+            return
+        if shaper.drop():
+            self.stats["dropped"] += 1
+            return
+        def deliver():
+            send(data, addr)
+            self.stats["messages"] += 1
+            self.stats["bytes"] += len(data)
+        self.loop.call_at(shaper.schedule(len(data)), deliver)
+
+    def _accept_tcp(self):
+        up_pipe = down_pipe = None
+        if self.enabled:
+            up_pipe = _Pipe(self.loop, self.make_shaper(ordered=True), self.stats)
+            down_pipe = _Pipe(self.loop, self.make_shaper(ordered=True), self.stats)
+        front = _TCPSide(self, up_pipe)
+        back = _TCPSide(self, down_pipe)
+        self.connections.update((front, back))
+        self.stats["connections"] += 1
+
+        async def connect_back():
+            try:
+                await self.loop.create_connection(lambda: back, self.target_host, self.target_port)
+            except OSError as e:
+                logger.warning(f"Proxy could not reach target port {self.target_port}: {e}")
+                if front.transport:
+                    front.transport.close()
+                return
+            if front.transport is None or front.transport.is_closing():
+                # The client left while we were connecting; nothing would ever close this side
+                back.transport.close()
+                return
+            back.attach(front)
+            front.attach(back)
+
+        self.loop.create_task(connect_back())
+        return front
+
+    async def _serve(self):
+        if self.protocol == "udp":
+            transport, self._udp_front = await self.loop.create_datagram_endpoint(
+                lambda: _UDPFront(self), local_addr=(self.host, self.listen_port))
+            self._server = transport
+        else:
+            self._server = await self.loop.create_server(
+                self._accept_tcp, self.host, self.listen_port, reuse_address=True)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            self.loop.close()
+            return
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def start(self, timeout=5):
+        """Start the relay thread and wait until the front port is bound"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Impairment proxy did not start in time")
+        if self._error:
+            raise RuntimeError(f"Impairment proxy failed to start: {self._error}")
+        mode = "impaired" if self.enabled else "pass-through"
+        logger.info(f"{self.protocol.upper()} proxy {self.listen_port} -> {self.target_port} ({mode})")
+        return self
+
+    def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+        for side in list(self.connections):
+            if side.pipe:
+                side.pipe.cancel()
+            if side.transport:
+                side.transport.abort()
+        if self._udp_front is not None:
+            # One back socket per client address
+            for back in self._udp_front.backs.values():
+                if back.transport:
+                    back.transport.close()
+        self.loop.stop()
+
+    def stop(self, timeout=2):
+        """Stop relaying and close every proxied connection"""
+        if self.loop is None or self._thread is None:
+            return
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._shutdown)
+        self._thread.join(timeout)
+
+def start_impairment_proxy(listen_port, target_port, protocol="tcp", profile=None):
+    """Convenience wrapper: create and start a proxy in one call"""
+    return ImpairmentProxy(listen_port, target_port, protocol, profile).start()
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="CN Lab network impairment proxy")
+    parser.add_argument("listen_port", type=int, help="Front port to listen on")
+    parser.add_argument("target_port", type=int, help="Port of the program under test")
+    parser.add_argument("--protocol", default="tcp", choices=["tcp", "udp"])
+    parser.add_argument("--profile", default="{}", help="Impairment profile as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    proxy = start_impairment_proxy(args.listen_port, args.target_port, args.protocol, json.loads(args.profile))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        proxy.stop()
+        print(json.dumps(proxy.stats))
@@ -0,0 +1,165 @@
+"""
+Continuous capture of a child process's stdout/stderr.
+
+A server that logs every request blocks in write() once nobody reads its
+~64 KB pipe, and then looks hung exactly under the load tests. OutputCapture
+drains the pipes from one background thread for as long as they are open
+and keeps, per stream, a bounded head and a bounded tail (CN_EVAL_OUTPUT_CAP
+bytes each, default 32 KiB). Output in between is discarded but still
+counted.
+
+Patterns registered up front ("server printed 'Client 3 connected'") are
+checked line by line as the output streams past, so a match is found even
+in the part of the log that is not kept. A StreamMatcher (stream_match.py)
+can be attached to one stream as well; `decided` is set as soon as it has
+a verdict, or when the output ends.
+"""
+import json
+import os
+import re
+import selectors
+import threading
+from collections import deque
+
+OUTPUT_PREFIX = "SERVER_OUTPUT:"
+DEFAULT_CAP = 32 * 1024
+MAX_LINE = 4096
+READ_SIZE = 64 * 1024
+
+class _Stream:
+    def __init__(self, cap):
+        self.cap = cap
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_bytes = 0
+        self.total = 0
+        self.partial = b""
+
+    def add(self, data):
+        self.total += len(data)
+        room = self.cap - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_bytes += len(data)
+        while self.tail_bytes - len(self.tail[0]) >= self.cap:
+            self.tail_bytes -= len(self.tail.popleft())
+        if self.tail_bytes > self.cap:
+            # Trim the oldest chunk so the tail holds exactly `cap` bytes
+            excess = self.tail_bytes - self.cap
+            self.tail[0] = self.tail[0][excess:]
+            self.tail_bytes -= excess
+
+    def text(self, head=None, tail=None):
+        """Kept output; `head`/`tail` shrink it further for reports"""
+        head_part = bytes(self.head if head is None else self.head[:head])
+        tail_all = b"".join(self.tail)
+        tail_part = tail_all if tail is None else tail_all[-tail:] if tail else b""
+        omitted = self.total - len(head_part) - len(tail_part)
+        if omitted > 0:
+            joined = head_part + f"\n... [{omitted} bytes omitted] ...\n".encode() + tail_part
+        else:
+            joined = head_part + tail_part
+        return joined.decode("utf-8", errors="replace")
+
+class OutputCapture:
+    """Drain named pipes (e.g. {"stdout": proc.stdout}) into bounded buffers"""
+
+    def __init__(self, pipes, cap=None, watch=(), regex=False, matcher=None, match_stream="stdout"):
+        cap = cap or int(os.environ.get("CN_EVAL_OUTPUT_CAP", DEFAULT_CAP))
+        self.streams = {name: _Stream(cap) for name, pipe in pipes.items() if pipe is not None}
+        self.patterns = [(p, re.compile(p) if regex else None) for p in watch]
+        self.matched = set()
+        self.matcher = matcher
+        self.match_stream = match_stream
+        self.decided = threading.Event()
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        for name, pipe in pipes.items():
+            if pipe is not None:
+                os.set_blocking(pipe.fileno(), False)
+                self.selector.register(pipe, selectors.EVENT_READ, name)
+        self.thread = threading.Thread(target=self._drain, name="output-capture", daemon=True)
+        self.thread.start()
+
+    def _check_lines(self, stream, data):
+        lines = (stream.partial + data).split(b"\n")
+        stream.partial = lines.pop()[-MAX_LINE:]
+        for line in lines:
+            self._check_line(line)
+
+    def _check_line(self, line):
+        text = line[:MAX_LINE].decode("utf-8", errors="replace").rstrip("\r")
+        for pattern, compiled in self.patterns:
+            if pattern not in self.matched and (compiled.search(text) if compiled else pattern in text):
+                self.matched.add(pattern)
+
+    def _drain(self):
+        while self.selector.get_map():
+            for key, _ in self.selector.select():
+                try:
+                    data = os.read(key.fileobj.fileno(), READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                stream = self.streams[key.data]
+                if not data:
+                    self.selector.unregister(key.fileobj)
+                    if stream.partial and self.patterns:
+                        with self.lock:
+                            self._check_line(stream.partial)
+                    continue
+                with self.lock:
+                    stream.add(data)
+                    if self.patterns:
+                        self._check_lines(stream, data)
+                    if self.matcher is not None and key.data == self.match_stream and self.matcher.feed(data):
+                        self.decided.set()
+        if self.matcher is not None:
+            with self.lock:
+                stream = self.streams.get(self.match_stream)
+                self.matcher.finish(stream.text().strip() if stream else "")
+        self.decided.set()
+        self.selector.close()
+
+    def close(self, timeout=1.0):
+        """Wait for the writers to go away (EOF on every pipe); True if drained completely"""
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def text(self, name="stdout", head=None, tail=None):
+        stream = self.streams.get(name)
+        if stream is None:
+            return ""
+        with self.lock:
+            return stream.text(head, tail)
+
+    def contains(self, pattern, regex=False):
+        if pattern in self.matched:
+            return True
+        with self.lock:
+            kept = [s.text() for s in self.streams.values()]
+        return any(re.search(pattern, t, re.M) if regex else pattern in t for t in kept)
+
+    def missing(self):
+        """Registered patterns that have not appeared on any stream"""
+        with self.lock:
+            return [pattern for pattern, _ in self.patterns if pattern not in self.matched]
+
+    def report(self, head=1024, tail=1024):
+        """Short excerpt of every stream for a failure report"""
+        with self.lock:
+            return {
+                name: {"text": stream.text(head, tail), "bytes": stream.total}
+                for name, stream in self.streams.items() if stream.total
+            }
+
+def report_output(capture, prefix=OUTPUT_PREFIX):
+    """Print the captured excerpt as a <prefix><json> line for the backend"""
+    excerpt = capture.report() if capture is not None else {}
+    if excerpt:
+        print(prefix + json.dumps(excerpt, separators=(",", ":")))
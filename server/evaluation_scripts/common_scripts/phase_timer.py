@@ -0,0 +1,114 @@
+"""
+Phase timing and optional profiling for one evaluation run.
+
+The evaluators wrap each step (port patching, compile, server start,
+readiness wait, client run, teardown) in timer.phase(name). Start/end are
+taken from time.perf_counter() relative to the start of the run, so the
+numbers are monotonic and comparable across phases.
+
+Profiling is off unless requested with --profile or CN_EVAL_PROFILE:
+  cpu     run cProfile over the whole evaluation; the top functions go into
+          the report and the full stats are dumped next to the log files
+  memory  trace allocations with tracemalloc; each phase records the
+          current and peak traced memory
+  all     both
+
+The report is printed as a TIMING:<json> line just before the RESULT line.
+"""
+import contextlib
+import json
+import os
+import time
+
+TIMING_PREFIX = "TIMING:"
+
+class PhaseTimer:
+    def __init__(self, profile=None, stats_dir=None):
+        profile = (profile if profile is not None else os.environ.get("CN_EVAL_PROFILE", "")).lower()
+        self.cpu = profile in ("cpu", "all", "1", "true")
+        self.memory = profile in ("memory", "all", "1", "true")
+        self.stats_dir = stats_dir or os.environ.get("CN_EVAL_LOG_DIR", "/tmp/cn_eval_logs")
+        self.phases = []
+        self.start = time.perf_counter()
+        self._profiler = None
+        if self.cpu:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one named phase"""
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            entry = {
+                "phase": name,
+                "start": round(begin - self.start, 6),
+                "duration": round(end - begin, 6),
+            }
+            if self.memory:
+                import tracemalloc
+                current, peak = tracemalloc.get_traced_memory()
+                entry["memCurrent"] = current
+                entry["memPeak"] = peak
+                tracemalloc.reset_peak()
+            self.phases.append(entry)
+
+    def _cpu_report(self, top=10):
+        import io
+        import pstats
+        self._profiler.disable()
+        stats_path = None
+        try:
+            os.makedirs(self.stats_dir, exist_ok=True)
+            stats_path = os.path.join(self.stats_dir, f"profile_{os.getpid()}.pstats")
+            self._profiler.dump_stats(stats_path)
+        except OSError:
+            pass
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        hotspots = []
+        for (filename, line, func), (_, calls, _, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]:
+            hotspots.append({
+                "function": f"{os.path.basename(filename)}:{line}:{func}",
+                "calls": calls,
+                "cumulative": round(cumulative, 6),
+            })
+        return {"statsFile": stats_path, "top": hotspots}
+
+    def report(self):
+        """Phase list plus totals, suitable for json.dumps"""
+        result = {
+            "total": round(time.perf_counter() - self.start, 6),
+            "phases": self.phases,
+        }
+        if self._profiler is not None:
+            result["cpuProfile"] = self._cpu_report()
+            self._profiler = None
+        return result
+
+    def emit(self):
+        """Print the TIMING line for the backend to pick up"""
+        print(TIMING_PREFIX + json.dumps(self.report(), separators=(",", ":")))
+
+def summarize_timings(reports):
+    """Aggregate several reports into per-phase count/total/mean/max"""
+    summary = {}
+    for report in reports:
+        for entry in report.get("phases", []):
+            stats = summary.setdefault(entry["phase"], {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += entry["duration"]
+            stats["max"] = max(stats["max"], entry["duration"])
+    for stats in summary.values():
+        stats["mean"] = round(stats["total"] / stats["count"], 6)
+        stats["total"] = round(stats["total"], 6)
+    return summary
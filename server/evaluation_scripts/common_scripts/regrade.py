@@ -0,0 +1,249 @@
+"""
+Bulk re-grade of every stored submission for a question.
+
+    python3 regrade.py server submissions/ testcases.json --out results.jsonl
+    python3 regrade.py client manifest.json testcases.json --out results.jsonl --cases 0,3
+
+Submissions come from a directory or from a manifest. A directory holds one
+source file per student (the submission id is the file name without its
+extension) or one subdirectory per student with a single source file in it.
+When a file and a subdirectory would share an id (alice.c and alice/), the
+file keeps its full name as its id. A manifest is a JSON list, or JSONL, of
+{"id": ..., "path": ...}; relative paths are taken from the manifest's
+directory, and ids must be unique.
+
+Identical sources are evaluated once, and the verdicts are recorded for
+every submission that shares them. Each distinct source is one job. Its
+cases run one after the other in a scratch directory, and all of them use
+one shared build (see build_cache.py). Jobs are spread over pool_size()
+threads. Each thread hands its evaluations to the pre-warmed worker pool
+(worker_pool.py), so the host's CPU quota sizes the re-grade too. As in the
+backend, a compile error or a server that never binds skips the job's
+remaining cases. With --case-timeout, an evaluation that runs longer is
+stopped together with every process it started and recorded as a FAIL; it
+is never run a second time.
+
+Results are appended to a single JSONL file, with one line per submission
+and case, tagged with the plan version of the test file. That file is the
+checkpoint. To resume an interrupted run, start it again with the same
+arguments; cases already recorded for the current plan version are not
+evaluated again. Editing the test file changes the version, so a fixed test
+case is re-graded for everyone.
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from eval_logging import get_logger, setup_logging
+from fail_fast import FATAL_PREFIX, COMPILE_ERROR, NO_BIND
+from deadlines import LIMITS_PREFIX
+from test_plan import load_plan, PlanError
+from worker_pool import ROLES, pool_size, run_evaluator, start_pool
+
+logger = get_logger("regrade")
+
+DEFAULT_PATTERN = "*.c"
+DEFAULT_BUILD_DIR = os.path.join(tempfile.gettempdir(), "cn_eval_builds")
+# Causes that say the remaining cases would fail the same way (utils/failFast.js ALWAYS_FATAL)
+ALWAYS_FATAL = (COMPILE_ERROR, NO_BIND)
+
+def find_submissions(path, pattern=DEFAULT_PATTERN):
+    """[(submission id, source path)] from a directory or a manifest; raises ValueError on duplicate ids"""
+    if os.path.isdir(path):
+        files, dirs = [], []
+        for name in sorted(os.listdir(path)):
+            full = os.path.join(path, name)
+            if os.path.isfile(full) and fnmatch.fnmatch(name, pattern):
+                files.append((name, full))
+            elif os.path.isdir(full):
+                sources = sorted(n for n in os.listdir(full) if fnmatch.fnmatch(n, pattern))
+                if len(sources) == 1:
+                    dirs.append((name, os.path.join(full, sources[0])))
+                else:
+                    logger.warning("Skipping %s: %d files match %s", full, len(sources), pattern)
+        taken = {name for name, _ in dirs}
+        stems = [os.path.splitext(name)[0] for name, _ in files]
+        found = dirs + [(stem if stem not in taken and stems.count(stem) == 1 else name, full)
+                        for stem, (name, full) in zip(stems, files)]
+        return sorted(found)
+    with open(path) as f:
+        text = f.read()
+    try:
+        entries = json.loads(text)
+    except ValueError:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    base = os.path.dirname(os.path.abspath(path))
+    found = [(str(entry["id"]), os.path.join(base, entry["path"])) for entry in entries]
+    ids = [submission for submission, _ in found]
+    duplicates = sorted({submission for submission in ids if ids.count(submission) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate submission ids in {path}: {', '.join(duplicates[:5])}")
+    return found
+
+def load_checkpoint(out_path, version):
+    """(submission, case) pairs already recorded for this plan version; drops a torn last line"""
+    done = set()
+    try:
+        with open(out_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+                data = data[:data.rfind(b"\n") + 1]
+    except FileNotFoundError:
+        return done
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("plan") == version:
+            done.add((record["submission"], record["case"]))
+    return done
+
+def _json_payload(line, prefix):
+    try:
+        return json.loads(line[len(prefix):])
+    except ValueError:
+        return None
+
+def parse_output(stdout):
+    """Status, message and the FATAL/LIMITS payloads of one evaluator run"""
+    status, message, fatal, limits = "FAIL", "No RESULT line from the evaluator", None, None
+    for line in stdout.splitlines():
+        if line.startswith("RESULT:"):
+            parts = line.split(":", 2)
+            if len(parts) == 3:
+                status, message = parts[1], parts[2]
+        elif line.startswith(FATAL_PREFIX):
+            fatal = _json_payload(line, FATAL_PREFIX)
+        elif line.startswith(LIMITS_PREFIX):
+            limits = _json_payload(line, LIMITS_PREFIX)
+    return status, message, fatal, limits
+
+class Regrade:
+    def __init__(self, role, test_file, cases, build_dir, timeout=None):
+        self.role = role
+        self.test_file = os.path.abspath(test_file)
+        self.plan = load_plan(self.test_file, role)
+        self.cases = cases if cases is not None else list(range(len(self.plan.cases)))
+        self.build_dir = build_dir
+        self.timeout = timeout
+
+    def evaluate(self, source, indexes):
+        """Run the cases `indexes` for one source; returns {case: result}"""
+        results = {}
+        workdir = tempfile.mkdtemp(prefix="regrade_")
+        try:
+            # The shared build is patched in the cache, so the copy is never modified
+            src = os.path.join(workdir, os.path.basename(source))
+            shutil.copyfile(source, src)
+            skipped = None
+            for index in indexes:
+                try:
+                    description = self.plan.case(index).testcase.get("description", "")
+                except PlanError as e:
+                    results[index] = {"status": "FAIL", "message": str(e), "description": ""}
+                    continue
+                if skipped:
+                    results[index] = {"status": "SKIPPED", "message": f"Skipped: {skipped}",
+                                      "description": description}
+                    continue
+                start = time.perf_counter()
+                try:
+                    proc = run_evaluator(self.role, [src, self.test_file, index, "--build-dir", self.build_dir],
+                                         timeout=self.timeout, cwd=workdir)
+                    status, message, fatal, limits = parse_output(proc.stdout)
+                except subprocess.TimeoutExpired:
+                    status, message, fatal, limits = "FAIL", f"Timed out after {self.timeout}s", None, None
+                except Exception as e:
+                    status, message, fatal, limits = "FAIL", f"Evaluator did not finish: {e}", None, None
+                results[index] = {"status": status, "message": message, "description": description,
+                                  "fatal": fatal, "limits": limits,
+                                  "duration": round(time.perf_counter() - start, 3)}
+                if fatal and fatal.get("cause") in ALWAYS_FATAL:
+                    skipped = f"{fatal['cause']} (test case {index + 1})"
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-grade every submission of a question")
+    parser.add_argument("role", choices=sorted(ROLES))
+    parser.add_argument("submissions", help="Directory of submissions or a JSON/JSONL manifest")
+    parser.add_argument("test_file", help="Testcases JSON file")
+    parser.add_argument("--out", required=True, help="JSONL results file (also the checkpoint)")
+    parser.add_argument("--cases", default=None, help="Comma-separated case indexes (default: all)")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="Source file pattern in a directory")
+    parser.add_argument("--jobs", type=int, default=None, help="Concurrent evaluations (default: pool size)")
+    parser.add_argument("--build-dir", default=DEFAULT_BUILD_DIR, help="Shared build cache directory")
+    parser.add_argument("--case-timeout", type=float, default=None, help="Hard limit per evaluation")
+    args = parser.parse_args()
+    setup_logging("regrade")
+
+    cases = [int(i) for i in args.cases.split(",")] if args.cases else None
+    try:
+        regrade = Regrade(args.role, args.test_file, cases, os.path.abspath(args.build_dir), args.case_timeout)
+    except (OSError, PlanError) as e:
+        sys.exit(f"Cannot load {args.test_file}: {e}")
+    try:
+        submissions = find_submissions(args.submissions, args.pattern)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Cannot read submissions from {args.submissions}: {e}")
+    done = load_checkpoint(args.out, regrade.plan.version)
+
+    # One job per distinct source, with the cases that some submission sharing it still needs
+    groups = {}
+    for submission, path in submissions:
+        try:
+            with open(path, "rb") as f:
+                key = hashlib.sha256(f.read()).hexdigest()[:24]
+        except OSError as e:
+            logger.warning("Skipping %s: %s", submission, e)
+            continue
+        group = groups.setdefault(key, {"path": path, "ids": []})
+        group["ids"].append(submission)
+    jobs = []
+    for key, group in groups.items():
+        indexes = [i for i in regrade.cases if any((s, i) not in done for s in group["ids"])]
+        if indexes:
+            jobs.append((key, group, indexes))
+
+    workers = args.jobs or pool_size()
+    start_pool(args.role)
+    print(f"Re-grading {len(submissions)} submissions ({len(groups)} distinct sources, {len(jobs)} to run) "
+          f"on {workers} workers, plan {regrade.plan.version}", flush=True)
+    counts = {}
+    started = time.perf_counter()
+    with open(args.out, "a") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(regrade.evaluate, group["path"], indexes): (key, group, indexes)
+                   for key, group, indexes in jobs}
+        for n, future in enumerate(as_completed(futures), 1):
+            key, group, indexes = futures[future]
+            results = future.result()
+            for submission in group["ids"]:
+                for index in indexes:
+                    if (submission, index) in done:
+                        continue
+                    result = results[index]
+                    counts[result["status"]] = counts.get(result["status"], 0) + 1
+                    out.write(json.dumps({"submission": submission, "source": key, "case": index,
+                                          "plan": regrade.plan.version, **result}) + "\n")
+            # Everything up to here survives an interruption
+            out.flush()
+            os.fsync(out.fileno())
+            logger.info("Job %d/%d: %s (%d cases) for %s", n, len(jobs), key, len(indexes), ", ".join(group["ids"]))
+
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{status} {count}" for status, count in sorted(counts.items())) or "nothing to do"
+    print(f"Done in {elapsed:.1f}s: {summary}; results in {args.out}")
+
+if __name__ == "__main__":
+    main()
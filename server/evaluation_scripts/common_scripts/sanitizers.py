@@ -0,0 +1,163 @@
+"""
+Sanitizer builds and report parsing for the diagnostic tier.
+
+A submission is compiled once with -fsanitize=address,undefined (mode
+"address") or -fsanitize=thread (mode "thread") and run through the
+functional test cases. Whatever the sanitizer runtimes print, to their log
+files or to stderr, is parsed into findings:
+
+    {"tool": "AddressSanitizer", "kind": "heap-use-after-free",
+     "location": "server.c:42", "function": "handle_client",
+     "message": "...", "frames": [...], "testCases": [0, 2], "count": 3}
+
+Identical findings (same tool, kind and location) are merged, so a race hit
+by every client shows up once with a count.
+"""
+import glob
+import os
+import re
+
+SANITIZER_FLAGS = {
+    "address": ["-g", "-O1", "-fno-omit-frame-pointer", "-fsanitize=address,undefined", "-pthread"],
+    "thread": ["-g", "-O1", "-fsanitize=thread", "-pthread"],
+}
+
+MAX_FRAMES = 8
+MAX_FINDINGS = 20
+
+_HEADER = re.compile(r"^(?:==\d+==)?(?:ERROR|WARNING): (\w+Sanitizer): (.*)$")
+_SUMMARY = re.compile(r"^SUMMARY: (\w+Sanitizer): (.*)$")
+_UBSAN = re.compile(r"^(\S+?:\d+(?::\d+)?): runtime error: (.*)$")
+_FRAME = re.compile(r"^\s+#(\d+) (?:0x[0-9a-f]+ )?(?:in )?(\S+)(?: (\S+))?")
+_SUMMARY_DETAIL = re.compile(r"^(.+?) (\S+:\d+(?::\d+)?)(?: in (\S+))?$")
+
+def sanitizer_mode(testcase=None):
+    """Sanitizer mode requested by a test case or CN_EVAL_SANITIZE, or None"""
+    mode = (testcase or {}).get("sanitize") or os.environ.get("CN_EVAL_SANITIZE", "")
+    if mode is True:
+        mode = "address"
+    mode = str(mode).lower()
+    return mode if mode in SANITIZER_FLAGS else None
+
+def sanitizer_env(mode, log_prefix, env=None):
+    """Environment for running a sanitized binary; reports go to log_prefix.<pid>"""
+    env = dict(env if env is not None else os.environ)
+    if mode == "thread":
+        env["TSAN_OPTIONS"] = f"log_path={log_prefix}:halt_on_error=0:second_deadlock_stack=1"
+    else:
+        env["ASAN_OPTIONS"] = f"log_path={log_prefix}:detect_leaks=0:abort_on_error=0"
+        env["UBSAN_OPTIONS"] = "print_stacktrace=1:halt_on_error=0"
+    return env
+
+def _short(path):
+    return os.path.basename(path) if path else path
+
+def _frame_location(frame):
+    return frame.get("file") or ""
+
+def parse_sanitizer_output(text, source_name=None, case_index=None):
+    """Findings in one chunk of sanitizer output"""
+    findings = []
+    current = None
+    lines = text.splitlines()
+
+    def close(entry):
+        if entry is None:
+            return
+        # Point at the student's code rather than at a libc interceptor
+        in_source = source_name and (entry.get("location") or "").startswith(source_name + ":")
+        if source_name and not in_source:
+            for frame in entry["frames"]:
+                if _frame_location(frame).startswith(source_name + ":"):
+                    entry["location"] = _frame_location(frame)
+                    entry["function"] = frame["function"]
+                    break
+        findings.append(entry)
+
+    for line in lines:
+        header = _HEADER.match(line)
+        ubsan = _UBSAN.match(line)
+        summary = _SUMMARY.match(line)
+        frame = _FRAME.match(line)
+        if header and header.group(1) != "UndefinedBehaviorSanitizer":
+            close(current)
+            description = header.group(2)
+            current = {
+                "tool": header.group(1),
+                "kind": re.split(r" on | \(| at ", description, 1)[0].strip(),
+                "location": None,
+                "function": None,
+                "message": description.strip(),
+                "frames": [],
+            }
+        elif ubsan:
+            close(current)
+            message = ubsan.group(2).strip()
+            current = {
+                "tool": "UndefinedBehaviorSanitizer",
+                "kind": message.split(":", 1)[0],
+                "location": _short(ubsan.group(1)),
+                "function": None,
+                "message": message,
+                "frames": [],
+            }
+        elif summary and current is not None:
+            detail = _SUMMARY_DETAIL.match(summary.group(2))
+            if detail:
+                current["kind"] = detail.group(1)
+                current["location"] = _short(detail.group(2))
+                current["function"] = detail.group(3)
+            close(current)
+            current = None
+        elif (frame and current is not None and len(current["frames"]) < MAX_FRAMES
+              and not frame.group(2).startswith("0x")):
+            current["frames"].append({
+                "function": frame.group(2),
+                "file": _short(frame.group(3)) if frame.group(3) and not frame.group(3).startswith("(") else None,
+            })
+    close(current)
+
+    for entry in findings:
+        entry["testCases"] = [] if case_index is None else [case_index]
+        entry["count"] = 1
+        if entry["function"] is None and entry["frames"]:
+            entry["function"] = entry["frames"][0]["function"]
+    return findings
+
+def read_sanitizer_logs(log_prefix, stderr_path=None, source_name=None, case_index=None):
+    """Parse every log file written under log_prefix plus the program's stderr"""
+    findings = []
+    paths = sorted(glob.glob(f"{glob.escape(log_prefix)}.*"))
+    if stderr_path:
+        paths.append(stderr_path)
+    for path in paths:
+        try:
+            with open(path, errors="replace") as f:
+                findings.extend(parse_sanitizer_output(f.read(), source_name, case_index))
+        except OSError:
+            continue
+    return findings
+
+def merge_findings(findings):
+    """Collapse identical findings, keeping counts and the test cases that hit them"""
+    merged = {}
+    for entry in findings:
+        key = (entry["tool"], entry["kind"], entry["location"])
+        if key not in merged:
+            merged[key] = dict(entry, testCases=list(entry["testCases"]))
+            continue
+        existing = merged[key]
+        existing["count"] += entry["count"]
+        for index in entry["testCases"]:
+            if index not in existing["testCases"]:
+                existing["testCases"].append(index)
+    return sorted(merged.values(), key=lambda e: -e["count"])[:MAX_FINDINGS]
+
+def describe_findings(findings):
+    """One-line summary for a RESULT message"""
+    if not findings:
+        return "No sanitizer findings"
+    parts = [f"{f['kind']} at {f['location'] or '?'}" + (f" in {f['function']}" if f.get("function") else "")
+             for f in findings[:3]]
+    more = f" (+{len(findings) - 3} more)" if len(findings) > 3 else ""
+    return f"{len(findings)} sanitizer finding(s): " + "; ".join(parts) + more
@@ -0,0 +1,64 @@
+"""
+Wait scheduler shared by the server and client evaluators.
+
+Every pause in an evaluation goes through a Scheduler instead of calling
+time.sleep() directly. In "real" mode (the default) each wait sleeps for
+exactly the configured time, as the evaluators always did. In "fast" mode
+a fixed delay becomes an event wait capped at the same duration: the next
+readable byte on a socket or pipe, the next accepted connection, a client
+having connected. A fast wait therefore never lasts longer than the real
+one and keeps the order the test case specifies.
+
+The mode comes from the test case ("timeMode": "fast") or from the
+CN_EVAL_TIME_MODE environment variable.
+"""
+import os
+import select
+import time
+
+FAST_POLL_INTERVAL = 0.01
+FAST_QUIET_PERIOD = 0.02
+
+class Scheduler:
+    def __init__(self, mode="real"):
+        self.mode = mode
+        self.fast = mode == "fast"
+
+    def sleep(self, seconds):
+        """A pure delay with nothing to wait for; skipped in fast mode"""
+        if not self.fast:
+            time.sleep(seconds)
+
+    def wait_event(self, event, seconds):
+        """Wait for an Event/Semaphore/Condition-like object, at most `seconds`"""
+        if not self.fast:
+            time.sleep(seconds)
+            return True
+        if hasattr(event, "acquire") and not hasattr(event, "is_set"):
+            return event.acquire(timeout=seconds)
+        return event.wait(seconds)
+
+    def wait_readable(self, fileobj, seconds):
+        """Wait until `fileobj` (socket, pipe or fd) has data, at most `seconds`"""
+        if not self.fast:
+            time.sleep(seconds)
+            return True
+        try:
+            ready, _, _ = select.select([fileobj], [], [], seconds)
+        except (ValueError, OSError):
+            return False
+        return bool(ready)
+
+    def poll_interval(self, seconds):
+        """Interval to use when a condition can only be polled"""
+        return min(seconds, FAST_POLL_INTERVAL) if self.fast else seconds
+
+    @property
+    def quiet_period(self):
+        """Silence after which a reader may assume output is complete (None = read full timeout)"""
+        return FAST_QUIET_PERIOD if self.fast else None
+
+def scheduler_for(testcase=None):
+    """Build the scheduler for a test case"""
+    mode = (testcase or {}).get("timeMode") or os.environ.get("CN_EVAL_TIME_MODE", "real")
+    return Scheduler(mode)
@@ -0,0 +1,185 @@
+"""
+Streaming verdicts over a program's output.
+
+The client evaluator used to collect the whole stdout of a client, then
+search it for the expected output. A client that prints a large listing,
+or keeps logging after it has printed the answer, costs memory in
+proportion to its output and time until it exits. StreamMatcher checks
+every expectation as the chunks arrive instead:
+
+- required: all of them must appear (expectedOutput, expectAll)
+- sufficient: any one of them is enough (expectedFormula)
+- forbidden: any one of them fails the test (forbidOutput)
+
+The verdict is known as soon as a forbidden pattern shows up, or, when
+nothing is forbidden, as soon as the required patterns have all been seen.
+The caller can then stop the program instead of waiting for it to exit.
+
+Literal patterns share one Aho-Corasick automaton (a dense DFA with 256
+transitions per state), so overlapping patterns and matches split across
+chunk boundaries are found. Walking it byte by byte in Python runs at
+about 10 MB/s, so each window (the new chunk plus the last longest-pattern
+bytes before it) is first searched with one combined regex of the patterns
+still of interest. The automaton only walks the rare windows that regex
+says contain a hit. Regex patterns are matched line by line. A regex that
+needs the whole output (anchors, a line break, or anything that can match
+one) is checked once, at the end, against the kept output.
+"""
+import re
+from collections import deque
+
+MAX_LINE = 4096
+# Patterns that cannot be decided one line at a time (anchors, line breaks, or classes that match one)
+_WHOLE_OUTPUT = re.compile(r"[\n\r]|\\[nrsWD]|\\A|\\Z|[\^$]|\(\?[a-z]*s")
+
+class Automaton:
+    """Aho-Corasick over byte patterns; scan() returns the indexes of the patterns in `data`, first() the lowest"""
+
+    def __init__(self, patterns):
+        goto = [{}]
+        out = [0]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for byte in pattern:
+                if byte not in goto[node]:
+                    goto.append({})
+                    out.append(0)
+                    goto[node][byte] = len(goto) - 1
+                node = goto[node][byte]
+            out[node] |= 1 << index
+        delta = [None] * len(goto)
+        delta[0] = [goto[0].get(byte, 0) for byte in range(256)]
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            # Transitions of the failure state are complete already (breadth-first order)
+            delta[node] = [goto[node].get(byte, delta[fail[node]][byte]) for byte in range(256)]
+            out[node] |= out[fail[node]]
+            for byte, child in goto[node].items():
+                fail[child] = delta[fail[node]][byte]
+                queue.append(child)
+        self.delta = delta
+        self.out = out
+
+    def _found(self, data):
+        delta, out = self.delta, self.out
+        state = found = 0
+        for byte in data:
+            state = delta[state][byte]
+            if out[state]:
+                found |= out[state]
+        return found
+
+    def scan(self, data):
+        found = self._found(data)
+        return [index for index in range(found.bit_length()) if found >> index & 1]
+
+    def first(self, data):
+        """Lowest index of a pattern in `data`, or None"""
+        found = self._found(data)
+        return (found & -found).bit_length() - 1 if found else None
+
+class StreamMatcher:
+    """Expectations over one output stream, fed chunk by chunk
+
+    required, sufficient and forbidden are lists of (pattern, is_regex).
+    """
+
+    def __init__(self, required=(), sufficient=(), forbidden=()):
+        entries = ([(p, r, "required") for p, r in required] + [(p, r, "sufficient") for p, r in sufficient]
+                   + [(p, r, "forbidden") for p, r in forbidden])
+        self.kinds = {}
+        self.literals, self.line_regexes, self.whole_regexes = [], [], []
+        for pattern, is_regex, kind in entries:
+            if pattern in self.kinds:
+                # Output that is both expected and forbidden fails
+                if kind == "forbidden":
+                    self.kinds[pattern] = kind
+                continue
+            self.kinds[pattern] = kind
+            if not is_regex:
+                self.literals.append(pattern)
+            elif _WHOLE_OUTPUT.search(pattern):
+                self.whole_regexes.append((pattern, re.compile(pattern)))
+            else:
+                self.line_regexes.append((pattern, re.compile(pattern)))
+        self.automaton = Automaton([p.encode() for p in self.literals]) if self.literals else None
+        self.overlap = max((len(p.encode()) for p in self.literals), default=1) - 1
+        self.carry = b""
+        self.partial = b""
+        self.seen = set()
+        self.verdict = None
+        self.reason = ""
+        self._prefilter()
+
+    def _prefilter(self):
+        pending = [p for p in self.literals if p not in self.seen]
+        self.filter = re.compile(b"|".join(re.escape(p.encode()) for p in pending)) if pending else None
+        self.pending_lines = [(p, c) for p, c in self.line_regexes if p not in self.seen]
+
+    def _decide(self):
+        forbidden = [p for p in self.seen if self.kinds[p] == "forbidden"]
+        if forbidden:
+            self.verdict, self.reason = "FAIL", f"forbidden output '{forbidden[0]}' was printed"
+        elif not any(kind == "forbidden" for kind in self.kinds.values()):
+            self.verdict = self._passed()
+
+    def _passed(self):
+        """PASS once a sufficient pattern or every required one has been seen"""
+        kinds = self.kinds.items()
+        if any(kind == "sufficient" and p in self.seen for p, kind in kinds):
+            return "PASS"
+        if all(p in self.seen for p, kind in kinds if kind == "required"):
+            return "PASS"
+        return None
+
+    def feed(self, data):
+        """Add output; returns the verdict once it is known (None until then)"""
+        if self.verdict is not None:
+            return self.verdict
+        found = False
+        if self.filter is not None:
+            window = self.carry + data
+            if self.filter.search(window):
+                for index in self.automaton.scan(window):
+                    if self.literals[index] not in self.seen:
+                        self.seen.add(self.literals[index])
+                        found = True
+            self.carry = window[-self.overlap:] if self.overlap else b""
+        if self.pending_lines:
+            lines = (self.partial + data).split(b"\n")
+            self.partial = lines.pop()[-MAX_LINE:]
+            found |= self._match_lines(lines)
+        if found:
+            self._prefilter()
+            self._decide()
+        return self.verdict
+
+    def _match_lines(self, lines):
+        found = False
+        for line in lines:
+            text = line[:MAX_LINE].decode("utf-8", errors="replace").rstrip("\r")
+            for pattern, compiled in self.pending_lines:
+                if pattern not in self.seen and compiled.search(text):
+                    self.seen.add(pattern)
+                    found = True
+        return found
+
+    def finish(self, text=""):
+        """End of output; `text` is the kept output for the whole-output regexes"""
+        if self.verdict is not None:
+            return self.verdict
+        if self.partial and self.pending_lines:
+            self._match_lines([self.partial])
+        for pattern, compiled in self.whole_regexes:
+            if compiled.search(text):
+                self.seen.add(pattern)
+        self._decide()
+        if self.verdict is None:
+            self.verdict = self._passed() or "FAIL"
+        if self.verdict == "FAIL" and not self.reason:
+            missing = [p for p, kind in self.kinds.items() if kind != "forbidden" and p not in self.seen]
+            self.reason = f"'{missing[0]}' not found in output" if len(missing) == 1 else \
+                f"{', '.join(repr(p) for p in missing)} not found in output"
+        return self.verdict
@@ -0,0 +1,201 @@
+"""
+Process supervision for student binaries.
+
+SupervisedProcess is a subprocess.Popen that always starts the program in a
+new session (start_new_session, done in Popen's C fork/exec path, so it is
+safe with evaluator threads running, unlike preexec_fn=os.setsid). On Linux
+it also holds a pidfd, so waiting for an exit is a single poll() on that
+descriptor instead of a sleep loop.
+
+stop() tears down the whole process tree, including the children of
+fork-per-client servers and anything that left the process group:
+
+1. snapshot the tree (process group members and /proc descendants)
+2. SIGTERM the group and wait up to `grace` for the leader to exit
+3. SIGKILL everything from the snapshot that is still there
+4. reap the leader and, where possible, the orphaned descendants
+
+The evaluator registers itself as a child subreaper, so orphans of a student
+program are reparented to it and reaped here instead of piling up as
+zombies in a long-lived container.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import signal
+import subprocess
+import time
+
+from eval_logging import get_logger
+
+logger = get_logger("supervisor")
+
+DEFAULT_GRACE = 1.0
+REAP_TIMEOUT = 1.0
+PR_SET_CHILD_SUBREAPER = 36
+
+_subreaper = None
+
+def become_subreaper():
+    """Adopt orphaned descendants (Linux only); True if this process is a subreaper"""
+    global _subreaper
+    if _subreaper is None:
+        _subreaper = False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            _subreaper = libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+        except (OSError, AttributeError, TypeError):
+            pass
+    return _subreaper
+
+def _process_table():
+    """(pid, ppid, pgid) of every visible process"""
+    table = []
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return table
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses; the fields follow the last ')'
+        fields = stat[stat.rfind(b")") + 2:].split()
+        if len(fields) >= 3:
+            table.append((int(name), int(fields[1]), int(fields[2])))
+    return table
+
+def process_tree(leader, pgid=None):
+    """Pids of the leader's process group and of all of its descendants"""
+    pgid = leader if pgid is None else pgid
+    table = _process_table()
+    members = {pid for pid, _, group in table if group == pgid}
+    members.add(leader)
+    children = {}
+    for pid, ppid, _ in table:
+        children.setdefault(ppid, []).append(pid)
+    stack = list(members)
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            if child not in members:
+                members.add(child)
+                stack.append(child)
+    members.discard(os.getpid())
+    return members
+
+def _signal(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _reap(pids, timeout=REAP_TIMEOUT):
+    """Collect exit statuses of killed orphans that were reparented to us"""
+    pending = set(pids)
+    deadline = time.monotonic() + timeout
+    while pending:
+        for pid in list(pending):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                pending.discard(pid)
+                continue
+            if done:
+                pending.discard(pid)
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(0.005)
+    return not pending
+
+def stop_descendants():
+    """SIGKILL every descendant of this process and reap the ones it adopted; returns their pids"""
+    pids = process_tree(os.getpid())
+    for pid in pids:
+        _signal(pid, signal.SIGKILL)
+    if pids and not _reap(pids):
+        logger.warning("Some of %d leftover descendants could not be reaped", len(pids))
+    return pids
+
+class SupervisedProcess(subprocess.Popen):
+    """Popen in its own session, with pidfd exit notification and tree teardown"""
+
+    def __init__(self, args, **kwargs):
+        kwargs.pop("preexec_fn", None)
+        kwargs["start_new_session"] = True
+        become_subreaper()
+        super().__init__(args, **kwargs)
+        self.pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                self.pidfd = os.pidfd_open(self.pid)
+            except OSError:
+                pass
+
+    def wait_exit(self, timeout):
+        """Wait up to `timeout` seconds for the process to exit; True once it has (and is reaped)"""
+        if self.returncode is not None:
+            return True
+        if self.pidfd is not None:
+            poller = select.poll()
+            poller.register(self.pidfd, select.POLLIN)
+            try:
+                poller.poll(max(0, int(timeout * 1000)))
+            except InterruptedError:
+                pass
+            return self.poll() is not None
+        try:
+            self.wait(timeout=timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
+    def stop(self, grace=DEFAULT_GRACE):
+        """Terminate the whole process tree; returns the leader's exit code"""
+        tree = process_tree(self.pid)
+        if self.returncode is None:
+            try:
+                os.killpg(self.pid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                _signal(self.pid, signal.SIGTERM)
+            if not self.wait_exit(grace) and grace:
+                logger.warning("Process %s ignored SIGTERM for %.1fs, killing it", self.pid, grace)
+        # Whatever survived, including children that changed their process group. Without the
+        # subreaper an orphan may already be reaped by init and its pid reused, so only current
+        # tree members are trusted then.
+        current = process_tree(self.pid)
+        survivors = (tree | current) if become_subreaper() else current
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        for pid in survivors:
+            if pid != self.pid:
+                _signal(pid, signal.SIGKILL)
+        if self.returncode is None:
+            try:
+                self.wait(timeout=REAP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.error("Process %s did not exit after SIGKILL", self.pid)
+        if not _reap(survivors - {self.pid}):
+            logger.warning("Some descendants of %s could not be reaped", self.pid)
+        self.close_pidfd()
+        return self.returncode
+
+    def close_pidfd(self):
+        pidfd, self.pidfd = getattr(self, "pidfd", None), None
+        if pidfd is not None:
+            try:
+                os.close(pidfd)
+            except OSError as e:
+                if e.errno != errno.EBADF:
+                    raise
+
+    def __del__(self):
+        self.close_pidfd()
+        super().__del__()
@@ -0,0 +1,435 @@
+"""
+Test-case plan compiler.
+
+A question's testCases JSON is validated once and turned into a TestPlan: an
+immutable tuple of CasePlan entries with defaults resolved, regular
+expressions checked, and the runner that the evaluator should dispatch to
+already chosen. Mistakes such as two mode flags on one case, an unknown
+matchType, a regex that does not compile or mismatched packets/acksExpected
+lists are reported per case before anything is compiled or started.
+
+The compiled plan is written in a compact JSON form to CN_EVAL_PLAN_DIR
+(default /tmp/cn_eval_plans), keyed by role and a hash of the test file
+contents, so the test data of each question version is validated once and
+every later evaluation loads the ready-made plan. The cache keeps the
+CN_EVAL_PLAN_KEEP (default 200) most recently used plans. One-shot test
+files, such as the single-case files the evaluator wrappers write, skip it
+(load_plan(..., cache=False), or --no-plan-cache on the evaluators).
+
+Authors can check a test file from the command line:
+
+    python3 test_plan.py testcases.json --role server
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import types
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+PLAN_SCHEMA_VERSION = 1
+DEFAULT_PLAN_DIR = "/tmp/cn_eval_plans"
+DEFAULT_PLAN_KEEP = 200
+
+MATCH_TYPES = ("exact", "contains", "regex", "datetime", "set", "in")
+# Rule kinds of a mock server's serverScript steps (client tests)
+SCRIPT_MATCH_TYPES = ("exact", "prefix", "contains", "regex")
+PROTOCOLS = ("tcp", "udp")
+TIME_MODES = ("real", "fast")
+
+# Mode flags in the order the evaluators have always checked them
+SERVER_MODES = (
+    "chatroom", "stopAndWait", "multiStep", "errorHandling", "connectionStorm",
+    "connectionReliability", "performance", "bulkTransfer", "udpBurst", "transcript",
+    "periodicPush", "concurrency", "http",
+)
+CLIENT_MODES = ("chatroom", "stopAndWait", "multiStep")
+
+# Expected JSON types of the fields the evaluators read
+FIELD_TYPES = {
+    "description": str, "points": (int, float), "priority": (int, float), "cache": bool,
+    "protocol": str, "input": (str, list), "expectedOutput": (str, list), "matchType": str,
+    "clientCount": int, "clientDelay": (int, float), "timeMode": str, "impairment": dict,
+    "periodicSend": bool, "interactive": bool, "steps": list, "chatMessages": list,
+    "packets": list, "acksExpected": list, "serverScript": list, "serverResponse": str,
+    "expectedFormula": str, "errorTests": list, "portPattern": str, "timeout": (int, float),
+    "connectionAttempts": int, "reconnectDelay": (int, float),
+    "messageSize": int, "numRequests": int, "concurrentClients": int, "maxResponseTime": (int, float),
+    "stormConnections": int, "connectionTimeout": (int, float), "stormProbe": str,
+    "halfOpenClients": int, "resetClients": int, "minSuccessRate": (int, float),
+    "maxConnectTime": (int, float),
+    "transferSize": int, "transferMode": str, "transferTimeout": (int, float),
+    "minThroughput": (int, float), "transferFile": str, "seed": int,
+    "datagramCount": int, "sendRate": (int, float), "burstSize": int, "datagramSize": int,
+    "drainTimeout": (int, float), "maxLossPercent": (int, float), "maxRtt": (int, float),
+    "fuzz": bool, "fuzzSeeds": list, "fuzzBudget": (int, float), "fuzzSessions": int,
+    "hangTimeout": (int, float), "maxInputSize": int, "maxStuck": int,
+    "serverOutput": (str, list), "serverOutputMatch": str,
+    "session": list, "replayCopies": int, "replyTimeout": (int, float), "replayTiming": str,
+    "pushInterval": (int, float), "pushCount": int, "pushTimeout": (int, float), "pushDelimiter": str,
+    "intervalTolerance": (int, float), "maxJitter": (int, float), "maxDrift": (int, float),
+    "minFairness": (int, float),
+    "idleClients": int, "slowReaders": int, "slowBytes": int, "maxStall": (int, float), "probeRequests": int,
+    "concurrencyLevels": list, "holdTime": (int, float), "expectedModel": (str, list),
+    "minParallelism": (int, float),
+    "httpRequests": list, "httpConnections": int, "httpRounds": int, "pipeline": int, "keepAlive": bool,
+    "httpTimeout": (int, float), "minRequestsPerSecond": (int, float), "maxP99": (int, float),
+    "expectAll": list, "forbidOutput": list, "outputMatch": str, "outputDetail": bool,
+}
+FIELD_TYPES.update({mode: bool for mode in SERVER_MODES})
+FIELD_TYPES["transcript"] = str
+
+# Numeric fields and their smallest sensible value
+NUMERIC_MINIMUMS = {
+    "clientCount": 1, "clientDelay": 0, "timeout": 0, "connectionAttempts": 1, "reconnectDelay": 0,
+    "messageSize": 1, "numRequests": 1, "concurrentClients": 1, "maxResponseTime": 0,
+    "stormConnections": 1, "connectionTimeout": 0, "halfOpenClients": 0, "resetClients": 0,
+    "minSuccessRate": 0, "maxConnectTime": 0, "transferSize": 1, "transferTimeout": 0,
+    "minThroughput": 0, "datagramCount": 1, "sendRate": 0, "burstSize": 1, "datagramSize": 1,
+    "drainTimeout": 0, "maxLossPercent": 0, "maxRtt": 0, "fuzzBudget": 0, "fuzzSessions": 1,
+    "hangTimeout": 0, "maxInputSize": 1, "maxStuck": 0, "replayCopies": 1, "replyTimeout": 0,
+    "pushInterval": 0, "pushCount": 1, "pushTimeout": 0, "intervalTolerance": 0, "maxJitter": 0, "maxDrift": 0,
+    "minFairness": 0, "idleClients": 0, "slowReaders": 0, "slowBytes": 1, "maxStall": 0, "probeRequests": 1,
+    "holdTime": 0, "minParallelism": 0, "httpConnections": 1, "httpRounds": 1, "pipeline": 1,
+    "httpTimeout": 0, "minRequestsPerSecond": 0, "maxP99": 0,
+}
+
+class PlanError(ValueError):
+    """A test case that cannot be run as written"""
+
+@dataclass(frozen=True)
+class CasePlan:
+    index: int
+    runner: str
+    protocol: str
+    client_count: int
+    client_delay: float
+    match_type: str
+    periodic: bool
+    testcase: types.MappingProxyType
+    warnings: Tuple[str, ...] = ()
+    error: Optional[str] = None
+
+@dataclass(frozen=True)
+class TestPlan:
+    role: str
+    version: str
+    cases: Tuple[CasePlan, ...] = field(default_factory=tuple)
+
+    def case(self, index):
+        """The plan of one test case; raises PlanError if it is invalid"""
+        try:
+            case = self.cases[index]
+        except IndexError:
+            raise PlanError(f"No test case {index} (plan has {len(self.cases)})")
+        if case.error:
+            raise PlanError(case.error)
+        return case
+
+def _check_type(name, value, errors):
+    expected = FIELD_TYPES[name]
+    # bool is an int subclass; a true/false count is always a mistake
+    if isinstance(value, bool) and expected is not bool:
+        errors.append(f"{name} must not be {json.dumps(value)}")
+    elif not isinstance(value, expected):
+        names = "/".join(t.__name__ for t in (expected if isinstance(expected, tuple) else (expected,)))
+        errors.append(f"{name} must be {names}, got {type(value).__name__}")
+
+def _check_regex(expected, where, errors):
+    try:
+        re.compile(expected)
+    except (re.error, TypeError) as e:
+        errors.append(f"{where} is not a valid regular expression: {e}")
+
+def _select_runner(testcase, role, protocol, errors):
+    modes = SERVER_MODES if role == "server" else CLIENT_MODES
+    enabled = [mode for mode in modes if testcase.get(mode)]
+    if len(enabled) > 1:
+        errors.append(f"conflicting modes {', '.join(enabled)}; set only one")
+    if enabled:
+        runner = enabled[0]
+        if runner == "udpBurst" and protocol != "udp":
+            errors.append("udpBurst requires protocol udp")
+        if runner in ("transcript", "concurrency", "http") and protocol != "tcp":
+            errors.append(f"{runner} requires protocol tcp")
+        return runner
+    return protocol
+
+def _validate_mode(testcase, role, runner, errors):
+    if runner == "stopAndWait":
+        packets = testcase.get("packets", ["pkt1", "pkt2", "pkt3"])
+        acks = testcase.get("acksExpected", ["ACK1", "ACK2", "ACK3"])
+        if len(packets) != len(acks):
+            errors.append(f"packets has {len(packets)} entries but acksExpected has {len(acks)}")
+    elif runner == "chatroom" and role == "server":
+        if len(testcase.get("chatMessages", ["Hello", "World"])) < 2:
+            errors.append("chatMessages needs at least two messages")
+    elif runner == "multiStep":
+        steps = testcase.get("steps", [])
+        if not steps:
+            errors.append("multiStep needs a non-empty steps list")
+        key = "input" if role == "server" else "expect"
+        for n, step in enumerate(steps):
+            if not isinstance(step, dict) or key not in step:
+                errors.append(f"steps[{n}] must be an object with '{key}'")
+    elif runner == "errorHandling":
+        if not all(isinstance(seed, str) for seed in testcase.get("fuzzSeeds", [])):
+            errors.append("fuzzSeeds must be a list of strings")
+    elif runner == "transcript":
+        try:
+            base64.b64decode(testcase["transcript"], validate=True)
+        except (binascii.Error, ValueError):
+            errors.append("transcript must be the base64 text written by transcript.py record")
+        if testcase.get("replayTiming", "fast") not in ("fast", "recorded"):
+            errors.append("replayTiming must be fast or recorded")
+    elif runner == "periodicPush":
+        if not testcase.get("pushInterval"):
+            errors.append("periodicPush needs a positive pushInterval")
+        if testcase.get("minFairness", 0) > 1:
+            errors.append("minFairness must be at most 1")
+        if testcase.get("pushDelimiter") == "":
+            errors.append("pushDelimiter must not be empty")
+    elif runner == "concurrency":
+        levels = testcase.get("concurrencyLevels", [1, 2, 4, 8])
+        if not levels or not all(isinstance(k, int) and not isinstance(k, bool) and k >= 1 for k in levels):
+            errors.append("concurrencyLevels must be a non-empty list of client counts")
+        expected = testcase.get("expectedModel", "concurrent")
+        models = ("concurrent", "iterative", "fork-per-client", "thread-per-client", "event-driven")
+        if any(model not in models for model in ([expected] if isinstance(expected, str) else expected)):
+            errors.append(f"expectedModel must be one of {', '.join(models)}")
+    elif runner == "http":
+        for n, request in enumerate(testcase.get("httpRequests", [])):
+            if not isinstance(request, dict):
+                errors.append(f"httpRequests[{n}] must be an object")
+                continue
+            if not str(request.get("path", "/")).startswith(("/", "*")):
+                errors.append(f"httpRequests[{n}].path must start with /")
+            if request.get("bodyMatch", "contains") not in ("contains", "exact", "regex"):
+                errors.append(f"httpRequests[{n}].bodyMatch must be contains, exact or regex")
+            elif request.get("bodyMatch") == "regex":
+                _check_regex(request.get("expectBody", ""), f"httpRequests[{n}].expectBody", errors)
+        if testcase.get("pipeline", 1) > 1 and testcase.get("keepAlive") is False:
+            errors.append("pipeline needs keepAlive")
+    elif runner == "bulkTransfer":
+        if testcase.get("transferMode", "echo") not in ("echo", "upload", "download"):
+            errors.append("transferMode must be echo, upload or download")
+
+def compile_case(testcase, index, role="server"):
+    """Validate one test case dict and build its CasePlan"""
+    errors, warnings = [], []
+    if not isinstance(testcase, dict):
+        return CasePlan(index, "invalid", "tcp", 1, 0.0, "contains", False, types.MappingProxyType({}),
+                        error=f"Test case {index} must be an object")
+
+    for name, value in testcase.items():
+        if name in FIELD_TYPES:
+            _check_type(name, value, errors)
+        elif not name.startswith("_"):
+            warnings.append(f"unknown field {name}")
+    for name, minimum in NUMERIC_MINIMUMS.items():
+        value = testcase.get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value < minimum:
+            errors.append(f"{name} must be at least {minimum}")
+
+    resolved = dict(testcase)
+    protocol = str(resolved.setdefault("protocol", "tcp")).lower()
+    resolved["protocol"] = protocol
+    if protocol not in PROTOCOLS:
+        errors.append(f"protocol must be one of {', '.join(PROTOCOLS)}")
+    resolved.setdefault("clientCount", 1)
+    resolved.setdefault("clientDelay", 0.2)
+    match_type = resolved.setdefault("matchType", "contains")
+    if match_type not in MATCH_TYPES:
+        errors.append(f"matchType must be one of {', '.join(MATCH_TYPES)}")
+    if resolved.get("timeMode") not in (None,) + TIME_MODES:
+        errors.append(f"timeMode must be one of {', '.join(TIME_MODES)}")
+
+    if resolved.get("serverOutputMatch") not in (None, "contains", "regex"):
+        errors.append("serverOutputMatch must be contains or regex")
+    elif resolved.get("serverOutputMatch") == "regex":
+        expected_output = resolved.get("serverOutput") or []
+        for n, pattern in enumerate([expected_output] if isinstance(expected_output, str) else expected_output):
+            _check_regex(pattern, f"serverOutput[{n}]", errors)
+    if resolved.get("outputMatch") not in (None, "contains", "regex"):
+        errors.append("outputMatch must be contains or regex")
+    for field in ("expectAll", "forbidOutput"):
+        for n, pattern in enumerate(resolved.get(field) or []):
+            if not isinstance(pattern, str):
+                errors.append(f"{field}[{n}] must be a string")
+            elif resolved.get("outputMatch") == "regex":
+                _check_regex(pattern, f"{field}[{n}]", errors)
+    if match_type == "regex" and "expectedOutput" in resolved:
+        _check_regex(resolved["expectedOutput"], "expectedOutput", errors)
+    for n, step in enumerate(resolved.get("steps") or []):
+        if isinstance(step, dict) and step.get("matchType", match_type) == "regex" and "expectedOutput" in step:
+            _check_regex(step["expectedOutput"], f"steps[{n}].expectedOutput", errors)
+
+    for n, step in enumerate(resolved.get("serverScript") or []):
+        if not isinstance(step, dict):
+            errors.append(f"serverScript[{n}] must be an object")
+            continue
+        step_match = step.get("matchType")
+        if step_match not in (None,) + SCRIPT_MATCH_TYPES:
+            errors.append(f"serverScript[{n}].matchType must be one of {', '.join(SCRIPT_MATCH_TYPES)}")
+        elif step_match == "regex" and isinstance(step.get("expect"), str):
+            _check_regex(step["expect"], f"serverScript[{n}].expect", errors)
+
+    for n, entry in enumerate(resolved.get("session") or []):
+        if not isinstance(entry, dict) or not any(key in entry for key in ("connect", "send", "close")):
+            errors.append(f"session[{n}] must be an object with connect, send or close")
+        elif not isinstance(entry.get("client", 0), int) or entry.get("client", 0) < 0:
+            errors.append(f"session[{n}].client must be a non-negative integer")
+
+    runner = _select_runner(resolved, role, protocol, errors)
+    if resolved.get("fuzz") and runner != "errorHandling":
+        errors.append("fuzz requires errorHandling")
+    if not errors:
+        try:
+            _validate_mode(resolved, role, runner, errors)
+        except TypeError as e:
+            errors.append(str(e))
+
+    return CasePlan(
+        index=index,
+        runner=runner,
+        protocol=protocol,
+        client_count=resolved["clientCount"],
+        client_delay=resolved["clientDelay"],
+        match_type=match_type,
+        periodic=bool(resolved.get("periodicSend")),
+        testcase=types.MappingProxyType(resolved),
+        warnings=tuple(warnings),
+        error=f"Invalid test case {index}: {'; '.join(errors)}" if errors else None,
+    )
+
+def _role_cases(test_data, role):
+    cases = test_data.get("testCases", []) if isinstance(test_data, dict) else []
+    if isinstance(cases, dict):
+        cases = cases.get(role, [])
+    if not isinstance(cases, list):
+        raise PlanError("testCases must be a list or an object with server/client lists")
+    return cases
+
+def compile_plan(test_data, role="server", version=""):
+    """Validate every test case of a test file and build the plan"""
+    return TestPlan(role, version, tuple(
+        compile_case(testcase, index, role) for index, testcase in enumerate(_role_cases(test_data, role))
+    ))
+
+def plan_to_json(plan):
+    """Compact serialized form of a plan"""
+    return json.dumps({
+        "schema": PLAN_SCHEMA_VERSION,
+        "role": plan.role,
+        "version": plan.version,
+        "cases": [
+            {"runner": case.runner, "testCase": dict(case.testcase), "warnings": list(case.warnings),
+             "error": case.error}
+            for case in plan.cases
+        ],
+    }, separators=(",", ":"))
+
+def plan_from_json(text):
+    """Rebuild a plan from plan_to_json output without validating it again"""
+    data = json.loads(text)
+    if data.get("schema") != PLAN_SCHEMA_VERSION:
+        raise PlanError("Cached plan has an old schema")
+    cases = []
+    for index, entry in enumerate(data["cases"]):
+        testcase = entry["testCase"]
+        cases.append(CasePlan(
+            index=index,
+            runner=entry["runner"],
+            protocol=testcase.get("protocol", "tcp"),
+            client_count=testcase.get("clientCount", 1),
+            client_delay=testcase.get("clientDelay", 0.2),
+            match_type=testcase.get("matchType", "contains"),
+            periodic=bool(testcase.get("periodicSend")),
+            testcase=types.MappingProxyType(testcase),
+            warnings=tuple(entry.get("warnings", ())),
+            error=entry.get("error"),
+        ))
+    return TestPlan(data["role"], data["version"], tuple(cases))
+
+def prune_plans(plan_dir, keep):
+    """Drop the least recently used cached plans beyond `keep`"""
+    try:
+        entries = sorted((os.path.join(plan_dir, name) for name in os.listdir(plan_dir)),
+                         key=os.path.getmtime, reverse=True)
+    except OSError:
+        return
+    for path in entries[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def load_plan(test_file, role="server", plan_dir=None, cache=True):
+    """Plan for a test file, compiled on first use and loaded from the plan cache afterwards
+
+    cache=False compiles the file without reading or writing the cache.
+    """
+    with open(test_file, "rb") as f:
+        raw = f.read()
+    version = hashlib.sha256(raw).hexdigest()[:32]
+    plan_dir = plan_dir or os.environ.get("CN_EVAL_PLAN_DIR", DEFAULT_PLAN_DIR)
+    plan_path = os.path.join(plan_dir, f"{role}_{version}.json")
+    if cache:
+        try:
+            with open(plan_path) as f:
+                plan = plan_from_json(f.read())
+            # Recently used plans survive pruning
+            os.utime(plan_path)
+            return plan
+        except (OSError, ValueError, KeyError):
+            pass
+
+    try:
+        test_data = json.loads(raw)
+    except ValueError as e:
+        raise PlanError(f"Test file is not valid JSON: {e}")
+    plan = compile_plan(test_data, role, version)
+    if not cache:
+        return plan
+    try:
+        os.makedirs(plan_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=plan_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(plan_to_json(plan))
+        os.replace(tmp_path, plan_path)
+    except OSError:
+        pass
+    prune_plans(plan_dir, int(os.environ.get("CN_EVAL_PLAN_KEEP", DEFAULT_PLAN_KEEP)))
+    return plan
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a CN Lab testCases file")
+    parser.add_argument("test_file", help="Testcases JSON file")
+    parser.add_argument("--role", choices=["server", "client"], default="server")
+    args = parser.parse_args()
+    try:
+        with open(args.test_file) as f:
+            plan = compile_plan(json.load(f), args.role)
+    except (OSError, ValueError) as e:
+        print(f"{args.test_file}: {e}")
+        sys.exit(1)
+    failed = False
+    for case in plan.cases:
+        label = case.testcase.get("description") or ""
+        if case.error:
+            failed = True
+            print(f"[{case.index}] ERROR {case.error}")
+        else:
+            print(f"[{case.index}] ok    runner={case.runner} {label}")
+        for warning in case.warnings:
+            print(f"[{case.index}] warn  {warning}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
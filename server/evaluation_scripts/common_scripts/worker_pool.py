@@ -0,0 +1,347 @@
+"""
+Pre-warmed evaluation workers.
+
+Every test case used to start a fresh Python that imported the evaluator
+modules from scratch. A pool daemon per role (server or client) keeps
+workers ready instead: it uses a multiprocessing forkserver with the
+evaluator modules preloaded, so a worker is a fork of an already-warm
+interpreter. Each worker runs a single job (maxtasksperchild=1) and is then
+replaced, so no state leaks from one submission into the next.
+
+The pool is sized to the container's CPU quota (cgroup v2 cpu.max or v1
+cfs quota, else the CPU affinity mask); CN_EVAL_POOL_SIZE overrides it.
+Jobs are sent over a Unix socket whose name includes a hash of the
+evaluator scripts, so uploading changed scripts starts a fresh pool while
+unchanged ones keep using the running one. An idle pool exits after
+CN_EVAL_POOL_IDLE seconds (default 900).
+
+The evaluator wrappers call run_evaluator(), which falls back to running
+the evaluator in a new process (and starts the pool for next time) if no
+pool accepts the connection. CN_EVAL_POOL=off disables the pool. A job
+that outlives its timeout raises subprocess.TimeoutExpired either way and
+never runs a second time: the worker stops it at the same deadline and
+kills every process it started, and the fallback tears down the
+evaluator's whole process tree, student programs included.
+
+    python3 worker_pool.py start server      # warm up in the background
+    python3 worker_pool.py status server
+"""
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+from supervisor import SupervisedProcess, stop_descendants
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_DIR = os.path.join(SCRIPTS_DIR, "common_scripts")
+
+# Evaluator entry point of each role and the modules its workers have preloaded
+ROLES = {
+    "server": {
+        "dir": os.path.join(SCRIPTS_DIR, "server_scripts"),
+        "module": "evaluate_server",
+        "preload": ["evaluate_server", "client_actions", "validators", "utils", "protocol_fuzzer",
+                    "transcript", "concurrency_probe", "http_load", "output_summary", "output_capture", "deadlines", "build_cache", "supervisor", "test_plan", "scheduler", "phase_timer", "net_impairment"],
+    },
+    "client": {
+        "dir": os.path.join(SCRIPTS_DIR, "client_scripts"),
+        "module": "evaluate_client",
+        "preload": ["evaluate_client", "test_servers", "mock_rules", "validators", "utils",
+                    "output_capture", "stream_match", "deadlines", "build_cache", "supervisor", "test_plan", "scheduler", "phase_timer", "net_impairment"],
+    },
+}
+
+DEFAULT_IDLE = 900
+CONNECT_TIMEOUT = 0.5
+MAX_REQUEST = 4 * 1024 * 1024
+# Time the pool gets past a job's deadline to stop it and send the reply
+REPLY_MARGIN = 5
+
+def cpu_quota():
+    """CPUs this container may use, as a float"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    try:
+        return float(len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return float(os.cpu_count() or 1)
+
+def pool_size():
+    configured = os.environ.get("CN_EVAL_POOL_SIZE")
+    if configured and configured.isdigit() and int(configured) > 0:
+        return int(configured)
+    return max(1, math.ceil(cpu_quota()))
+
+def scripts_version():
+    """Hash of the evaluator sources, so changed scripts get a fresh pool"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(SCRIPTS_DIR):
+        dirs[:] = sorted(d for d in dirs if d not in ("__pycache__", "benchmarks"))
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, SCRIPTS_DIR).encode())
+                try:
+                    with open(path, "rb") as f:
+                        digest.update(f.read())
+                except OSError:
+                    pass
+    return digest.hexdigest()[:12]
+
+def socket_path(role, version=None):
+    base = os.environ.get("CN_EVAL_POOL_DIR", "/tmp")
+    return os.path.join(base, f".cn_eval_pool-{role}-{version or scripts_version()}.sock")
+
+def pool_enabled():
+    return os.environ.get("CN_EVAL_POOL", "on").lower() not in ("off", "0", "false", "no")
+
+def _role_path(role):
+    return [ROLES[role]["dir"], COMMON_DIR]
+
+def _exit_code(code):
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+class JobTimeout(BaseException):
+    """Raised in a pool worker when its job runs past the caller's deadline"""
+
+def _expire(signum, frame):
+    raise JobTimeout()
+
+def run_job(role, args, cwd, env, deadline=None):
+    """Run one evaluation inside a pool worker; returns (exit code, stdout, stderr, timed out)"""
+    import importlib
+    from eval_logging import shutdown_logging
+
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(env)
+    module = importlib.import_module(ROLES[role]["module"])
+    out, err = io.StringIO(), io.StringIO()
+    sys.argv = [module.__file__] + list(args)
+    code, timed_out = 0, False
+    with redirect_stdout(out), redirect_stderr(err):
+        try:
+            try:
+                if deadline is not None:
+                    # The job may have waited in the queue; the caller's clock has been running
+                    signal.signal(signal.SIGALRM, _expire)
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise JobTimeout()
+                    signal.setitimer(signal.ITIMER_REAL, remaining)
+                module.main()
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except SystemExit as e:
+            code = _exit_code(e.code)
+        except JobTimeout:
+            code, timed_out = 1, True
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # Nothing the job started may outlive it, least of all after a timeout
+            stop_descendants()
+            # Pool workers leave through os._exit, which skips the atexit flush
+            shutdown_logging()
+    return code, out.getvalue(), err.getvalue(), timed_out
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST)
+        try:
+            request = json.loads(line)
+            if request.get("op") == "status":
+                reply = {"size": self.server.size, "busy": self.server.busy, "jobs": self.server.jobs}
+            else:
+                with self.server.lock:
+                    self.server.busy += 1
+                try:
+                    code, stdout, stderr, timed_out = self.server.pool.apply(
+                        run_job, (self.server.role, request["args"], request["cwd"], request["env"],
+                                  request.get("deadline")))
+                finally:
+                    with self.server.lock:
+                        self.server.busy -= 1
+                        self.server.jobs += 1
+                        self.server.last_job = time.monotonic()
+                reply = {"returncode": code, "stdout": stdout, "stderr": stderr, "timedOut": timed_out}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+class _PoolServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(role, idle=None):
+    """Run the pool daemon for one role until it has been idle for `idle` seconds"""
+    import multiprocessing
+
+    path = socket_path(role)
+    if _ping(path):
+        return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sys.path[:0] = _role_path(role)
+    # The forkserver does not inherit sys.path on every Python version; its preload needs the paths
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        _role_path(role) + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else []))
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(ROLES[role]["preload"])
+    size = pool_size()
+
+    old_umask = os.umask(0o077)
+    try:
+        server = _PoolServer(path, _JobHandler)
+    except OSError:
+        return  # Another daemon won the race for this socket
+    finally:
+        os.umask(old_umask)
+    server.role, server.size, server.busy, server.jobs = role, size, 0, 0
+    server.lock = threading.Lock()
+    server.last_job = time.monotonic()
+    idle = idle if idle is not None else float(os.environ.get("CN_EVAL_POOL_IDLE", DEFAULT_IDLE))
+
+    with ctx.Pool(processes=size, maxtasksperchild=1) as pool:
+        server.pool = pool
+        thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.5}, daemon=True)
+        thread.start()
+        try:
+            while server.busy or time.monotonic() - server.last_job < idle:
+                if not os.path.exists(path):
+                    break  # Socket removed: someone wants this pool gone
+                time.sleep(min(idle, 5))
+        finally:
+            server.shutdown()
+            server.server_close()
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+class PoolUnavailable(OSError):
+    """No pool accepted the connection; the job was never sent"""
+
+def _request(path, payload, timeout=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(CONNECT_TIMEOUT)
+        try:
+            s.connect(path)
+        except OSError as e:
+            raise PoolUnavailable(e.errno, f"No pool at {path}: {e}") from e
+        s.settimeout(timeout)
+        s.sendall(json.dumps(payload).encode() + b"\n")
+        with s.makefile("rb") as f:
+            reply = f.readline()
+    if not reply:
+        raise ConnectionError("Pool closed the connection")
+    return json.loads(reply)
+
+def _ping(path):
+    try:
+        _request(path, {"op": "status"}, timeout=CONNECT_TIMEOUT)
+        return True
+    except (OSError, ValueError):
+        return False
+
+def start_pool(role):
+    """Start the pool daemon in the background unless one is already answering"""
+    if _ping(socket_path(role)):
+        return False
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", role],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True, close_fds=True)
+    return True
+
+def run_evaluator(role, args, timeout=None, cwd=None):
+    """Run the role's evaluator with `args` in a warm worker, or in a new process if no pool answers
+
+    Raises subprocess.TimeoutExpired once `timeout` has passed; the evaluation and everything it
+    started has been stopped by then.
+    """
+    cwd = cwd or os.getcwd()
+    args = [str(a) for a in args]
+    if pool_enabled():
+        request = {"args": args, "cwd": cwd, "env": dict(os.environ)}
+        if timeout is not None:
+            request["deadline"] = time.time() + timeout
+        try:
+            reply = _request(socket_path(role), request, None if timeout is None else timeout + REPLY_MARGIN)
+        except PoolUnavailable:
+            reply = None
+            start_pool(role)
+        except socket.timeout:
+            # The job was submitted: running it again would only double the cost of a hung case
+            raise subprocess.TimeoutExpired(args, timeout) from None
+        if reply is not None and reply.get("timedOut"):
+            raise subprocess.TimeoutExpired(args, timeout, reply["stdout"], reply["stderr"])
+        if reply is not None and "error" not in reply:
+            return subprocess.CompletedProcess(args, reply["returncode"], reply["stdout"], reply["stderr"])
+    script = os.path.join(ROLES[role]["dir"], ROLES[role]["module"] + ".py")
+    # Its own session, so a timeout takes down the evaluator together with the student's programs
+    proc = SupervisedProcess([sys.executable, script] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             text=True, cwd=cwd)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.stop(grace=0)
+        proc.stdout.close()
+        proc.stderr.close()
+        raise
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="CN Lab evaluation worker pool")
+    parser.add_argument("command", choices=["serve", "start", "status", "stop"])
+    parser.add_argument("role", choices=sorted(ROLES))
+    args = parser.parse_args()
+    path = socket_path(args.role)
+    if args.command == "serve":
+        serve(args.role)
+    elif args.command == "start":
+        if pool_enabled():
+            start_pool(args.role)
+    elif args.command == "status":
+        try:
+            print(json.dumps(_request(path, {"op": "status"}, timeout=CONNECT_TIMEOUT)))
+        except (OSError, ValueError):
+            print("not running")
+            sys.exit(1)
+    else:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,13 @@ if os.path.exists(server_scripts_dir):
 else:
     print(f"Warning: {server_scripts_dir} not found")
 
+# Evaluations run in a pre-warmed worker pool when common_scripts/worker_pool.py is available
+sys.path.append(os.path.join(os.path.dirname(__file__), "common_scripts"))
+try:
+    from worker_pool import run_evaluator
+except ImportError:
+    run_evaluator = None
+
 def evaluate_server(server_src, test_case, num_clients=1, client_delay=0.5):
     """Delegate to the modular evaluate_server.py script"""
     
@@ -49,20 +56,28 @@ def evaluate_server(server_src, test_case, num_clients=1, client_delay=0.5):
             modular_script,
             server_src,
             temp_test_file,
-            "0"  # Test case index (always 0 since we're creating a single-test file)
+            "0",  # Test case index (always 0 since we're creating a single-test file)
+            "--no-plan-cache"  # A one-shot file: caching its plan would only fill the plan cache
         ]
         
         # Run the modular evaluation script
         print(f"Running modular evaluation: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        if run_evaluator is not None:
+            result = run_evaluator("server", cmd[2:])
+        else:
+            result = subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
           # Extract the result
         for line in result.stdout.splitlines():
-            if line.startswith("RESULT:"):
+            if line.startswith(("TIMING:", "FATAL:", "SERVER_OUTPUT:", "LIMITS:", "CLIENT_OUTPUTS:")):
+                # Pass phase timings, fail-fast causes, server output, limits and per-client detail
+                # through to the backend
+                print(line)
+            elif line.startswith("RESULT:"):
                 parts = line.split(":", 2)
                 if len(parts) >= 3:
                     # Extract actual output - find the real output rather than just status
@@ -1,110 +1,154 @@
+import errno
+import gc
+import hashlib
+import os
+import random
+import selectors
 import socket
+import struct
+import tempfile
 import threading
 import time
 from validators import validate_output
+from scheduler import scheduler_for
+from eval_logging import get_logger
+from protocol_fuzzer import run_fuzz
+from transcript import run_replay
+from concurrency_probe import characterize
+from http_load import run_http_load
+from deadlines import limits
+from output_summary import OutputSummary
+
+logger = get_logger("client_actions")
+
+BULK_CHUNK = 256 * 1024
+# Sent on every storm connection; only a reply proves the server accept()ed it
+DEFAULT_STORM_PROBE = "ping"
+
+def _raise_fd_limit(needed):
+    """Raise the soft open-file limit so large tests don't run out of sockets"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[rank]
+
+def _latency_summary(values):
+    """Format p50/p90/p99/max of a list of durations in seconds as milliseconds"""
+    values = sorted(values)
+    if not values:
+        return "no samples"
+    return (f"p50={_percentile(values, 50) * 1000:.2f}ms, p90={_percentile(values, 90) * 1000:.2f}ms, "
+            f"p99={_percentile(values, 99) * 1000:.2f}ms, max={values[-1] * 1000:.2f}ms")
 
 def run_tcp_clients(port, testcase, num_clients, client_delay, periodic=False):
-    results = []
     threads = []
-    actual_outputs = []  # Store actual server outputs
+    summary = OutputSummary(detail=testcase.get("outputDetail", False))
+    scheduler = scheduler_for(testcase)
+    connected = [threading.Event() for _ in range(num_clients)]
+    connect_timeout = limits().timeout("connect")
 
     def client_thread(idx):
         try:
-            s = socket.create_connection(('127.0.0.1', port), timeout=5)  # Increased timeout
+            try:
+                s = socket.create_connection(('127.0.0.1', port), timeout=connect_timeout)
+            finally:
+                connected[idx].set()
             for step in testcase.get("steps", [{"input": testcase.get("input", "")}]):
                 msg = step.get("input", "")
+                received = b""
                 if periodic:
                     # Periodically send message with retransmit logic
                     for _ in range(step.get("count", 3)):
                         s.sendall(msg.encode())
-                        time.sleep(step.get("interval", 1))
+                        if scheduler.wait_readable(s, step.get("interval", 1)) and scheduler.fast:
+                            # Consume the reply, or the next wait would end at once and the sends bunch up
+                            chunk = s.recv(4096)
+                            if not chunk:
+                                break
+                            received += chunk
                 else:
                     # Print the message being sent for debugging
-                    print(f"Client {idx} sending: '{msg}'")
+                    logger.debug("Client %d sending: '%s'", idx, msg)
                     s.sendall(msg.encode())
                     
                 # Read response
-                data = s.recv(4096).decode().strip()
-                print(f"Client {idx} received: '{data}'")
-                
-                # Save actual server output
-                actual_outputs.append(data)
+                data = (received or s.recv(4096)).decode().strip()
+                logger.debug("Client %d received: '%s'", idx, data)
                 
                 # Validate against expected
                 expected = step.get("expectedOutput", testcase.get("expectedOutput", ""))
                 match_type = step.get("matchType", testcase.get("matchType", "contains"))
                 valid, _ = validate_output(data, expected, match_type)
-                results.append((valid, data))
+                summary.add(idx, data, valid)
             s.close()
         except Exception as e:
             error_msg = f"Error: {e}"
-            print(f"Client {idx} error: {error_msg}")
-            results.append((False, error_msg))
-            actual_outputs.append(error_msg)
+            logger.warning("Client %d error: %s", idx, error_msg)
+            summary.add(idx, error_msg, False, type(e).__name__)
 
-    # Spawn concurrent clients
+    # Spawn concurrent clients; the next one starts once this one connected
     for i in range(num_clients):
         t = threading.Thread(target=client_thread, args=(i,))
         t.start()
         threads.append(t)
-        time.sleep(client_delay)
+        scheduler.wait_event(connected[i], client_delay)
     for t in threads:
         t.join()
 
-    # Compile the actual outputs for better reporting
-    output_summary = ", ".join(actual_outputs)
-    
-    if all(r[0] for r in results):
-        # Return PASS with the actual server output included
-        return "PASS", f"{output_summary}"
-    else:
-        # Return FAIL with details on what the server actually returned
-        failed_outputs = [r[1] for r in results if not r[0]]
-        return "FAIL", f"Server output: {output_summary}. Failed outputs: {failed_outputs}"
+    # Identical replies are counted once; the per-client record only when asked for
+    summary.report_detail()
+    return summary.message()
 
 def run_udp_clients(port, testcase, num_clients, client_delay):
-    results = []
     threads = []
-    actual_outputs = []  # Store actual server outputs
+    summary = OutputSummary(detail=testcase.get("outputDetail", False))
+    scheduler = scheduler_for(testcase)
+    sent = [threading.Event() for _ in range(num_clients)]
+    reply_timeout = limits().timeout("udp_reply")
 
     def client_thread(idx):
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.settimeout(5)  # Increase timeout
+            s.settimeout(reply_timeout)
             msg = testcase.get("input", "")
-            print(f"UDP Client {idx} sending: '{msg}'")
-            s.sendto(msg.encode(), ('127.0.0.1', port))
+            logger.debug("UDP Client %d sending: '%s'", idx, msg)
+            try:
+                s.sendto(msg.encode(), ('127.0.0.1', port))
+            finally:
+                sent[idx].set()
             data, _ = s.recvfrom(4096)
             data = data.decode().strip()
-            print(f"UDP Client {idx} received: '{data}'")
-            actual_outputs.append(data)
+            logger.debug("UDP Client %d received: '%s'", idx, data)
             valid, _ = validate_output(data, testcase.get("expectedOutput", ""), testcase.get("matchType", "contains"))
-            results.append((valid, data))
+            summary.add(idx, data, valid)
             s.close()
         except Exception as e:
             error_msg = f"Error: {e}"
-            print(f"UDP Client {idx} error: {error_msg}")
-            results.append((False, error_msg))
-            actual_outputs.append(error_msg)
+            logger.warning("UDP Client %d error: %s", idx, error_msg)
+            summary.add(idx, error_msg, False, type(e).__name__)
 
     for i in range(num_clients):
         t = threading.Thread(target=client_thread, args=(i,))
         t.start()
         threads.append(t)
-        time.sleep(client_delay)
+        scheduler.wait_event(sent[i], client_delay)
     for t in threads:
         t.join()
 
-    # Compile the actual outputs for better reporting
-    output_summary = ", ".join(actual_outputs)
-    
-    if all(r[0] for r in results):
-        # Return PASS with the actual server output included
-        return "PASS", f"{output_summary}"
-    else:
-        # Return FAIL with details on what the server actually returned
-        failed_outputs = [r[1] for r in results if not r[0]]
-        return "FAIL", f"Server output: {output_summary}. Failed outputs: {failed_outputs}"
+    # Identical replies are counted once; the per-client record only when asked for
+    summary.report_detail()
+    return summary.message()
 
 def run_chatroom_test(port, testcase):
     # Multiple clients join, each sends a message, all others should receive it
@@ -112,9 +156,10 @@ def run_chatroom_test(port, testcase):
     num_clients = len(client_msgs)
     received_msgs = [[] for _ in range(num_clients)]
     threads = []
+    reply_timeout = limits().timeout("reply")
 
     def chat_client(idx, mymsg):
-        s = socket.create_connection(('127.0.0.1', port), timeout=3)
+        s = socket.create_connection(('127.0.0.1', port), timeout=reply_timeout)
         s.sendall(mymsg.encode())
         for _ in range(num_clients - 1):
             data = s.recv(4096).decode().strip()
@@ -140,7 +185,7 @@ def run_stop_and_wait_test(port, testcase):
     # Simulate stop-and-wait protocol: client sends packets, waits for ack before next
     packets = testcase.get("packets", ["pkt1", "pkt2", "pkt3"])
     acks_expected = testcase.get("acksExpected", ["ACK1", "ACK2", "ACK3"])
-    s = socket.create_connection(('127.0.0.1', port), timeout=3)
+    s = socket.create_connection(('127.0.0.1', port), timeout=limits().timeout("reply"))
     for pkt, expected_ack in zip(packets, acks_expected):
         s.sendall(pkt.encode())
         ack = s.recv(4096).decode().strip()
@@ -153,7 +198,7 @@ def run_stop_and_wait_test(port, testcase):
 
 def run_multistep_test(port, testcase):
     # Multi-step protocol: sequence of input/expectedOutput
-    s = socket.create_connection(('127.0.0.1', port), timeout=3)
+    s = socket.create_connection(('127.0.0.1', port), timeout=limits().timeout("reply"))
     for step in testcase.get("steps", []):
         s.sendall(step.get("input", "").encode())
         data = s.recv(4096).decode().strip()
@@ -164,12 +209,13 @@ def run_multistep_test(port, testcase):
     s.close()
     return "PASS", "Multi-step protocol test passed"
 
-def run_error_handling_test(port, testcase):
+def run_error_handling_test(port, testcase, server=None):
     """
     Test how server handles error conditions and edge cases
     - Invalid commands
     - Malformed input
     - Boundary conditions
+    - With "fuzz": generated inputs seeded from errorTests (see protocol_fuzzer)
     """
     tests = testcase.get("errorTests", [
         {"input": "INVALID", "expectedOutput": "ERROR", "description": "Invalid command"},
@@ -177,7 +223,7 @@ def run_error_handling_test(port, testcase):
     ])
     
     results = []
-    s = socket.create_connection(('127.0.0.1', port), timeout=3)
+    s = socket.create_connection(('127.0.0.1', port), timeout=limits().timeout("reply"))
     
     for test in tests:
         try:
@@ -192,11 +238,39 @@ def run_error_handling_test(port, testcase):
     
     s.close()
     
-    if all(r[0] for r in results):
-        return "PASS", "Server handled all error conditions appropriately"
-    else:
+    if not all(r[0] for r in results):
         failed = [f"{r[1]}: got '{r[2]}'" for r in results if not r[0]]
         return "FAIL", f"Server failed to handle some error conditions: {failed}"
+    if testcase.get("fuzz"):
+        seeds = [test["input"] for test in tests] + list(testcase.get("fuzzSeeds", []))
+        return run_fuzz(port, testcase, seeds, server)
+    return "PASS", "Server handled all error conditions appropriately"
+
+def run_transcript_test(port, testcase):
+    """
+    Replay a golden transcript recorded from the reference server (see transcript.py)
+    - All recorded clients run concurrently ("replayCopies" times over)
+    - Replies are compared byte for byte as they arrive
+    """
+    return run_replay(port, testcase)
+
+def run_concurrency_test(port, testcase, server=None):
+    """
+    Characterize how the server handles clients held open at once (see concurrency_probe)
+    - Idle and slow-reading clients must not stall a new one
+    - Parallelism and latency are measured for growing numbers of clients
+    - The server is classified iterative/fork/thread/event-driven from its behaviour
+    """
+    return characterize(port, testcase, server)
+
+def run_http_test(port, testcase):
+    """
+    Send HTTP/1.1 requests and check the responses (see http_load)
+    - Concurrent keep-alive connections, optionally pipelined
+    - Status, headers and body are checked per request
+    - Requests/s and per-route latency percentiles are reported
+    """
+    return run_http_load(port, testcase)
 
 def run_connection_reliability_test(port, testcase):
     """
@@ -204,11 +278,15 @@ def run_connection_reliability_test(port, testcase):
     - Reconnection attempts
     - Connection flooding
     - Unexpected disconnects
+
+    Connections are opened one after another; use run_connection_storm_test
+    to check how a server copes with many simultaneous connects.
     """
     success_count = 0
     attempts = testcase.get("connectionAttempts", 5)
-    timeout = testcase.get("connectionTimeout", 1)
+    timeout = limits().timeout("connectionTimeout", testcase.get("connectionTimeout", 1))
     delay = testcase.get("reconnectDelay", 0.5)
+    scheduler = scheduler_for(testcase)
     
     for i in range(attempts):
         try:
@@ -218,7 +296,7 @@ def run_connection_reliability_test(port, testcase):
             success_count += 1
             
             # Short delay between reconnection attempts
-            time.sleep(delay)
+            scheduler.sleep(delay)
         except Exception as e:
             pass
     
@@ -240,24 +318,25 @@ def run_performance_test(port, testcase):
     """
     message_size = testcase.get("messageSize", 1024)
     num_requests = testcase.get("numRequests", 10)
-    max_response_time = testcase.get("maxResponseTime", 0.5)
+    max_response_time = limits().threshold("response_time", testcase.get("maxResponseTime"))
+    reply_timeout = limits().timeout("reply")
     concurrent_clients = testcase.get("concurrentClients", 5)
     
     results = []
     threads = []
     response_times = []
     
+    # Build the payload once and share it between all clients
+    message = b"X" * message_size
+
     def performance_client():
         try:
-            # Generate a message of specified size
-            message = "X" * message_size
-            
-            s = socket.create_connection(('127.0.0.1', port), timeout=3)
+            s = socket.create_connection(('127.0.0.1', port), timeout=reply_timeout)
             total_time = 0
             
             for _ in range(num_requests):
                 start_time = time.time()
-                s.sendall(message.encode())
+                s.sendall(message)
                 data = s.recv(4096)
                 end_time = time.time()
                 
@@ -293,4 +372,581 @@ def run_performance_test(port, testcase):
     if success_count == concurrent_clients:
         return "PASS", f"Performance test passed: avg={avg_response:.3f}s, min={min_response:.3f}s, max={max_response:.3f}s"
     else:
-        return "FAIL", f"Performance test failed: {success_count}/{concurrent_clients} clients succeeded, avg={avg_response:.3f}s"
\ No newline at end of file
+        return "FAIL", f"Performance test failed: {success_count}/{concurrent_clients} clients succeeded, avg={avg_response:.3f}s"
+
+def run_connection_storm_test(port, testcase):
+    """
+    Open many non-blocking connections at once from a single selector loop:
+    - Connect latency distribution
+    - Refused / reset / timed-out counts
+    - Time until every connection was served (answered the probe)
+    - Optional half-open (idle) and abrupt-RST clients mixed into the storm
+
+    A finished handshake only means the kernel queued the connection in the
+    listen backlog, not that the server accept()ed it. So every connection
+    sends a probe (stormProbe, else the case's input, else "ping") and counts
+    as served once it gets a reply. "stormProbe": "" opts out: connections
+    are then only counted as connected, and that count is reported but does
+    not decide the verdict.
+    """
+    total = testcase.get("stormConnections", 1000)
+    timeout = limits().timeout("connectionTimeout", testcase.get("connectionTimeout", 5))
+    probe = testcase.get("stormProbe", testcase.get("input") or DEFAULT_STORM_PROBE)
+    half_open = testcase.get("halfOpenClients", 0)
+    reset_clients = testcase.get("resetClients", 0)
+    min_success_rate = testcase.get("minSuccessRate", 80)
+    max_connect_time = testcase.get("maxConnectTime")
+    if max_connect_time is not None:
+        max_connect_time = limits().threshold("maxConnectTime", max_connect_time)
+    addr = ('127.0.0.1', port)
+    probe_bytes = probe.encode() if probe else None
+
+    _raise_fd_limit(total + half_open + reset_clients + 64)
+
+    # Half-open clients connect and then go silent, holding a server slot
+    idle_socks = []
+    for _ in range(half_open):
+        try:
+            idle_socks.append(socket.create_connection(addr, timeout=timeout))
+        except OSError:
+            pass
+
+    # Abrupt clients connect and immediately reset the connection
+    for _ in range(reset_clients):
+        try:
+            rs = socket.create_connection(addr, timeout=timeout)
+            rs.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            rs.close()
+        except OSError:
+            pass
+
+    sel = selectors.DefaultSelector()
+    connect_times = []
+    # "ok": answered the probe, or with no probe merely connected (handshake done)
+    counts = {"ok": 0, "refused": 0, "reset": 0, "timeout": 0, "error": 0}
+    last_accept = 0.0
+    pending = 0
+
+    start = time.perf_counter()
+    for _ in range(total):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(False)
+        err = s.connect_ex(addr)
+        if err not in (0, errno.EINPROGRESS, errno.EAGAIN):
+            counts["refused" if err == errno.ECONNREFUSED else "error"] += 1
+            s.close()
+            continue
+        sel.register(s, selectors.EVENT_WRITE, [time.perf_counter(), False])
+        pending += 1
+
+    deadline = start + timeout
+    while pending:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        for key, mask in sel.select(min(remaining, 0.1)):
+            s = key.fileobj
+            state = key.data
+            done = False
+            if not state[1]:
+                err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    counts["refused" if err == errno.ECONNREFUSED else "error"] += 1
+                    done = True
+                else:
+                    connect_times.append(time.perf_counter() - state[0])
+                    state[1] = True
+                    if probe_bytes is None:
+                        counts["ok"] += 1
+                        last_accept = time.perf_counter()
+                        done = True
+                    else:
+                        try:
+                            s.send(probe_bytes)
+                            sel.modify(s, selectors.EVENT_READ, state)
+                        except OSError:
+                            counts["reset"] += 1
+                            done = True
+            else:
+                try:
+                    data = s.recv(4096)
+                    if data:
+                        counts["ok"] += 1
+                        last_accept = time.perf_counter()
+                    else:
+                        counts["reset"] += 1
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    counts["reset"] += 1
+                done = True
+            if done:
+                sel.unregister(s)
+                s.close()
+                pending -= 1
+
+    # Whatever is still registered never completed within the deadline
+    for key in list(sel.get_map().values()):
+        counts["timeout"] += 1
+        key.fileobj.close()
+    sel.close()
+
+    # The server must still serve a fresh client after the storm
+    alive = True
+    try:
+        with socket.create_connection(addr, timeout=timeout) as hc:
+            if probe_bytes is not None:
+                hc.sendall(probe_bytes)
+                alive = bool(hc.recv(4096))
+    except OSError:
+        alive = False
+    for s in idle_socks:
+        s.close()
+
+    accept_span = (last_accept - start) if last_accept else 0.0
+    success_rate = counts["ok"] / total * 100 if total else 0.0
+    connect_times.sort()
+    p99 = _percentile(connect_times, 99)
+    outcome = "served" if probe_bytes is not None else "connected (handshake only, accept() not verified)"
+    summary = (f"{counts['ok']}/{total} {outcome} in {accept_span:.3f}s "
+               f"(refused={counts['refused']}, reset={counts['reset']}, timed_out={counts['timeout']}, "
+               f"errors={counts['error']}), connect {_latency_summary(connect_times)}")
+
+    if not alive:
+        return "FAIL", f"Server stopped responding after connection storm: {summary}"
+    if probe_bytes is not None and success_rate < min_success_rate:
+        return "FAIL", f"Connection storm failed with {success_rate:.1f}% success: {summary}"
+    if max_connect_time is not None and p99 > max_connect_time:
+        return "FAIL", f"Connection storm p99 connect time {p99:.3f}s exceeds {max_connect_time}s: {summary}"
+    if probe_bytes is None:
+        return "PASS", f"Connection storm passed: {summary}"
+    return "PASS", f"Connection storm passed with {success_rate:.1f}% success: {summary}"
+
+
+def _make_payload_file(path, size, seed=0):
+    """Write `size` bytes of reproducible pseudo-random data and return its sha256"""
+    block = random.Random(seed).randbytes(min(size, 1024 * 1024)) if size else b""
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = block[:remaining] if remaining < len(block) else block
+            f.write(chunk)
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def _send_file(sock, path):
+    """Stream a file to the socket with sendfile(), falling back to send()"""
+    with open(path, "rb") as f:
+        return sock.sendfile(f)
+
+def _recv_hashed(sock, limit=None):
+    """Receive until EOF (or `limit` bytes) hashing on the fly; returns (bytes, sha256)"""
+    digest = hashlib.sha256()
+    buf = bytearray(BULK_CHUNK)
+    view = memoryview(buf)
+    received = 0
+    while limit is None or received < limit:
+        want = BULK_CHUNK if limit is None else min(BULK_CHUNK, limit - received)
+        n = sock.recv_into(view[:want])
+        if n == 0:
+            break
+        digest.update(view[:n])
+        received += n
+    return received, digest.hexdigest()
+
+def run_bulk_transfer_test(port, testcase):
+    """
+    Stream a large payload through the server and verify it:
+    - echo: send the payload and hash the echoed stream while sending
+    - upload: send the payload, half-close, then check the server's reply
+    - download: request a file the evaluator wrote to disk and hash the stream
+    Reports sustained throughput per client.
+    """
+    size = testcase.get("transferSize", 10 * 1024 * 1024)
+    mode = testcase.get("transferMode", "echo")
+    clients = testcase.get("concurrentClients", 1)
+    timeout = limits().timeout("transferTimeout", testcase.get("transferTimeout", 60))
+    min_throughput = testcase.get("minThroughput")  # MB/s per client
+    request = testcase.get("input", "")
+    expected = testcase.get("expectedOutput", "")
+    match_type = testcase.get("matchType", "contains")
+
+    # Download labs serve a file from their working directory; others read from a temp file
+    if mode == "download":
+        payload_path = os.path.abspath(testcase.get("transferFile", "bulk_payload.bin"))
+    else:
+        fd, payload_path = tempfile.mkstemp(prefix="bulk_payload_")
+        os.close(fd)
+    payload_hash = _make_payload_file(payload_path, size, testcase.get("seed", 0))
+
+    results = []
+    lock = threading.Lock()
+
+    def bulk_client(idx):
+        try:
+            s = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            start = time.perf_counter()
+            if mode == "download":
+                if request:
+                    s.sendall(request.encode())
+                received, digest = _recv_hashed(s, size)
+                ok = received == size and digest == payload_hash
+                detail = f"received {received}/{size} bytes" + ("" if digest == payload_hash else ", hash mismatch")
+            elif mode == "upload":
+                sent = _send_file(s, payload_path)
+                s.shutdown(socket.SHUT_WR)
+                reply = s.recv(4096).decode(errors="replace").strip()
+                ok = sent == size and (not expected or validate_output(reply, expected, match_type)[0])
+                detail = f"sent {sent}/{size} bytes, reply '{reply[:80]}'"
+            else:
+                sender_error = []
+
+                def sender():
+                    try:
+                        _send_file(s, payload_path)
+                    except OSError as e:
+                        sender_error.append(e)
+
+                t = threading.Thread(target=sender, daemon=True)
+                t.start()
+                received, digest = _recv_hashed(s, size)
+                t.join(timeout)
+                ok = not sender_error and received == size and digest == payload_hash
+                detail = f"echoed {received}/{size} bytes" + ("" if digest == payload_hash else ", hash mismatch")
+                if sender_error:
+                    detail += f", send error: {sender_error[0]}"
+            elapsed = time.perf_counter() - start
+            s.close()
+            throughput = size / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+            if ok and min_throughput is not None and throughput < min_throughput:
+                ok = False
+                detail += f", {throughput:.1f} MB/s below {min_throughput} MB/s"
+            with lock:
+                results.append((ok, idx, detail, throughput))
+        except Exception as e:
+            with lock:
+                results.append((False, idx, f"Error: {e}", 0.0))
+
+    threads = []
+    wall_start = time.perf_counter()
+    for i in range(clients):
+        t = threading.Thread(target=bulk_client, args=(i,))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    try:
+        os.remove(payload_path)
+    except OSError:
+        pass
+
+    passed = [r for r in results if r[0]]
+    aggregate = size * len(passed) / wall / (1024 * 1024) if wall > 0 else 0.0
+    rates = sorted(r[3] for r in passed)
+    summary = (f"{len(passed)}/{clients} clients transferred {size} bytes ({mode}), "
+               f"aggregate {aggregate:.1f} MB/s")
+    if rates:
+        summary += f", per-client min={rates[0]:.1f} MB/s max={rates[-1]:.1f} MB/s"
+    if len(passed) == clients:
+        return "PASS", f"Bulk transfer passed: {summary}"
+    failed = [f"client {r[1]}: {r[2]}" for r in sorted(results, key=lambda r: r[1]) if not r[0]]
+    return "FAIL", f"Bulk transfer failed: {summary}. Failures: {failed}"
+
+
+def run_udp_burst_test(port, testcase):
+    """
+    UDP load test: every client socket sends sequenced datagrams at a target
+    rate, all from a single selector loop.
+    - Datagrams are "<seq>:<input>" padded to datagramSize and pre-encoded
+    - Sends go out in back-to-back batches of burstSize per socket
+    - Replies are matched by the leading sequence number
+    Reports loss %, duplicates, reordering and RTT percentiles.
+    """
+    num_clients = testcase.get("clientCount", 1)
+    count = testcase.get("datagramCount", 1000)
+    rate = testcase.get("sendRate", 1000)  # datagrams per second per client
+    burst = max(1, testcase.get("burstSize", 10))
+    size = testcase.get("datagramSize", 0)
+    drain_timeout = limits().timeout("drainTimeout", testcase.get("drainTimeout", 1.0))
+    max_loss = testcase.get("maxLossPercent", 1.0)
+    max_rtt = testcase.get("maxRtt")
+    if max_rtt is not None:
+        max_rtt = limits().threshold("maxRtt", max_rtt)
+    expected = testcase.get("expectedOutput", "")
+    match_type = testcase.get("matchType", "contains")
+    body = testcase.get("input", "").encode()
+    addr = ('127.0.0.1', port)
+
+    _raise_fd_limit(num_clients + 64)
+    sel = selectors.DefaultSelector()
+    clients = []
+    for idx in range(num_clients):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        s.connect(addr)
+        s.setblocking(False)
+        payloads = []
+        for seq in range(count):
+            data = b"%d:" % seq + body
+            if len(data) < size:
+                data += b"." * (size - len(data))
+            payloads.append(data)
+        state = {
+            "idx": idx, "sock": s, "payloads": payloads, "next": 0,
+            "sent_at": [0.0] * count, "seen": bytearray(count),
+            "highest": -1, "reordered": 0, "duplicates": 0, "bad": 0, "send_errors": 0,
+        }
+        sel.register(s, selectors.EVENT_READ, state)
+        clients.append(state)
+
+    rtts = []
+    received = 0
+    interval = burst / rate if rate else 0.0
+    start = time.perf_counter()
+    next_send = start
+    sending = True
+    drain_deadline = None
+
+    def read_replies(state):
+        nonlocal received
+        s = state["sock"]
+        while True:
+            try:
+                data = s.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # ICMP port unreachable surfaces here as ECONNREFUSED
+                state["send_errors"] += 1
+                return
+            now = time.perf_counter()
+            head, sep, rest = data.partition(b":")
+            try:
+                seq = int(head) if sep else -1
+            except ValueError:
+                seq = -1
+            if not 0 <= seq < count or state["sent_at"][seq] == 0.0:
+                state["bad"] += 1
+                continue
+            if state["seen"][seq]:
+                state["duplicates"] += 1
+                continue
+            state["seen"][seq] = 1
+            received += 1
+            rtts.append(now - state["sent_at"][seq])
+            if seq < state["highest"]:
+                state["reordered"] += 1
+            else:
+                state["highest"] = seq
+            if expected and not validate_output(data.decode(errors="replace").strip(), expected, match_type)[0]:
+                state["bad"] += 1
+
+    while True:
+        now = time.perf_counter()
+        if sending and now >= next_send:
+            # Batched send path: one tight loop of send() calls per socket
+            sending = False
+            for state in clients:
+                s, i = state["sock"], state["next"]
+                end = min(i + burst, count)
+                payloads, sent_at = state["payloads"], state["sent_at"]
+                while i < end:
+                    try:
+                        s.send(payloads[i])
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        state["send_errors"] += 1
+                    sent_at[i] = time.perf_counter()
+                    i += 1
+                state["next"] = i
+                if i < count:
+                    sending = True
+            next_send += interval
+            if not sending:
+                drain_deadline = time.perf_counter() + drain_timeout
+        if not sending and (received == num_clients * count or time.perf_counter() >= drain_deadline):
+            break
+        wait_until = next_send if sending else drain_deadline
+        for key, _ in sel.select(max(0.0, wait_until - time.perf_counter())):
+            read_replies(key.data)
+
+    elapsed = time.perf_counter() - start
+    sel.close()
+    for state in clients:
+        state["sock"].close()
+
+    total_sent = sum(state["next"] for state in clients)
+    loss = (1 - received / total_sent) * 100 if total_sent else 100.0
+    reordered = sum(state["reordered"] for state in clients)
+    duplicates = sum(state["duplicates"] for state in clients)
+    bad = sum(state["bad"] for state in clients)
+    errors = sum(state["send_errors"] for state in clients)
+    rtts.sort()
+    summary = (f"{received}/{total_sent} datagrams answered in {elapsed:.2f}s "
+               f"({total_sent / elapsed:.0f} sent/s), loss={loss:.2f}%, reordered={reordered}, "
+               f"duplicates={duplicates}, unexpected={bad}, errors={errors}, RTT {_latency_summary(rtts)}")
+
+    if loss > max_loss:
+        return "FAIL", f"UDP burst test failed: loss {loss:.2f}% above {max_loss}%: {summary}"
+    if bad:
+        return "FAIL", f"UDP burst test failed: {bad} replies did not match expected output: {summary}"
+    if max_rtt is not None and rtts and _percentile(rtts, 99) > max_rtt:
+        return "FAIL", f"UDP burst test failed: p99 RTT above {max_rtt}s: {summary}"
+    return "PASS", f"UDP burst test passed: {summary}"
+
+def _jain_index(values):
+    """Jain's fairness index: 1.0 when all values are equal, 1/n when one client gets everything"""
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    return total * total / (len(values) * squares) if squares else 1.0
+
+def run_periodic_push_test(port, testcase):
+    """
+    Push timing test for servers that send on their own schedule (time
+    servers, heartbeats):
+    - Every client connects, optionally sends "input" to subscribe, then only listens
+    - Each pushed message (a line, or a datagram for UDP) is timestamped with
+      perf_counter_ns right after it is read, from a single selector loop
+      with the garbage collector paused
+    - Per client: interval mean, jitter (standard deviation) and drift (how far
+      the last message is from where the schedule puts it)
+    - Across clients: Jain's fairness index of the message rates
+    The statistics are checked against intervalTolerance, maxJitter, maxDrift
+    and minFairness (seconds, defaults relative to pushInterval).
+    """
+    num_clients = testcase.get("clientCount", 1)
+    interval = testcase.get("pushInterval", 1.0)
+    count = testcase.get("pushCount", 10)  # intervals measured per client
+    tolerance = testcase.get("intervalTolerance", 0.1 * interval)
+    max_jitter = testcase.get("maxJitter", 0.2 * interval)
+    max_drift = testcase.get("maxDrift", 0.5 * interval)
+    min_fairness = testcase.get("minFairness", 0.9)
+    # A correct server needs count + 1 intervals to deliver count + 1 messages
+    timeout = max(interval * (count + 1),
+                  limits().timeout("pushTimeout", testcase.get("pushTimeout", interval * (count + 2) + 2)))
+    delimiter = testcase.get("pushDelimiter", "\n").encode()
+    expected = testcase.get("expectedOutput", "")
+    match_type = testcase.get("matchType", "contains")
+    subscribe = testcase.get("input", "").encode()
+    udp = testcase.get("protocol", "tcp") == "udp"
+    addr = ('127.0.0.1', port)
+
+    _raise_fd_limit(num_clients + 64)
+    sel = selectors.DefaultSelector()
+    clients = []
+    try:
+        for idx in range(num_clients):
+            if udp:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                s.connect(addr)
+            else:
+                s = socket.create_connection(addr, timeout=limits().timeout("reply"))
+            if subscribe:
+                s.sendall(subscribe)
+            s.setblocking(False)
+            state = {"idx": idx, "sock": s, "buffer": b"", "stamps": [], "bad": [], "closed": False}
+            sel.register(s, selectors.EVENT_READ, state)
+            clients.append(state)
+    except OSError as e:
+        sel.close()
+        for state in clients:
+            state["sock"].close()
+        return "FAIL", f"Periodic push test failed: client {len(clients)} could not subscribe: {e}"
+
+    def on_message(state, message, stamp):
+        if len(state["stamps"]) > count:
+            return
+        state["stamps"].append(stamp)
+        if expected and not validate_output(message.decode(errors="replace").strip(), expected, match_type)[0]:
+            state["bad"].append(message[:80])
+
+    def read_pushes(state):
+        s = state["sock"]
+        while True:
+            try:
+                data = s.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b""
+            stamp = time.perf_counter_ns()
+            if not data:
+                if not udp:
+                    state["closed"] = True
+                    sel.unregister(s)
+                return
+            if udp:
+                on_message(state, data, stamp)
+                continue
+            # Messages read in the same recv() arrived together and share its timestamp
+            state["buffer"] += data
+            *messages, state["buffer"] = state["buffer"].split(delimiter)
+            for message in messages:
+                on_message(state, message, stamp)
+
+    def done(state):
+        return len(state["stamps"]) > count or state["closed"]
+
+    deadline = time.perf_counter() + timeout
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while not all(done(state) for state in clients):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not sel.get_map():
+                break
+            for key, _ in sel.select(remaining):
+                read_pushes(key.data)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        sel.close()
+        for state in clients:
+            state["sock"].close()
+
+    interval_ns = interval * 1e9
+    short, bad, rates = [], [], []
+    worst = {"error": (0.0, None), "jitter": (0.0, None), "drift": (0.0, None)}
+    for state in clients:
+        stamps = state["stamps"]
+        if len(stamps) <= count:
+            short.append(f"client {state['idx']} got {len(stamps)}/{count + 1} messages"
+                         f"{' before the server closed it' if state['closed'] else ''}")
+            continue
+        if state["bad"]:
+            bad.append(f"client {state['idx']}: {state['bad'][0]!r}")
+        gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+        mean = sum(gaps) / len(gaps)
+        jitter = (sum((g - mean) ** 2 for g in gaps) / len(gaps)) ** 0.5
+        drift = (stamps[-1] - stamps[0]) - count * interval_ns
+        rates.append(1e9 / mean if mean else float("inf"))
+        for name, value in (("error", mean - interval_ns), ("jitter", jitter), ("drift", drift)):
+            if abs(value) >= abs(worst[name][0]):
+                worst[name] = (value, state["idx"])
+    if short:
+        return "FAIL", f"Periodic push test failed: {'; '.join(short[:5])} within {timeout:.1f}s"
+
+    fairness = _jain_index(rates)
+    mean_error, jitter, drift = (worst[name][0] / 1e9 for name in ("error", "jitter", "drift"))
+    summary = (f"{num_clients} clients x {count} intervals, target {interval * 1000:.1f}ms: "
+               f"worst mean error {mean_error * 1000:+.2f}ms (client {worst['error'][1]}), "
+               f"jitter {jitter * 1000:.2f}ms (client {worst['jitter'][1]}), "
+               f"drift {drift * 1000:+.2f}ms (client {worst['drift'][1]}), fairness {fairness:.3f}")
+
+    if bad:
+        return "FAIL", f"Periodic push test failed: unexpected messages from {'; '.join(bad[:3])}: {summary}"
+    if abs(mean_error) > tolerance:
+        return "FAIL", f"Periodic push test failed: interval off by more than {tolerance * 1000:.1f}ms: {summary}"
+    if jitter > max_jitter:
+        return "FAIL", f"Periodic push test failed: jitter above {max_jitter * 1000:.1f}ms: {summary}"
+    if abs(drift) > max_drift:
+        return "FAIL", f"Periodic push test failed: drift above {max_drift * 1000:.1f}ms: {summary}"
+    if fairness < min_fairness:
+        return "FAIL", f"Periodic push test failed: fairness below {min_fairness}: {summary}"
+    return "PASS", f"Periodic push test passed: {summary}"
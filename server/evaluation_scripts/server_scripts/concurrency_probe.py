@@ -0,0 +1,279 @@
+"""
+Concurrency characterization used by the "concurrency" mode.
+
+Clients started a client_delay apart let an iterative server pass most
+multi-client tests, so this mode looks at how the server behaves while
+several clients are held open at once.
+
+1. Stall probe: "idleClients" connections that never send, and
+   "slowReaders" that flood requests without ever reading the replies, are
+   opened first. A fresh active client then does "probeRequests" round
+   trips and must be answered within "maxStall" seconds.
+2. Scaling: for each K in "concurrencyLevels", K clients connect together,
+   send "input", hold the connection for "holdTime" seconds after the reply,
+   send it again and close, all driven from one selector loop. Effective
+   parallelism is K * wall(1) / wall(K): about 1 for a server that serves
+   one client at a time, about K for a concurrent one. The latency of the
+   first reply per level shows how waiting grows with K.
+3. While the largest level holds its connections, the server's process tree
+   (children) and thread count are sampled.
+
+The server is then classified as iterative, fork-per-client,
+thread-per-client or event-driven (concurrent in a single thread), with the
+numbers behind it. "expectedModel" ("concurrent" or one of the classes, or
+a list of them) and "minParallelism" decide the verdict.
+"""
+import errno
+import os
+import selectors
+import socket
+import time
+
+from eval_logging import get_logger
+from deadlines import limits
+from supervisor import process_tree
+from validators import validate_output
+
+logger = get_logger("concurrency_probe")
+
+DEFAULT_LEVELS = (1, 2, 4, 8)
+DEFAULT_HOLD = 0.2
+DEFAULT_MAX_STALL = 1.0
+DEFAULT_SLOW_BYTES = 4 * 1024 * 1024
+SAMPLE_INTERVAL = 0.02
+ITERATIVE_PARALLELISM = 1.5
+
+def _thread_count(pid):
+    try:
+        return len(os.listdir(f"/proc/{pid}/task"))
+    except OSError:
+        return 0
+
+class _TreeSampler:
+    """Peak number of child processes and of threads of the server while it is sampled"""
+
+    def __init__(self, server):
+        self.pid = server.proc.pid if server is not None else None
+        self.base_threads = _thread_count(self.pid) if self.pid else 0
+        self.peak_children = 0
+        self.peak_threads = self.base_threads
+        self.next_sample = 0.0
+
+    def sample(self, now):
+        if self.pid is None or now < self.next_sample:
+            return
+        self.next_sample = now + SAMPLE_INTERVAL
+        tree = process_tree(self.pid)
+        self.peak_children = max(self.peak_children, len(tree - {self.pid}))
+        self.peak_threads = max(self.peak_threads, _thread_count(self.pid))
+
+    @property
+    def extra_threads(self):
+        return self.peak_threads - self.base_threads
+
+def _connect(addr):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setblocking(False)
+    code = s.connect_ex(addr)
+    if code not in (0, errno.EINPROGRESS):
+        s.close()
+        raise OSError(code, os.strerror(code))
+    return s
+
+def _round_trip(s, payload, deadline):
+    """Send `payload` on a blocking-with-timeout socket and return (reply, latency) or (None, None)"""
+    start = time.perf_counter()
+    try:
+        s.settimeout(max(0.01, deadline - start))
+        s.sendall(payload)
+        data = s.recv(4096)
+    except OSError:
+        return None, None
+    return data, time.perf_counter() - start
+
+def stall_probe(addr, testcase):
+    """Is a new client served while idle clients and slow readers are connected?"""
+    idle = testcase.get("idleClients", 2)
+    slow = testcase.get("slowReaders", 1)
+    max_stall = limits().threshold("maxStall", testcase.get("maxStall", DEFAULT_MAX_STALL))
+    requests = testcase.get("probeRequests", 3)
+    payload = testcase.get("input", "ping\n").encode()
+    held = []
+    try:
+        for _ in range(idle):
+            held.append(_connect(addr))
+        for _ in range(slow):
+            s = _connect(addr)
+            held.append(s)
+            # Flood requests without reading until the socket buffers are full
+            writable = selectors.DefaultSelector()
+            writable.register(s, selectors.EVENT_WRITE)
+            sent, budget = 0, testcase.get("slowBytes", DEFAULT_SLOW_BYTES)
+            deadline = time.perf_counter() + max_stall
+            while sent < budget and time.perf_counter() < deadline:
+                if not writable.select(0.05):
+                    break
+                try:
+                    sent += s.send(payload * 64)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    break
+            writable.close()
+        # Give the server a moment to pick up the held connections first
+        time.sleep(0.05)
+        latencies = []
+        try:
+            active = socket.create_connection(addr, timeout=max_stall)
+        except OSError as e:
+            return False, (f"new client could not connect while {idle} idle and {slow} slow clients "
+                           f"were open: {e}"), []
+        with active:
+            for _ in range(requests):
+                reply, latency = _round_trip(active, payload, time.perf_counter() + max_stall)
+                if not reply:
+                    return False, (f"new client got no reply within {max_stall}s while {idle} idle and "
+                                   f"{slow} slow-reading clients were open"), latencies
+                latencies.append(latency)
+        return True, (f"served in {max(latencies) * 1000:.1f}ms with {idle} idle and {slow} slow clients "
+                      f"open"), latencies
+    finally:
+        for s in held:
+            s.close()
+
+def run_level(addr, testcase, k, sampler=None):
+    """K clients at once: request, hold the connection for holdTime, request again, close
+
+    A server that serves one connection at a time answers the first request of
+    client i only after the clients before it have closed, so its wall time
+    grows by about holdTime per client.
+    """
+    hold = testcase.get("holdTime", DEFAULT_HOLD)
+    payload = testcase.get("input", "ping\n").encode()
+    expected = testcase.get("expectedOutput")
+    match_type = testcase.get("matchType", "contains")
+    timeout = hold * k + limits().threshold("maxStall", testcase.get("maxStall", DEFAULT_MAX_STALL)) + 2
+    sel = selectors.DefaultSelector()
+    clients = []
+    bad = []
+    start = time.perf_counter()
+    try:
+        for idx in range(k):
+            s = socket.create_connection(addr, timeout=timeout)
+            s.setblocking(False)
+            state = {"idx": idx, "sock": s, "replies": 0, "first": None, "resend_at": None, "done": None}
+            sel.register(s, selectors.EVENT_READ, state)
+            clients.append(state)
+        for state in clients:
+            state["sock"].send(payload)
+        pending = k
+        deadline = start + timeout
+        while pending:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if sampler is not None:
+                sampler.sample(now)
+            for state in clients:
+                if state["resend_at"] is not None and now >= state["resend_at"]:
+                    state["resend_at"] = None
+                    try:
+                        state["sock"].send(payload)
+                    except OSError:
+                        pass  # The read side sees the closed connection
+            wake = min([state["resend_at"] for state in clients if state["resend_at"] is not None] + [deadline])
+            if sampler is not None:
+                wake = min(wake, now + SAMPLE_INTERVAL)
+            for key, _ in sel.select(max(0.0, wake - time.perf_counter())):
+                state = key.data
+                try:
+                    data = state["sock"].recv(4096)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    data = b""
+                now = time.perf_counter()
+                if data and expected and not validate_output(data.decode(errors="replace").strip(),
+                                                             expected, match_type)[0]:
+                    bad.append(data[:60])
+                if data and state["replies"] == 0:
+                    state["replies"] = 1
+                    state["first"] = now - start
+                    state["resend_at"] = now + hold
+                    continue
+                if data or state["replies"]:
+                    # Second reply, or the server closing after the first: this client is done
+                    state["done"] = now
+                # Close right away: a server serving one connection at a time moves on to the next
+                sel.unregister(state["sock"])
+                state["sock"].close()
+                pending -= 1
+    finally:
+        sel.close()
+        for state in clients:
+            state["sock"].close()
+    served = [state for state in clients if state["done"] is not None]
+    wall = (max(state["done"] for state in served) - start) if len(served) == k else timeout
+    return {"k": k, "wall": wall, "served": len(served), "bad": bad,
+            "first_replies": sorted(state["first"] for state in clients if state["first"] is not None)}
+
+def classify(parallelism, stalled, sampler):
+    """Serving model from the measured behaviour; pools are reported by their mechanism"""
+    if stalled or parallelism < ITERATIVE_PARALLELISM:
+        return "iterative"
+    if sampler.peak_children:
+        return "fork-per-client"
+    if sampler.peak_threads > 1:
+        return "thread-per-client"
+    return "event-driven"
+
+def _model_matches(model, expected):
+    expected = [expected] if isinstance(expected, str) else list(expected)
+    return model in expected or ("concurrent" in expected and model != "iterative")
+
+def characterize(port, testcase, server=None):
+    addr = ("127.0.0.1", port)
+    levels = sorted(set(testcase.get("concurrencyLevels", DEFAULT_LEVELS)) | {1})
+    expected_model = testcase.get("expectedModel", "concurrent")
+    max_k = levels[-1]
+
+    try:
+        served, probe_msg, _ = stall_probe(addr, testcase)
+    except OSError as e:
+        return "FAIL", f"Concurrency test failed: could not open the probe connections: {e}"
+
+    if server is not None and not server.alive():
+        return "FAIL", (f"Server exited with code {server.proc.returncode} during the stall probe "
+                        f"(a client closed with replies still unread): {probe_msg}")
+
+    sampler = _TreeSampler(server)
+    results = []
+    for k in levels:
+        try:
+            results.append(run_level(addr, testcase, k, sampler if k == max_k else None))
+        except OSError as e:
+            return "FAIL", f"Concurrency test failed: could not open {k} connections: {e}"
+    base = results[0]["wall"]
+    top = results[-1]
+    parallelism = max_k * base / top["wall"] if top["served"] == max_k and top["wall"] else 0.0
+    model = classify(parallelism, not served, sampler)
+
+    levels_summary = ", ".join(
+        f"K={r['k']}: {r['served']}/{r['k']} served in {r['wall'] * 1000:.0f}ms"
+        + (f" (slowest first reply {r['first_replies'][-1] * 1000:.0f}ms)" if r["first_replies"] else "")
+        for r in results
+    )
+    evidence = (f"parallelism {parallelism:.2f} at K={max_k}, peak {sampler.peak_children} child processes, "
+                f"{sampler.peak_threads} threads (+{sampler.extra_threads}); stall probe: {probe_msg}; "
+                f"{levels_summary}")
+    logger.info("Concurrency characterization: %s (%s)", model, evidence)
+
+    bad = [reply for r in results for reply in r["bad"]]
+    if bad:
+        return "FAIL", f"Concurrency test failed: unexpected replies {bad[:3]}; classified {model}: {evidence}"
+    if not _model_matches(model, expected_model):
+        return "FAIL", f"Server behaves {model}, expected {expected_model}: {evidence}"
+    min_parallelism = testcase.get("minParallelism")
+    if min_parallelism is not None and parallelism < min_parallelism:
+        return "FAIL", f"Parallelism {parallelism:.2f} below {min_parallelism} ({model}): {evidence}"
+    return "PASS", f"Server behaves {model}: {evidence}"
@@ -1,74 +1,160 @@
 import argparse
-import json
+import os
 import sys
+
+# Shared evaluator modules live next to this directory in common_scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common_scripts"))
+
 from utils import (
-    find_free_port, modify_server_port, compile_program, wait_for_server, start_server, stop_server
+    find_free_port, modify_server_port, compile_program, wait_for_server, start_server, stop_server, ServerHandle
 )
 from client_actions import (
     run_tcp_clients, run_udp_clients, run_chatroom_test, run_stop_and_wait_test, run_multistep_test,
-    run_error_handling_test, run_connection_reliability_test, run_performance_test
+    run_error_handling_test, run_connection_reliability_test, run_performance_test,
+    run_connection_storm_test, run_bulk_transfer_test, run_udp_burst_test, run_transcript_test,
+    run_periodic_push_test, run_concurrency_test, run_http_test
 )
 from validators import validate_output
+from net_impairment import start_impairment_proxy
+from scheduler import scheduler_for
+from eval_logging import setup_logging
+from phase_timer import PhaseTimer
+from fail_fast import report_fatal, is_compiler_error, COMPILE_ERROR, NO_BIND, SERVER_CRASHED
+from test_plan import load_plan, PlanError
+from output_capture import report_output
+from deadlines import report_limits
+from build_cache import cached_build
+
+# Client-side test for each plan runner
+RUNNERS = {
+    "chatroom": lambda port, case: run_chatroom_test(port, case.testcase),
+    "stopAndWait": lambda port, case: run_stop_and_wait_test(port, case.testcase),
+    "multiStep": lambda port, case: run_multistep_test(port, case.testcase),
+    "errorHandling": lambda port, case, server=None: run_error_handling_test(port, case.testcase, server),
+    "connectionStorm": lambda port, case: run_connection_storm_test(port, case.testcase),
+    "connectionReliability": lambda port, case: run_connection_reliability_test(port, case.testcase),
+    "performance": lambda port, case: run_performance_test(port, case.testcase),
+    "bulkTransfer": lambda port, case: run_bulk_transfer_test(port, case.testcase),
+    "udpBurst": lambda port, case: run_udp_burst_test(port, case.testcase),
+    "transcript": lambda port, case: run_transcript_test(port, case.testcase),
+    "periodicPush": lambda port, case: run_periodic_push_test(port, case.testcase),
+    "concurrency": lambda port, case, server=None: run_concurrency_test(port, case.testcase, server),
+    "http": lambda port, case: run_http_test(port, case.testcase),
+    "udp": lambda port, case: run_udp_clients(port, case.testcase, case.client_count, case.client_delay),
+    "tcp": lambda port, case: run_tcp_clients(port, case.testcase, case.client_count, case.client_delay,
+                                              case.periodic),
+}
 
 def main():
     parser = argparse.ArgumentParser(description="Universal CN Lab Server Evaluator")
     parser.add_argument("server_file", help="Server source code (C)")
     parser.add_argument("test_file", help="Testcases JSON file")
     parser.add_argument("test_idx", type=int, help="Testcase index")
+    parser.add_argument("--profile", choices=["cpu", "memory", "all"], default=None,
+                        help="Profile the evaluation (also CN_EVAL_PROFILE)")
+    parser.add_argument("--build-dir", default=os.environ.get("CN_EVAL_BUILD_DIR"),
+                        help="Share compiled builds between evaluations (see build_cache.py)")
+    parser.add_argument("--no-plan-cache", action="store_true",
+                        help="Compile the test file without the plan cache (one-shot test files)")
     args = parser.parse_args()
+    setup_logging("evaluate_server")
+    timer = PhaseTimer(args.profile)
 
-    # Load testcase
-    with open(args.test_file, "r") as f:
-        data = json.load(f)
-    testcase = data["testCases"][args.test_idx]
+    def finish(status, msg):
+        timer.emit()
+        report_limits()
+        print(f"RESULT:{status}:{msg}")
+        sys.exit(0 if status == "PASS" else 1)
 
-    protocol = testcase.get("protocol", "tcp")
-    client_count = testcase.get("clientCount", 1)
-    client_delay = testcase.get("clientDelay", 0.2)
-    chatroom = testcase.get("chatroom", False)
-    stop_and_wait = testcase.get("stopAndWait", False)
-    multistep = testcase.get("multiStep", False)
-    periodic = testcase.get("periodicSend", False)
-    error_handling = testcase.get("errorHandling", False)
-    connection_reliability = testcase.get("connectionReliability", False)
-    performance = testcase.get("performance", False)
+    # Load the validated plan for this testcase
+    with timer.phase("plan_load"):
+        try:
+            case = load_plan(args.test_file, "server", cache=not args.no_plan_cache).case(args.test_idx)
+        except (OSError, PlanError) as e:
+            case = None
+            plan_error = str(e)
+    if case is None:
+        finish("FAIL", plan_error)
+    testcase = case.testcase
+    protocol = case.protocol
 
-    # Find free port and patch server code
-    port = find_free_port()
-    modify_server_port(args.server_file, port)
-    success, _, stderr = compile_program(args.server_file)
+    # Find free port and patch server code, or take both from a shared build
+    if args.build_dir:
+        with timer.phase("compile"):
+            success, port, stderr = cached_build(args.server_file, args.build_dir, "server_exec",
+                                                 find_free_port, modify_server_port, compile_program)
+    else:
+        with timer.phase("port_patch"):
+            port = find_free_port()
+            modify_server_port(args.server_file, port)
+        with timer.phase("compile"):
+            success, _, stderr = compile_program(args.server_file)
     if not success:
-        print(f"RESULT:FAIL:Compilation failed: {stderr.decode()}")
-        sys.exit(1)
+        if is_compiler_error(stderr):
+            report_fatal(COMPILE_ERROR, stderr.decode(errors="replace"))
+        finish("FAIL", f"Compilation failed: {stderr.decode()}")
+
+    # Start server, watching its output for the lines the test case expects it to print
+    expected_output = testcase.get("serverOutput") or []
+    if isinstance(expected_output, str):
+        expected_output = [expected_output]
+    watch_regex = testcase.get("serverOutputMatch") == "regex"
+    with timer.phase("server_start"):
+        try:
+            server_proc = start_server(port, watch=expected_output, watch_regex=watch_regex)
+        except RuntimeError as e:
+            server_proc = None
+            start_error = str(e)
+    if server_proc is None:
+        report_fatal(NO_BIND, start_error)
+        finish("FAIL", start_error)
+    scheduler = scheduler_for(testcase)
+    with timer.phase("readiness_wait"):
+        ready = wait_for_server(port, protocol=protocol, check_interval=scheduler.poll_interval(0.2),
+                                proc=server_proc)
+    if not ready:
+        exited = server_proc.poll() is not None
+        with timer.phase("teardown"):
+            stop_server(server_proc)
+        if exited:
+            start_error = (f"Server failed to start (exit code {server_proc.returncode}): "
+                           f"{server_proc.output.text('stderr', tail=0)[:500]}")
+        else:
+            start_error = "Server failed to start or bind to port"
+        report_output(server_proc.output)
+        report_fatal(NO_BIND, start_error)
+        finish("FAIL", start_error)
+
+    # Fuzzing restarts the server after a crash to replay and shrink the input; the
+    # concurrency mode samples its process tree
+    server = ServerHandle(server_proc, port, protocol, watch=expected_output, watch_regex=watch_regex)
+    extra = {"server": server} if testcase.get("fuzz") or case.runner == "concurrency" else {}
 
-    # Start server
-    server_proc = start_server(port)
-    if not wait_for_server(port, protocol=protocol):
-        stop_server(server_proc)
-        print("RESULT:FAIL:Server failed to start or bind to port")
-        sys.exit(1)
+    # Optionally put an impairment proxy between the test clients and the server
+    proxy = None
+    if testcase.get("impairment"):
+        with timer.phase("proxy_start"):
+            proxy_port = find_free_port()
+            proxy = start_impairment_proxy(proxy_port, port, protocol, testcase["impairment"])
+        port = proxy_port
 
     try:
-        if chatroom:
-            status, msg = run_chatroom_test(port, testcase)
-        elif stop_and_wait:
-            status, msg = run_stop_and_wait_test(port, testcase)
-        elif multistep:
-            status, msg = run_multistep_test(port, testcase)
-        elif error_handling:
-            status, msg = run_error_handling_test(port, testcase)
-        elif connection_reliability:
-            status, msg = run_connection_reliability_test(port, testcase)
-        elif performance:
-            status, msg = run_performance_test(port, testcase)
-        elif protocol == "udp":
-            status, msg = run_udp_clients(port, testcase, client_count, client_delay)
-        else:  # default TCP
-            status, msg = run_tcp_clients(port, testcase, client_count, client_delay, periodic)
+        with timer.phase("client_run"):
+            status, msg = RUNNERS[case.runner](port, case, **extra)
     finally:
-        stop_server(server_proc)
-    print(f"RESULT:{status}:{msg}")
-    sys.exit(0 if status == "PASS" else 1)
+        crashed = not server.alive()
+        with timer.phase("teardown"):
+            if proxy:
+                proxy.stop()
+            stop_server(server.proc)
+    missing = server.proc.output.missing()
+    if status == "PASS" and missing:
+        status, msg = "FAIL", f"Server never printed {missing}"
+    if status != "PASS":
+        report_output(server.proc.output)
+    if crashed and status != "PASS":
+        report_fatal(SERVER_CRASHED, f"Server exited with code {server.proc.returncode} during the test")
+    finish(status, msg)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
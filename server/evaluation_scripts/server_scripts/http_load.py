@@ -0,0 +1,432 @@
+"""
+HTTP/1.1 test runner for the web-server labs ("http" mode).
+
+Responses are parsed incrementally as bytes arrive: status line, headers,
+then a body delimited by Content-Length, chunked transfer coding (with
+trailers) or the connection closing. HEAD requests and 1xx/204/304
+responses have no body.
+
+"httpRequests" lists the requests. Each one may check the status, headers
+and body of its response:
+
+    {"method": "GET", "path": "/index.html", "expectStatus": 200,
+     "expectHeaders": {"content-type": "text/html"}, "expectBody": "<h1>", "bodyMatch": "contains"}
+
+"httpConnections" connections each go through the list "httpRounds" times,
+all from one selector loop. Connections are kept alive ("keepAlive", default
+true) and up to "pipeline" requests are sent before the first response is
+read. A server that answers with Connection: close or closes the socket is
+reconnected to transparently, and requests it had not answered yet are sent
+again. A connection closed before it answered anything fails its first
+request instead, so a server that closes every connection cannot keep the
+run reconnecting. The run stops once no response has arrived for
+"httpTimeout" seconds.
+
+The report has requests/s, the number of connections that had to be opened
+and latency percentiles per route ("name", default "METHOD path"). The
+response checks, "minRequestsPerSecond" and "maxP99" decide the verdict.
+"""
+import re
+import selectors
+import socket
+import time
+from collections import deque
+
+from eval_logging import get_logger
+from deadlines import limits
+
+logger = get_logger("http_load")
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+RECV_SIZE = 64 * 1024
+DEFAULT_TIMEOUT = 5.0
+MAX_FAILURES = 5
+
+class HTTPParseError(ValueError):
+    """A response that is not valid HTTP/1.x"""
+
+class Response:
+    __slots__ = ("version", "status", "reason", "headers", "body", "trailers")
+
+    def __init__(self, version, status, reason, headers):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = b""
+        self.trailers = {}
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in connection
+        return "close" not in connection
+
+def _parse_headers(lines):
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(b":")
+        if not sep or not name or name != name.strip():
+            raise HTTPParseError(f"malformed header line {bytes(line[:80])!r}")
+        key = name.decode("latin-1").lower()
+        value = value.strip().decode("latin-1")
+        headers[key] = f"{headers[key]}, {value}" if key in headers else value
+    return headers
+
+class ResponseParser:
+    """Incremental HTTP/1.x response parser for one connection"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.state = "status"
+        self.response = None
+        self.remaining = 0
+
+    def _no_body(self, method):
+        status = self.response.status
+        return method == "HEAD" or 100 <= status < 200 or status in (204, 304)
+
+    def _start_body(self, method):
+        headers = self.response.headers
+        if self._no_body(method):
+            return "done"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            return "chunk_size"
+        if "content-length" in headers:
+            try:
+                lengths = {int(v) for v in headers["content-length"].split(",")}
+            except ValueError:
+                raise HTTPParseError(f"bad Content-Length {headers['content-length']!r}")
+            if len(lengths) != 1 or min(lengths) < 0:
+                raise HTTPParseError(f"bad Content-Length {headers['content-length']!r}")
+            self.remaining = lengths.pop()
+            if self.remaining > MAX_BODY_BYTES:
+                raise HTTPParseError(f"body of {self.remaining} bytes is too large")
+            return "body" if self.remaining else "done"
+        return "until_close"
+
+    def feed(self, data, methods):
+        """Add received bytes; returns the responses completed, consuming one of `methods` each"""
+        self.buf += data
+        done = []
+        while True:
+            if self.state == "status":
+                end = self.buf.find(b"\r\n\r\n")
+                if end < 0:
+                    if len(self.buf) > MAX_HEADER_BYTES:
+                        raise HTTPParseError("response header section is too large")
+                    return done
+                lines = bytes(self.buf[:end]).split(b"\r\n")
+                del self.buf[:end + 4]
+                match = re.match(rb"(HTTP/1\.[01]) (\d{3})(?: (.*))?$", lines[0])
+                if not match:
+                    raise HTTPParseError(f"bad status line {lines[0][:80]!r}")
+                self.response = Response(match.group(1).decode(), int(match.group(2)),
+                                         (match.group(3) or b"").decode("latin-1"), _parse_headers(lines[1:]))
+                if not methods:
+                    raise HTTPParseError("response without a request")
+                self.state = self._start_body(methods[0])
+            elif self.state == "body":
+                take = min(self.remaining, len(self.buf))
+                self.response.body += bytes(self.buf[:take])
+                del self.buf[:take]
+                self.remaining -= take
+                if self.remaining:
+                    return done
+                self.state = "done"
+            elif self.state == "chunk_size":
+                end = self.buf.find(b"\r\n")
+                if end < 0:
+                    return done
+                size_text = bytes(self.buf[:end]).split(b";")[0].strip()
+                del self.buf[:end + 2]
+                try:
+                    self.remaining = int(size_text, 16)
+                except ValueError:
+                    raise HTTPParseError(f"bad chunk size {size_text[:20]!r}")
+                if len(self.response.body) + self.remaining > MAX_BODY_BYTES:
+                    raise HTTPParseError("chunked body is too large")
+                self.state = "chunk_data" if self.remaining else "trailers"
+            elif self.state == "chunk_data":
+                if len(self.buf) < self.remaining + 2:
+                    return done
+                if self.buf[self.remaining:self.remaining + 2] != b"\r\n":
+                    raise HTTPParseError("chunk data is not followed by CRLF")
+                self.response.body += bytes(self.buf[:self.remaining])
+                del self.buf[:self.remaining + 2]
+                self.state = "chunk_size"
+            elif self.state == "trailers":
+                if self.buf[:2] == b"\r\n":
+                    del self.buf[:2]
+                    self.state = "done"
+                    continue
+                end = self.buf.find(b"\r\n\r\n")
+                if end < 0:
+                    return done
+                self.response.trailers = _parse_headers(bytes(self.buf[:end]).split(b"\r\n"))
+                del self.buf[:end + 4]
+                self.state = "done"
+            elif self.state == "until_close":
+                self.response.body += bytes(self.buf)
+                self.buf.clear()
+                if len(self.response.body) > MAX_BODY_BYTES:
+                    raise HTTPParseError("body is too large")
+                return done
+            if self.state == "done":
+                done.append(self.response)
+                methods.popleft()
+                self.response = None
+                self.state = "status"
+
+    def eof(self, methods):
+        """The server closed the connection; returns a close-delimited response if one was pending"""
+        if self.state == "until_close":
+            response = self.response
+            methods.popleft()
+            self.response, self.state = None, "status"
+            return response
+        if self.state != "status" or self.buf:
+            raise HTTPParseError(f"connection closed in the middle of a response ({self.state})")
+        return None
+
+class RequestSpec:
+    """One entry of httpRequests, encoded once for every connection"""
+
+    def __init__(self, entry, port, keep_alive):
+        self.method = entry.get("method", "GET").upper()
+        self.path = entry.get("path", "/")
+        self.name = entry.get("name") or f"{self.method} {self.path}"
+        self.expect_status = entry.get("expectStatus", 200)
+        self.expect_headers = {k.lower(): str(v) for k, v in entry.get("expectHeaders", {}).items()}
+        self.expect_body = entry.get("expectBody")
+        self.body_match = entry.get("bodyMatch", "contains")
+        body = entry.get("body", "").encode()
+        headers = {"Host": f"127.0.0.1:{port}", "User-Agent": "cn-lab-evaluator"}
+        if body or self.method in ("POST", "PUT", "PATCH"):
+            headers["Content-Length"] = str(len(body))
+        if not keep_alive:
+            headers["Connection"] = "close"
+        headers.update(entry.get("headers", {}))
+        head = f"{self.method} {self.path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        self.wire = (head + "\r\n").encode("latin-1") + body
+
+    def check(self, response):
+        """None if the response is what the test case expects, else a description of the difference"""
+        if self.expect_status is not None and response.status != self.expect_status:
+            return f"status {response.status} {response.reason}, expected {self.expect_status}"
+        for name, value in self.expect_headers.items():
+            actual = response.headers.get(name)
+            if actual is None or value.lower() not in actual.lower():
+                return f"header {name}: {actual!r}, expected {value!r}"
+        if self.expect_body is not None:
+            text = response.body.decode("utf-8", errors="replace")
+            if self.body_match == "exact":
+                ok = text == self.expect_body
+            elif self.body_match == "regex":
+                ok = re.search(self.expect_body, text) is not None
+            else:
+                ok = self.expect_body in text
+            if not ok:
+                return f"body {text[:80]!r} does not {self.body_match}-match {self.expect_body[:80]!r}"
+        return None
+
+class _Connection:
+    __slots__ = ("idx", "sock", "parser", "in_flight", "methods", "todo", "outbuf", "opened", "answered")
+
+    def __init__(self, idx, todo):
+        self.idx = idx
+        self.sock = None
+        self.parser = None
+        self.in_flight = deque()  # (spec, sent_at)
+        self.methods = deque()
+        self.todo = deque(todo)
+        self.outbuf = b""
+        self.opened = 0
+        self.answered = 0  # responses on the current socket
+
+class LoadRun:
+    def __init__(self, port, specs, connections, rounds, pipeline, timeout):
+        self.addr = ("127.0.0.1", port)
+        self.pipeline = max(1, pipeline)
+        self.timeout = timeout
+        self.sel = selectors.DefaultSelector()
+        self.conns = [_Connection(i, [spec for _ in range(rounds) for spec in specs]) for i in range(connections)]
+        self.latencies = {spec.name: [] for spec in specs}
+        self.failures = []
+        self.completed = 0
+        self.errors = 0
+
+    def _open(self, conn):
+        conn.sock = socket.create_connection(self.addr, timeout=self.timeout)
+        conn.sock.setblocking(False)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.parser = ResponseParser()
+        conn.opened += 1
+        conn.answered = 0
+        self.sel.register(conn.sock, selectors.EVENT_READ, conn)
+
+    def _drop(self, conn):
+        """Close the socket; unanswered requests go back to the front of the queue"""
+        if conn.sock is not None:
+            self.sel.unregister(conn.sock)
+            conn.sock.close()
+            conn.sock = None
+        conn.todo.extendleft(spec for spec, _ in reversed(conn.in_flight))
+        conn.in_flight.clear()
+        conn.methods.clear()
+        conn.outbuf = b""
+
+    def _fail(self, conn, message):
+        self.errors += 1
+        if len(self.failures) < MAX_FAILURES:
+            self.failures.append(f"connection {conn.idx}: {message}")
+
+    def _fill(self, conn, now):
+        """Send requests until `pipeline` are in flight"""
+        while conn.todo and len(conn.in_flight) < self.pipeline:
+            if conn.sock is None:
+                self._open(conn)
+            spec = conn.todo.popleft()
+            conn.in_flight.append((spec, now))
+            conn.methods.append(spec.method)
+            conn.outbuf += spec.wire
+        self._flush(conn)
+
+    def _flush(self, conn):
+        if conn.sock is None or not conn.outbuf:
+            return
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            return  # The read side reports the broken connection
+        conn.outbuf = conn.outbuf[sent:]
+        self.sel.modify(conn.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.outbuf else 0), conn)
+
+    def _complete(self, conn, response, now):
+        spec, sent_at = conn.in_flight.popleft()
+        self.completed += 1
+        conn.answered += 1
+        self.latencies[spec.name].append(now - sent_at)
+        problem = spec.check(response)
+        if problem:
+            self._fail(conn, f"{spec.name}: {problem}")
+        return response.keep_alive
+
+    def _on_readable(self, conn, now):
+        try:
+            data = conn.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            if conn.in_flight:
+                self._fail(conn, f"{conn.in_flight.popleft()[0].name}: {e}")
+            self._drop(conn)
+            return
+        try:
+            if not data:
+                # Requests the server closed on without answering are resent on a fresh connection,
+                # unless it answered nothing at all on this one
+                response = conn.parser.eof(conn.methods)
+                if response is not None:
+                    self._complete(conn, response, now)
+                elif not conn.answered and conn.in_flight:
+                    self._fail(conn, f"{conn.in_flight.popleft()[0].name}: connection closed without a response")
+                self._drop(conn)
+                return
+            for response in conn.parser.feed(data, conn.methods):
+                if not self._complete(conn, response, now):
+                    self._drop(conn)
+                    return
+        except HTTPParseError as e:
+            spec = conn.in_flight.popleft()[0] if conn.in_flight else None
+            self._fail(conn, f"{spec.name if spec else 'response'}: {e}")
+            self._drop(conn)
+
+    def run(self):
+        start = time.perf_counter()
+        last_progress = start
+        try:
+            for conn in self.conns:
+                self._fill(conn, start)
+            while any(conn.todo or conn.in_flight for conn in self.conns):
+                events = self.sel.select(max(0.0, last_progress + self.timeout - time.perf_counter()))
+                now = time.perf_counter()
+                if now - last_progress >= self.timeout:
+                    for conn in self.conns:
+                        if conn.in_flight:
+                            self._fail(conn, f"{conn.in_flight[0][0].name}: no response within {self.timeout}s")
+                    break
+                for key, mask in events:
+                    conn = key.data
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush(conn)
+                    if mask & selectors.EVENT_READ and conn.sock is not None:
+                        before = self.completed + self.errors
+                        self._on_readable(conn, now)
+                        if self.completed + self.errors != before:
+                            last_progress = now
+                    if conn.todo and len(conn.in_flight) < self.pipeline:
+                        self._fill(conn, now)
+                # Connections whose socket was dropped with work left are reopened on the next fill
+                for conn in self.conns:
+                    if conn.sock is None and conn.todo:
+                        self._fill(conn, now)
+        finally:
+            for conn in self.conns:
+                if conn.sock is not None:
+                    conn.sock.close()
+            self.sel.close()
+        return time.perf_counter() - start
+
+def _percentile(values, pct):
+    rank = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[rank]
+
+def run_http_load(port, testcase):
+    entries = testcase.get("httpRequests") or [{"method": "GET", "path": "/"}]
+    keep_alive = testcase.get("keepAlive", True)
+    specs = [RequestSpec(entry, port, keep_alive) for entry in entries]
+    connections = testcase.get("httpConnections", 1)
+    rounds = testcase.get("httpRounds", 1)
+    pipeline = testcase.get("pipeline", 1) if keep_alive else 1
+    timeout = limits().timeout("httpTimeout", testcase.get("httpTimeout", DEFAULT_TIMEOUT))
+    run = LoadRun(port, specs, connections, rounds, pipeline, timeout)
+    try:
+        elapsed = run.run()
+    except OSError as e:
+        return "FAIL", f"HTTP test failed: could not connect: {e}"
+
+    total = connections * rounds * len(specs)
+    rate = run.completed / elapsed if elapsed else 0.0
+    opened = sum(conn.opened for conn in run.conns)
+    routes, worst_p99 = [], 0.0
+    for name, values in run.latencies.items():
+        if not values:
+            routes.append(f"{name}: no responses")
+            continue
+        values.sort()
+        p99 = _percentile(values, 99)
+        worst_p99 = max(worst_p99, p99)
+        routes.append(f"{name}: n={len(values)} p50={_percentile(values, 50) * 1000:.2f}ms "
+                      f"p90={_percentile(values, 90) * 1000:.2f}ms p99={p99 * 1000:.2f}ms")
+    summary = (f"{run.completed}/{total} responses over {connections} connection(s) in {elapsed:.2f}s "
+               f"({rate:.0f} req/s, {opened} connections opened, pipeline {pipeline}); {'; '.join(routes)}")
+    logger.info("HTTP load: %s", summary)
+
+    if run.failures:
+        return "FAIL", f"HTTP test failed ({run.errors} problem(s)): {'; '.join(run.failures)}. {summary}"
+    if run.completed < total:
+        return "FAIL", f"HTTP test failed: only {run.completed} of {total} requests were answered. {summary}"
+    min_rate = testcase.get("minRequestsPerSecond")
+    if min_rate is not None and rate < min_rate:
+        return "FAIL", f"HTTP test failed: {rate:.0f} req/s below {min_rate}. {summary}"
+    max_p99 = testcase.get("maxP99")
+    if max_p99 is not None:
+        max_p99 = limits().threshold("maxP99", max_p99)
+    if max_p99 is not None and worst_p99 > max_p99:
+        return "FAIL", f"HTTP test failed: p99 latency {worst_p99 * 1000:.2f}ms above {max_p99 * 1000:.0f}ms. {summary}"
+    return "PASS", f"HTTP test passed: {summary}"
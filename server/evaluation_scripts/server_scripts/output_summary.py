@@ -0,0 +1,114 @@
+"""
+Bounded summaries of what many clients received.
+
+run_tcp_clients and run_udp_clients used to join every reply into the
+RESULT message and append the list of failed replies. With hundreds of
+clients that message ran to megabytes, and it was copied through SSH, the
+backend's regexes and the database as actualOutput. OutputSummary keeps
+one entry per distinct reply with a count instead:
+
+    PASS: hello [x200]
+    FAIL: Server output: hello [x180], Error: timed out [x20]. Failed outputs:
+          20 of 200 replies failed; TimeoutError x20: 'Error: timed out' [x20]
+
+Failures are grouped by class: the name of the exception's type (such as
+TimeoutError), or "wrong output" for a reply that did not match. Each class
+keeps the EXAMPLES most frequent distinct replies, and each reply is
+shortened to MAX_REPLY characters. The message never exceeds the cap
+(CN_EVAL_SUMMARY_CAP characters, default 2048).
+
+The full per-client record is only kept on request (the test case's
+outputDetail, or CN_EVAL_OUTPUT_DETAIL=1) and is printed as a separate
+CLIENT_OUTPUTS:<json> line, which the backend stores next to the result.
+"""
+import json
+import os
+import threading
+
+from eval_logging import get_logger
+
+logger = get_logger("output_summary")
+
+DETAIL_PREFIX = "CLIENT_OUTPUTS:"
+DEFAULT_CAP = 2048
+MAX_REPLY = 200
+EXAMPLES = 3
+WRONG_OUTPUT = "wrong output"
+
+def _shorten(text, limit=MAX_REPLY):
+    return text if len(text) <= limit else text[:limit] + f"... [{len(text) - limit} more chars]"
+
+def _counted(text, count):
+    return text if count == 1 else f"{text} [x{count}]"
+
+class OutputSummary:
+    """Thread-safe tally of client replies; add() from every client thread"""
+
+    def __init__(self, detail=False, cap=None):
+        self.cap = cap or int(os.environ.get("CN_EVAL_SUMMARY_CAP", DEFAULT_CAP))
+        self.detail = [] if detail or os.environ.get("CN_EVAL_OUTPUT_DETAIL") == "1" else None
+        self.counts = {}  # reply -> count, in order of first appearance
+        self.failures = {}  # failure class -> {reply: count}
+        self.total = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def add(self, client, reply, ok, failure=WRONG_OUTPUT):
+        with self.lock:
+            self.total += 1
+            self.counts[reply] = self.counts.get(reply, 0) + 1
+            if not ok:
+                self.failed += 1
+                replies = self.failures.setdefault(failure, {})
+                replies[reply] = replies.get(reply, 0) + 1
+            if self.detail is not None:
+                self.detail.append({"client": client, "output": reply, "ok": ok})
+
+    def passed(self):
+        return not self.failed
+
+    def _join(self, parts, budget):
+        """Join as many parts as fit in `budget` characters, noting how many were left out"""
+        text = ""
+        for n, part in enumerate(parts):
+            candidate = f"{text}, {part}" if text else part
+            rest = f" (+{len(parts) - n - 1} more distinct)" if n < len(parts) - 1 else ""
+            if len(candidate) + len(rest) > budget and text:
+                return f"{text} (+{len(parts) - n} more distinct)"
+            text = candidate
+        return text
+
+    def _outputs(self, budget):
+        ranked = sorted(self.counts.items(), key=lambda item: -item[1])
+        return self._join([_counted(_shorten(reply), count) for reply, count in ranked], budget)
+
+    def _failed_outputs(self):
+        classes = []
+        for failure, replies in sorted(self.failures.items(), key=lambda item: -sum(item[1].values())):
+            ranked = sorted(replies.items(), key=lambda item: -item[1])
+            examples = ", ".join(_counted(repr(_shorten(reply)), count) for reply, count in ranked[:EXAMPLES])
+            if len(ranked) > EXAMPLES:
+                examples += f" (+{len(ranked) - EXAMPLES} more distinct)"
+            classes.append(f"{failure} x{sum(replies.values())}: {examples}")
+        return f"{self.failed} of {self.total} replies failed; " + "; ".join(classes)
+
+    def message(self):
+        """(status, message) for the RESULT line, at most `cap` characters"""
+        with self.lock:
+            if not self.failed:
+                return "PASS", self._outputs(self.cap)
+            failed = self._failed_outputs()
+            # The failure breakdown is the useful part; the overview gets what is left
+            budget = max(self.cap // 2, self.cap - len(failed) - len("Server output: . Failed outputs: "))
+            text = f"Server output: {self._outputs(budget)}. Failed outputs: {failed}"
+        if len(text) > self.cap:
+            text = text[:self.cap - len(" [truncated]")] + " [truncated]"
+        return "FAIL", text
+
+    def report_detail(self):
+        """Print every client's reply as a CLIENT_OUTPUTS:<json> line, if detail was requested"""
+        if self.detail is None:
+            return
+        with self.lock:
+            detail = sorted(self.detail, key=lambda entry: entry["client"])
+        print(DETAIL_PREFIX + json.dumps(detail, separators=(",", ":")))
@@ -0,0 +1,430 @@
+"""
+Protocol fuzzer used by the errorHandling mode when a test case sets "fuzz".
+
+Inputs are generated by mutating a per-question seed corpus (the errorTests
+inputs plus "fuzzSeeds"): byte flips, inserted random bytes, embedded NULs,
+oversized lines, format strings, splices of two seeds. Each input is sent in
+a short session whose delivery also varies: one write with the connection
+left open, many partial writes, a half-close, or an abrupt reset without
+reading the reply. Only the partial and half-close deliveries end with our
+EOF. A server that stays silent after a single open write is only waiting
+for more input, and that is recorded as its own behaviour, not as stuck.
+
+Sessions run in rounds of "fuzzSessions" concurrent connections until the
+"fuzzBudget" (seconds) runs out. The student server is an uninstrumented
+binary, so the feedback signal is its observable behaviour: an input whose
+response (reply shape, close, reset, silence) has not been seen before joins
+the corpus and is mutated further.
+
+After every round the server is checked:
+- crash: the process exited (or the port refuses connections)
+- child crash: a forked child of the server was killed by a signal such as
+  SIGSEGV. ChildWatch polls the server's process tree and reads the exit
+  status of children that are waiting to be reaped, which covers servers
+  that reap in their accept loop or not at all. A server that reaps from a
+  SIGCHLD handler (or ignores SIGCHLD) hides the status. Its resets are not
+  taken as crashes, because a correct server resets too when it closes with
+  input left unread.
+- hang: a fresh client is no longer served within "hangTimeout"
+- stuck connection: the server neither replied nor closed after our EOF;
+  more than "maxStuck" of them (default 0) fail the test
+
+A crashing input is replayed alone, shrunk while it still crashes and kept
+under CN_EVAL_FUZZ_DIR (default /tmp/cn_eval_fuzz) as a regression seed
+that is replayed first on every later run of the same question.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eval_logging import get_logger
+from deadlines import limits
+from supervisor import process_tree
+
+logger = get_logger("protocol_fuzzer")
+
+DEFAULT_FUZZ_DIR = "/tmp/cn_eval_fuzz"
+DEFAULT_BUDGET = 10
+DEFAULT_SESSIONS = 8
+DEFAULT_HANG_TIMEOUT = 2
+DEFAULT_MAX_INPUT = 64 * 1024
+
+MAX_CORPUS = 256
+MAX_MINIMIZE_RUNS = 64
+REPLY_IDLE = 0.02
+# How long a "whole" session, which never sends EOF, waits for a first reply
+WHOLE_REPLY_WAIT = 0.2
+CRASH_SETTLE = 0.05
+CHILD_POLL = 0.005
+# Index of exit_code among the /proc/<pid>/stat fields after the command name
+EXIT_CODE_FIELD = 49
+CRASH_SIGNALS = {signal.SIGSEGV, signal.SIGBUS, signal.SIGABRT, signal.SIGFPE, signal.SIGILL, signal.SIGSYS}
+
+DELIVERIES = ("whole", "partial", "halfclose", "reset")
+FORMAT_TOKENS = (b"%s%s%s%n", b"%x" * 16, b"-1", b"0", b"99999999999999999999", b"\r\n\r\n", b"\xff\xfe")
+
+class FuzzInput:
+    """One generated input and the way it is delivered"""
+    __slots__ = ("data", "delivery")
+
+    def __init__(self, data, delivery="halfclose"):
+        self.data = data
+        self.delivery = delivery
+
+    def describe(self, limit=80):
+        shown = repr(self.data[:limit])[2:-1]
+        more = f"... ({len(self.data)} bytes)" if len(self.data) > limit else ""
+        return f"'{shown}'{more} [{self.delivery}]"
+
+def regression_dir(seeds):
+    """Directory holding the regression seeds of one seed corpus"""
+    digest = hashlib.sha256(b"\0".join(seeds)).hexdigest()[:16]
+    return os.path.join(os.environ.get("CN_EVAL_FUZZ_DIR", DEFAULT_FUZZ_DIR), digest)
+
+def load_regressions(path):
+    inputs = []
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return inputs
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(path, name)) as f:
+                entry = json.load(f)
+            inputs.append(FuzzInput(bytes.fromhex(entry["data"]), entry.get("delivery", "halfclose")))
+        except (OSError, ValueError, KeyError):
+            continue
+    return inputs
+
+def save_regression(path, item):
+    os.makedirs(path, exist_ok=True)
+    name = hashlib.sha1(item.data + item.delivery.encode()).hexdigest()[:12] + ".json"
+    tmp = os.path.join(path, name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"data": item.data.hex(), "delivery": item.delivery}, f)
+    os.replace(tmp, os.path.join(path, name))
+
+def mutate(data, corpus, rng, max_size):
+    """A random mutation (or a short stack of them) of one corpus entry"""
+    out = bytearray(data)
+    for _ in range(rng.choice((1, 1, 2, 3))):
+        op = rng.randrange(9)
+        pos = rng.randint(0, len(out))
+        if op == 0 and out:
+            i = rng.randrange(len(out))
+            out[i] ^= 1 << rng.randrange(8)
+        elif op == 1:
+            out[pos:pos] = rng.randbytes(rng.randint(1, 16))
+        elif op == 2 and out:
+            end = min(len(out), pos + rng.randint(1, 16))
+            del out[pos:end]
+        elif op == 3:
+            out[pos:pos] = b"\0" * rng.randint(1, 4)
+        elif op == 4:
+            # Oversized line: one byte or the whole input repeated well past any fixed buffer
+            size = rng.choice((256, 1024, 4096, max_size))
+            unit = bytes(out[pos:pos + rng.randint(1, 8)]) or b"A"
+            out[pos:pos] = (unit * (size // len(unit) + 1))[:size]
+        elif op == 5:
+            out[pos:pos] = rng.choice(FORMAT_TOKENS)
+        elif op == 6 and len(corpus) > 1:
+            other = rng.choice(corpus)
+            out = out[:pos] + bytearray(other[rng.randint(0, len(other)):])
+        elif op == 7:
+            out += b"\n" if not out.endswith(b"\n") else b""
+            out += bytes(rng.choice(corpus))
+        else:
+            out = bytearray(rng.randbytes(rng.randint(1, 64)))
+    return bytes(out[:max_size])
+
+def run_session(addr, item, timeout, rng=None):
+    """Send one input and classify what the server does with it"""
+    rng = rng or random
+    try:
+        s = socket.create_connection(addr, timeout=timeout)
+    except ConnectionRefusedError:
+        return "refused", b""
+    except OSError:
+        return "connect_timeout", b""
+    try:
+        s.settimeout(timeout)
+        if item.delivery == "partial" and len(item.data) > 1:
+            pos = 0
+            while pos < len(item.data):
+                step = rng.randint(1, max(1, len(item.data) // 4))
+                s.sendall(item.data[pos:pos + step])
+                pos += step
+                time.sleep(0.001)
+        else:
+            s.sendall(item.data)
+        if item.delivery == "reset":
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            return "aborted", b""
+        if item.delivery == "whole":
+            # The write side stays open, so the server has to answer from what it has read so far
+            s.settimeout(min(timeout, WHOLE_REPLY_WAIT))
+            try:
+                data = s.recv(4096)
+            except socket.timeout:
+                return "silent", b""
+        else:
+            s.shutdown(socket.SHUT_WR)
+            data = s.recv(4096)
+        if not data:
+            return "closed", b""
+        # Take whatever else arrives right away; the first reply decides the behaviour
+        s.settimeout(REPLY_IDLE)
+        try:
+            while len(data) < 4096:
+                more = s.recv(4096)
+                if not more:
+                    break
+                data += more
+        except OSError:
+            pass
+        return "reply", data
+    except socket.timeout:
+        return "stuck", b""
+    except (ConnectionResetError, BrokenPipeError):
+        return "reset", b""
+    except OSError:
+        return "error", b""
+    finally:
+        s.close()
+
+def signature(outcome, data):
+    """Behaviour class of a session, coarse enough that counters and echoes don't all differ"""
+    shape = re.sub(rb"[0-9]+", b"#", data[:48].lower())
+    shape = re.sub(rb"[^\x20-\x7e]", b"?", shape)
+    return outcome, shape if len(data) < 48 else shape + b"..."
+
+def _zombie_status(pid):
+    """Raw wait status of a descendant that exited but is not reaped yet, else None"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rfind(b")") + 2:].split()
+    if not fields or fields[0] != b"Z" or len(fields) <= EXIT_CODE_FIELD:
+        return None
+    return int(fields[EXIT_CODE_FIELD])
+
+class ChildWatch:
+    """Exits of the server's forked children, from polling its process tree"""
+
+    def __init__(self, server):
+        self.server = server
+        self.seen = set()
+        self.signals = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._poll, name="child-watch", daemon=True)
+        self.thread.start()
+
+    def _poll(self):
+        while not self.stopped.wait(CHILD_POLL):
+            leader = self.server.proc.pid
+            tree = process_tree(leader) - {leader}
+            with self.lock:
+                for pid in tree - self.seen:
+                    status = _zombie_status(pid)
+                    if status is None:
+                        continue
+                    self.seen.add(pid)
+                    if status & 0x7f in CRASH_SIGNALS:
+                        self.signals.append(signal.Signals(status & 0x7f).name)
+                self.seen &= tree
+
+    def take(self):
+        """Names of the signals that killed children since the last call"""
+        with self.lock:
+            signals, self.signals = self.signals, []
+        return signals
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join(1.0)
+
+class ProtocolFuzzer:
+    def __init__(self, port, testcase, seeds, server=None):
+        self.addr = ("127.0.0.1", port)
+        self.server = server
+        self.budget = testcase.get("fuzzBudget", DEFAULT_BUDGET)
+        self.sessions = testcase.get("fuzzSessions", DEFAULT_SESSIONS)
+        self.timeout = limits().timeout("hangTimeout", testcase.get("hangTimeout", DEFAULT_HANG_TIMEOUT))
+        self.max_stuck = testcase.get("maxStuck", 0)
+        self.max_size = testcase.get("maxInputSize", DEFAULT_MAX_INPUT)
+        self.rng = random.Random(testcase.get("seed", 0))
+        self.seeds = [seed for seed in seeds if seed] or [b"\n"]
+        self.corpus = list(self.seeds)
+        self.behaviours = set()
+        self.regression_path = regression_dir(self.seeds)
+        self.stats = {"sessions": 0, "stuck": 0, "reset": 0, "crashes": 0, "hangs": 0}
+        self.failures = []
+        self.reported = set()  # minimized crashing inputs, whatever their delivery
+        self.watch = ChildWatch(server) if server is not None else None
+
+    def crashed(self, settle=True):
+        if settle:
+            time.sleep(CRASH_SETTLE)
+        if self.server is not None:
+            return not self.server.alive()
+        try:
+            socket.create_connection(self.addr, timeout=self.timeout).close()
+            return False
+        except ConnectionRefusedError:
+            return True
+        except OSError:
+            return False
+
+    def child_crash(self):
+        """How a forked child crashed since the last check, or None"""
+        signals = self.watch.take() if self.watch is not None else []
+        return f"a server child was killed by {signals[0]}" if signals else None
+
+    def served(self):
+        """Whether a fresh, well-formed client still gets handled"""
+        outcome, _ = run_session(self.addr, FuzzInput(self.seeds[0]), self.timeout * 2)
+        return outcome in ("reply", "closed")
+
+    def restart(self):
+        if self.server is None:
+            return False
+        try:
+            return self.server.restart()
+        except (OSError, RuntimeError) as e:
+            logger.warning("Could not restart the server: %s", e)
+            return False
+
+    def generate(self):
+        data = mutate(self.rng.choice(self.corpus), self.corpus, self.rng, self.max_size)
+        return FuzzInput(data, self.rng.choice(DELIVERIES))
+
+    def run_round(self, pool, items):
+        seeds = [self.rng.randrange(1 << 30) for _ in items]
+        outcomes = list(pool.map(lambda pair: run_session(self.addr, pair[0], self.timeout, random.Random(pair[1])),
+                                 zip(items, seeds)))
+        self.stats["sessions"] += len(items)
+        for item, (outcome, data) in zip(items, outcomes):
+            if outcome == "stuck":
+                self.stats["stuck"] += 1
+            elif outcome == "reset":
+                self.stats["reset"] += 1
+            sig = signature(outcome, data)
+            if sig not in self.behaviours:
+                self.behaviours.add(sig)
+                if outcome != "refused" and len(self.corpus) < MAX_CORPUS:
+                    self.corpus.append(item.data)
+        return outcomes
+
+    def reproduces(self, item):
+        if self.crashed() and not self.restart():
+            return False
+        if self.watch is not None:
+            self.watch.take()
+        run_session(self.addr, item, self.timeout)
+        return self.crashed() or self.child_crash() is not None
+
+    def minimize(self, item, deadline):
+        """Shrink a crashing input by removing ever smaller chunks while it still crashes"""
+        data, runs = item.data, 0
+        chunk = max(1, len(data) // 2)
+        while chunk >= 1 and runs < MAX_MINIMIZE_RUNS and time.monotonic() < deadline:
+            pos, shrunk = 0, False
+            while pos < len(data) and runs < MAX_MINIMIZE_RUNS and time.monotonic() < deadline:
+                candidate = FuzzInput(data[:pos] + data[pos + chunk:], item.delivery)
+                runs += 1
+                if candidate.data and self.reproduces(candidate):
+                    data, shrunk = candidate.data, True
+                else:
+                    pos += chunk
+            if not shrunk:
+                chunk //= 2
+        return FuzzInput(data, item.delivery)
+
+    def handle_crash(self, items, deadline, what="Server crashed"):
+        self.stats["crashes"] += 1
+        # A crashed child leaves the server itself running
+        if self.crashed(settle=False) and not self.restart():
+            self.failures.append(f"{what} on one of: {', '.join(i.describe(40) for i in items[:4])}")
+            return False
+        culprit = next((item for item in items if self.reproduces(item)), None)
+        if culprit is None:
+            self.failures.append(f"{what} (not reproducible with a single input) after "
+                                 f"{items[0].describe(40)}")
+        else:
+            original = len(culprit.data)
+            culprit = self.minimize(culprit, max(deadline, time.monotonic() + 2))
+            if culprit.data in self.reported:
+                # The same bytes crash it however they are delivered; one report is enough
+                logger.info("Crash on %s already reported", culprit.describe())
+            else:
+                self.reported.add(culprit.data)
+                save_regression(self.regression_path, culprit)
+                self.failures.append(f"{what} on {culprit.describe()} (minimized from {original} bytes)")
+        return (not self.crashed()) or self.restart()
+
+    def handle_hang(self, items):
+        self.stats["hangs"] += 1
+        self.failures.append(f"Server stopped serving new clients after "
+                             f"{', '.join(i.describe(40) for i in items[:4])}")
+        return self.restart()
+
+    def run(self):
+        start = time.monotonic()
+        deadline = start + self.budget
+        pending = load_regressions(self.regression_path)
+        previous = []
+        with ThreadPoolExecutor(max_workers=self.sessions) as pool:
+            while time.monotonic() < deadline:
+                items = pending[:self.sessions]
+                pending = pending[self.sessions:]
+                items += [self.generate() for _ in range(self.sessions - len(items))]
+                outcomes = self.run_round(pool, items)
+                # A crash can surface a moment late, so the previous round is replayed too
+                child = self.child_crash()
+                if self.crashed(settle=False) or child:
+                    what = f"Server crashed ({child})" if child else "Server crashed"
+                    if not self.handle_crash(items + previous, deadline, what):
+                        break
+                    previous = []
+                    continue
+                elif any(outcome in ("stuck", "connect_timeout") for outcome, _ in outcomes) and not self.served():
+                    if not self.handle_hang(items):
+                        break
+                previous = items
+        if self.watch is not None:
+            self.watch.stop()
+        if self.stats["stuck"] > self.max_stuck:
+            self.failures.append(f"{self.stats['stuck']} connection(s) got neither a reply nor a close after "
+                                 f"the client's EOF (at most {self.max_stuck} allowed)")
+        self.stats["elapsed"] = time.monotonic() - start
+        return self.stats
+
+    def summary(self):
+        s = self.stats
+        rate = s["sessions"] / s["elapsed"] if s.get("elapsed") else 0.0
+        return (f"{s['sessions']} sessions in {s.get('elapsed', 0):.1f}s ({rate:.0f}/s), "
+                f"{len(self.behaviours)} behaviours, corpus {len(self.corpus)}, crashes={s['crashes']}, "
+                f"hangs={s['hangs']}, stuck={s['stuck']}, resets={s['reset']}")
+
+def run_fuzz(port, testcase, seeds, server=None):
+    """Fuzz the server at `port`; `server` (alive()/restart()) allows crash replay and minimization"""
+    fuzzer = ProtocolFuzzer(port, testcase, [s.encode() if isinstance(s, str) else s for s in seeds], server)
+    fuzzer.run()
+    logger.info("Fuzzing finished: %s", fuzzer.summary())
+    if fuzzer.failures:
+        return "FAIL", f"Fuzzing found {len(fuzzer.failures)} problem(s): {'; '.join(fuzzer.failures[:3])} " \
+                       f"({fuzzer.summary()})"
+    return "PASS", f"No crashes or hangs under fuzzing: {fuzzer.summary()}"
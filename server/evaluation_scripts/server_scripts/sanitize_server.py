@@ -0,0 +1,193 @@
+"""
+Sanitizer diagnostic run for a server submission.
+
+Builds the server once with sanitizers (see common_scripts/sanitizers.py),
+runs that build through the functional test cases of the test file and
+prints the parsed findings as a SANITIZER:<json> line before the RESULT
+line. The RESULT status reflects the findings only; the functional verdicts
+still come from the normal evaluation.
+
+Build, logs and findings live in their own cache directory
+(CN_EVAL_SANITIZER_DIR, default /tmp/cn_eval_sanitized) keyed by the source,
+the sanitizer mode, the compiler and the test plan. The normal ./server_exec
+build is never touched, and identical code is not built or run again.
+
+    python3 sanitize_server.py server.c testcases.json --mode thread
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+
+# Shared evaluator modules live next to this directory in common_scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common_scripts"))
+
+from utils import find_free_port, modify_server_port, compile_program, wait_for_server, stop_server
+from evaluate_server import RUNNERS
+from sanitizers import (
+    SANITIZER_FLAGS, sanitizer_mode, sanitizer_env, read_sanitizer_logs, merge_findings, describe_findings
+)
+from test_plan import load_plan, PlanError
+from supervisor import SupervisedProcess
+from eval_logging import get_logger, setup_logging
+from phase_timer import PhaseTimer
+
+logger = get_logger("sanitize_server")
+
+SANITIZER_PREFIX = "SANITIZER:"
+DEFAULT_ARTIFACT_DIR = "/tmp/cn_eval_sanitized"
+DEFAULT_KEEP = 20
+REPORT_GRACE = 5
+
+# Load and timing cases are left out: sanitized builds run several times slower
+FUNCTIONAL_RUNNERS = ("tcp", "udp", "chatroom", "stopAndWait", "multiStep", "errorHandling", "transcript")
+
+def compiler_id(compiler="gcc"):
+    try:
+        out = subprocess.run([compiler, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             timeout=10).stdout
+        return out.decode(errors="replace").splitlines()[0]
+    except (OSError, subprocess.SubprocessError, IndexError):
+        return compiler
+
+def artifact_key(source, mode, plan, cases):
+    digest = hashlib.sha256()
+    digest.update(source)
+    for part in (mode, " ".join(SANITIZER_FLAGS[mode]), compiler_id(), plan.version,
+                 ",".join(str(case.index) for case in cases)):
+        digest.update(b"\0" + part.encode())
+    return digest.hexdigest()[:24]
+
+def port_is_free(port):
+    with socket.socket() as s:
+        try:
+            s.bind(("127.0.0.1", port))
+            return True
+        except OSError:
+            return False
+
+def prune_artifacts(base, keep):
+    """Drop the oldest artifact directories beyond `keep`"""
+    try:
+        entries = sorted((os.path.join(base, name) for name in os.listdir(base)),
+                         key=os.path.getmtime, reverse=True)
+    except OSError:
+        return
+    for path in entries[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def build(server_file, art_dir, mode):
+    """Compile the sanitized binary into art_dir, reusing an earlier build when its port is free"""
+    binary = os.path.join(art_dir, "server_san")
+    meta_path = os.path.join(art_dir, "build.json")
+    try:
+        with open(meta_path) as f:
+            port = json.load(f)["port"]
+        if os.path.exists(binary) and port_is_free(port):
+            logger.info("Reusing sanitized build in %s", art_dir)
+            return True, binary, port, ""
+    except (OSError, ValueError, KeyError):
+        pass
+
+    src_copy = os.path.join(art_dir, os.path.basename(server_file))
+    shutil.copyfile(server_file, src_copy)
+    port = find_free_port()
+    modify_server_port(src_copy, port)
+    success, _, stderr = compile_program(src_copy, output_name=binary, flags=["-Wall"] + SANITIZER_FLAGS[mode])
+    if not success:
+        return False, binary, port, stderr.decode(errors="replace")
+    with open(meta_path, "w") as f:
+        json.dump({"port": port, "mode": mode}, f)
+    return True, binary, port, ""
+
+def run_case(binary, port, case, mode, art_dir, source_name):
+    """Run one functional case against the sanitized build and collect its findings"""
+    log_dir = os.path.join(art_dir, "logs")
+    # Reports go to case<N>.san.<pid>, apart from the program's stderr, so that a report
+    # is only waited for when the runtime actually writes one
+    log_prefix = os.path.join(log_dir, f"case{case.index}.san")
+    stderr_path = os.path.join(log_dir, f"case{case.index}.stderr")
+    # A reused build runs the case again; the previous run's reports must not be read twice
+    for stale in glob.glob(os.path.join(glob.escape(log_dir), f"case{case.index}.*")):
+        os.remove(stale)
+    env = sanitizer_env(mode, log_prefix)
+    env["PORT"] = str(port)
+    with open(stderr_path, "wb") as stderr:
+        proc = SupervisedProcess([binary], cwd=art_dir, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+    try:
+        if wait_for_server(port, protocol=case.protocol, proc=proc):
+            status, _ = RUNNERS[case.runner](port, case)
+        else:
+            status = "NOT_STARTED"
+        if glob.glob(f"{glob.escape(log_prefix)}.*"):
+            # A report is being written and the runtime exits when it is done
+            proc.wait_exit(REPORT_GRACE)
+    finally:
+        stop_server(proc)
+    findings = read_sanitizer_logs(log_prefix, stderr_path, source_name, case.index)
+    return {"index": case.index, "status": status, "findings": len(findings)}, findings
+
+def main():
+    parser = argparse.ArgumentParser(description="CN Lab sanitizer diagnostics for a server")
+    parser.add_argument("server_file", help="Server source code (C)")
+    parser.add_argument("test_file", help="Testcases JSON file")
+    parser.add_argument("--mode", choices=sorted(SANITIZER_FLAGS), default=None,
+                        help="Sanitizer set (default: CN_EVAL_SANITIZE or address)")
+    args = parser.parse_args()
+    setup_logging("sanitize_server")
+    timer = PhaseTimer()
+    mode = args.mode or sanitizer_mode() or "address"
+
+    def finish(report, status, msg):
+        timer.emit()
+        print(SANITIZER_PREFIX + json.dumps(report, separators=(",", ":")))
+        print(f"RESULT:{status}:{msg}")
+        sys.exit(0 if status == "PASS" else 1)
+
+    try:
+        plan = load_plan(args.test_file, "server")
+    except (OSError, PlanError) as e:
+        finish({"mode": mode, "findings": []}, "FAIL", str(e))
+    cases = [case for case in plan.cases if not case.error and case.runner in FUNCTIONAL_RUNNERS]
+    with open(args.server_file, "rb") as f:
+        source = f.read()
+
+    base = os.environ.get("CN_EVAL_SANITIZER_DIR", DEFAULT_ARTIFACT_DIR)
+    art_dir = os.path.join(base, artifact_key(source, mode, plan, cases))
+    findings_path = os.path.join(art_dir, "findings.json")
+    try:
+        with open(findings_path) as f:
+            report = dict(json.load(f), cached=True)
+        finish(report, "FAIL" if report["findings"] else "PASS", describe_findings(report["findings"]))
+    except (OSError, ValueError, KeyError):
+        pass
+    os.makedirs(os.path.join(art_dir, "logs"), exist_ok=True)
+
+    with timer.phase("sanitizer_compile"):
+        built, binary, port, build_error = build(args.server_file, art_dir, mode)
+    if not built:
+        finish({"mode": mode, "findings": [], "buildError": build_error[:2000]},
+               "FAIL", "Sanitizer build failed")
+
+    results, findings = [], []
+    source_name = os.path.basename(args.server_file)
+    with timer.phase("sanitizer_run"):
+        for case in cases:
+            result, case_findings = run_case(binary, port, case, mode, art_dir, source_name)
+            results.append(result)
+            findings.extend(case_findings)
+
+    report = {"mode": mode, "cases": results, "findings": merge_findings(findings)}
+    with open(findings_path, "w") as f:
+        json.dump(report, f)
+    prune_artifacts(base, int(os.environ.get("CN_EVAL_SANITIZER_KEEP", DEFAULT_KEEP)))
+    finish(dict(report, cached=False), "FAIL" if report["findings"] else "PASS",
+           describe_findings(report["findings"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,614 @@
+"""
+Golden transcripts: record a reference server once, replay it against submissions.
+
+Recording runs the instructor's reference server through a scripted session
+(the test case's "session", or its steps/input sent by every client) and
+keeps what each client sent and received:
+
+- per client, the byte stream the server sent to it, and whether the server
+  closed that connection at the end
+- per client, its actions (connect, send, close), each with the bytes it had
+  received before acting, the bytes the other clients had received by then
+  (only those that changed since its previous action) and the think time
+
+The transcript is stored in the test case as "transcript": a zlib compressed
+binary encoding in base64, usually a few hundred bytes.
+
+Replay drives the student server with the same actions from one event loop,
+over "replayCopies" independent copies of the client set (only for servers
+whose connections do not interact). Connects are paced, CONNECT_BURST per
+CONNECT_WINDOW, so that the copies starting together cannot overflow a
+small listen backlog and blame the evaluator's own burst on the server.
+An action fires as soon as the bytes it depends on have arrived instead of
+after a fixed sleep, and every received chunk is compared with the recorded
+stream as it arrives, so a replay stops at the first diverging byte and
+reports where and after what.
+
+    python3 transcript.py record reference.c testcases.json 3 --write
+    python3 transcript.py show testcases.json 3
+"""
+import argparse
+import base64
+import binascii
+import errno
+import json
+import os
+import selectors
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import zlib
+from collections import deque
+from typing import NamedTuple, Tuple
+
+# Shared evaluator modules live next to this directory in common_scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common_scripts"))
+
+from eval_logging import get_logger
+from deadlines import limits
+
+logger = get_logger("transcript")
+
+MAGIC = b"CNTR"
+FORMAT_VERSION = 1
+CONNECT, SEND, CLOSE = 0, 1, 2
+ACTION_NAMES = {CONNECT: "connect", SEND: "send", CLOSE: "close"}
+
+DEFAULT_QUIET = 0.2
+DEFAULT_RECORD_WAIT = 5.0
+DEFAULT_REPLY_TIMEOUT = 3.0
+RECV_SIZE = 64 * 1024
+SNIPPET = 40
+# At most CONNECT_BURST connects per CONNECT_WINDOW seconds (below a listen(5) backlog)
+CONNECT_BURST = 4
+CONNECT_WINDOW = 0.01
+
+class TranscriptError(ValueError):
+    """A transcript that cannot be decoded or recorded"""
+
+class Action(NamedTuple):
+    kind: int
+    delay_ms: int                       # recorded time since this client's previous action
+    offset: int                         # bytes of its own stream received before acting
+    waits: Tuple[Tuple[int, int], ...]  # (client, bytes received) of other clients
+    payload: bytes = b""
+
+class ClientStream(NamedTuple):
+    actions: Tuple[Action, ...]
+    expected: bytes
+    eof: bool
+
+class Transcript(NamedTuple):
+    clients: Tuple[ClientStream, ...]
+    duration_ms: int
+
+    @property
+    def total_bytes(self):
+        return sum(len(c.expected) + sum(len(a.payload) for a in c.actions) for c in self.clients)
+
+# Encoding
+
+def _put_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise TranscriptError("Transcript is truncated")
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def varint(self):
+        value = shift = 0
+        while True:
+            if self.pos >= len(self.data):
+                raise TranscriptError("Transcript is truncated")
+            byte = self.data[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def bytes(self):
+        size = self.varint()
+        if self.pos + size > len(self.data):
+            raise TranscriptError("Transcript is truncated")
+        self.pos += size
+        return self.data[self.pos - size:self.pos]
+
+def encode(transcript):
+    out = bytearray(MAGIC)
+    out.append(FORMAT_VERSION)
+    _put_varint(out, transcript.duration_ms)
+    _put_varint(out, len(transcript.clients))
+    for client in transcript.clients:
+        out.append(1 if client.eof else 0)
+        _put_varint(out, len(client.expected))
+        out += client.expected
+        _put_varint(out, len(client.actions))
+        for action in client.actions:
+            out.append(action.kind)
+            for value in (action.delay_ms, action.offset, len(action.waits)):
+                _put_varint(out, value)
+            for other, offset in action.waits:
+                _put_varint(out, other)
+                _put_varint(out, offset)
+            if action.kind == SEND:
+                _put_varint(out, len(action.payload))
+                out += action.payload
+    return bytes(out)
+
+def decode(data):
+    if data[:len(MAGIC)] != MAGIC or len(data) <= len(MAGIC):
+        raise TranscriptError("Not a transcript")
+    if data[len(MAGIC)] != FORMAT_VERSION:
+        raise TranscriptError(f"Unsupported transcript version {data[len(MAGIC)]}")
+    reader = _Reader(data)
+    reader.pos = len(MAGIC) + 1
+    duration = reader.varint()
+    clients = []
+    for _ in range(reader.varint()):
+        eof = bool(reader.byte())
+        expected = reader.bytes()
+        actions = []
+        for _ in range(reader.varint()):
+            kind = reader.byte()
+            if kind not in ACTION_NAMES:
+                raise TranscriptError("Transcript has an unknown action")
+            delay, offset, wait_count = reader.varint(), reader.varint(), reader.varint()
+            waits = tuple((reader.varint(), reader.varint()) for _ in range(wait_count))
+            payload = reader.bytes() if kind == SEND else b""
+            actions.append(Action(kind, delay, offset, waits, payload))
+        clients.append(ClientStream(tuple(actions), expected, eof))
+    for client in clients:
+        for action in client.actions:
+            if any(other >= len(clients) for other, _ in action.waits):
+                raise TranscriptError("Transcript refers to an unknown client")
+    return Transcript(tuple(clients), duration)
+
+def dumps(transcript):
+    """Text form for the "transcript" field of a test case"""
+    return base64.b64encode(zlib.compress(encode(transcript), 9)).decode("ascii")
+
+def loads(text):
+    try:
+        return decode(zlib.decompress(base64.b64decode(text, validate=True)))
+    except (binascii.Error, zlib.error, TypeError) as e:
+        raise TranscriptError(f"Transcript is not valid: {e}")
+
+# Recording
+
+def default_session(testcase):
+    """Session of a plain test case: every client connects and sends its steps in turn"""
+    steps = testcase.get("steps") or [{"input": testcase.get("input", "")}]
+    clients = 1 if testcase.get("multiStep") else testcase.get("clientCount", 1)
+    return [{"client": client, "send": step.get("input", "")} for client in range(clients) for step in steps]
+
+class _Recorder:
+    def __init__(self, port, quiet=DEFAULT_QUIET, max_wait=DEFAULT_RECORD_WAIT):
+        self.port = port
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.selector = selectors.DefaultSelector()
+        self.socks = {}
+        self.received = {}
+        self.eof = set()
+        self.actions = {}
+        self.last_action = {}
+        self.seen_waits = {}
+        self.start = time.monotonic()
+
+    def _collect(self):
+        """Read from every connection until all of them have been quiet for `quiet` seconds"""
+        deadline = time.monotonic() + self.max_wait
+        while self.selector.get_map() and time.monotonic() < deadline:
+            events = self.selector.select(min(self.quiet, max(0.0, deadline - time.monotonic())))
+            if not events:
+                return
+            for key, _ in events:
+                client = key.data
+                try:
+                    data = key.fileobj.recv(RECV_SIZE)
+                except OSError:
+                    data = b""
+                if data:
+                    self.received[client] += data
+                else:
+                    self.selector.unregister(key.fileobj)
+                    self.eof.add(client)
+
+    def act(self, client, kind, payload=b""):
+        if client not in self.actions:
+            self.actions[client] = []
+            self.received[client] = bytearray()
+            if kind != CONNECT:
+                self.act(client, CONNECT)
+        if client in self.eof and kind == SEND:
+            raise TranscriptError(f"Reference server closed client {client} before it sent {payload!r}")
+        now = time.monotonic()
+        # Only offsets that moved since this client's previous action; older ones are already implied
+        seen = self.seen_waits.setdefault(client, {})
+        waits = tuple((other, len(buf)) for other, buf in sorted(self.received.items())
+                      if other != client and buf and seen.get(other) != len(buf))
+        seen.update(waits)
+        self.actions[client].append(Action(kind, int((now - self.last_action.get(client, self.start)) * 1000),
+                                           len(self.received[client]), waits, payload))
+        self.last_action[client] = now
+        if kind == CONNECT:
+            sock = socket.create_connection(("127.0.0.1", self.port), timeout=self.max_wait)
+            self.socks[client] = sock
+            self.selector.register(sock, selectors.EVENT_READ, client)
+        elif kind == SEND:
+            self.socks[client].sendall(payload)
+        else:
+            if client not in self.eof:
+                self.selector.unregister(self.socks[client])
+            self.socks.pop(client).close()
+        self._collect()
+
+    def finish(self):
+        duration = int((time.monotonic() - self.start) * 1000)
+        for client, sock in list(self.socks.items()):
+            if client not in self.eof:
+                self.selector.unregister(sock)
+            sock.close()
+        self.selector.close()
+        count = max(self.actions) + 1 if self.actions else 0
+        return Transcript(tuple(
+            ClientStream(tuple(self.actions.get(c, ())), bytes(self.received.get(c, b"")), c in self.eof)
+            for c in range(count)
+        ), duration)
+
+def record(port, session, quiet=DEFAULT_QUIET):
+    """Run `session` against the server at `port` and return what it sent back"""
+    recorder = _Recorder(port, quiet)
+    try:
+        for n, entry in enumerate(session):
+            client = entry.get("client", 0)
+            if not isinstance(client, int) or client < 0:
+                raise TranscriptError(f"session[{n}].client must be a non-negative integer")
+            if entry.get("delay"):
+                time.sleep(entry["delay"])
+            if entry.get("connect"):
+                recorder.act(client, CONNECT)
+            elif "send" in entry:
+                recorder.act(client, SEND, entry["send"].encode())
+            elif entry.get("close"):
+                recorder.act(client, CLOSE)
+            else:
+                raise TranscriptError(f"session[{n}] needs connect, send or close")
+    except OSError as e:
+        raise TranscriptError(f"Recording failed: {e}")
+    return recorder.finish()
+
+# Replay
+
+class _Client:
+    __slots__ = ("name", "copy", "stream", "index", "sock", "received", "outbuf", "connecting",
+                 "closed", "eof", "last_action", "last_sent")
+
+    def __init__(self, name, copy, stream):
+        self.name = name
+        self.copy = copy
+        self.stream = stream
+        self.index = 0
+        self.sock = None
+        self.received = 0
+        self.outbuf = b""
+        self.connecting = False
+        self.closed = False
+        self.eof = False
+        self.last_action = 0.0
+        self.last_sent = None
+
+    @property
+    def finished(self):
+        return (self.index == len(self.stream.actions) and not self.outbuf
+                and self.received == len(self.stream.expected) and (self.eof or not self.stream.eof))
+
+def _snippet(data, pos):
+    return bytes(data[pos:pos + SNIPPET])
+
+class Replay:
+    """Replays a transcript against the server at `port` from a single event loop"""
+
+    def __init__(self, port, transcript, copies=1, reply_timeout=DEFAULT_REPLY_TIMEOUT, timing="fast"):
+        self.port = port
+        self.transcript = transcript
+        self.reply_timeout = reply_timeout
+        self.recorded_timing = timing == "recorded"
+        self.selector = selectors.DefaultSelector()
+        self.copies = [[_Client(f"{c}" if copies == 1 else f"{c}.{k}", k, stream)
+                        for c, stream in enumerate(transcript.clients)] for k in range(copies)]
+        self.clients = [client for group in self.copies for client in group]
+        self.connects = deque()  # times of the recent connects
+        self.failure = None
+
+    def _fail(self, client, message):
+        if self.failure is None:
+            after = f" after sending {client.last_sent!r}" if client.last_sent is not None else ""
+            self.failure = f"Client {client.name}{after}: {message}"
+
+    def _ready(self, client, action, now):
+        if client.outbuf or client.connecting or client.received < action.offset:
+            return False
+        group = self.copies[client.copy]
+        if any(group[other].received < offset for other, offset in action.waits):
+            return False
+        if action.kind == CONNECT and self._connect_due(now) > now:
+            return False
+        return not self.recorded_timing or now >= client.last_action + action.delay_ms / 1000.0
+
+    def _connect_due(self, now):
+        """When the next connect may start"""
+        while self.connects and self.connects[0] <= now - CONNECT_WINDOW:
+            self.connects.popleft()
+        return self.connects[0] + CONNECT_WINDOW if len(self.connects) >= CONNECT_BURST else now
+
+    def _perform(self, client, action, now):
+        client.index += 1
+        client.last_action = now
+        if action.kind == CONNECT:
+            self.connects.append(now)
+            client.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client.sock.setblocking(False)
+            code = client.sock.connect_ex(("127.0.0.1", self.port))
+            if code not in (0, errno.EINPROGRESS):
+                self._fail(client, f"could not connect: {os.strerror(code)}")
+                return
+            client.connecting = True
+            self.selector.register(client.sock, selectors.EVENT_WRITE, client)
+        elif action.kind == SEND:
+            client.last_sent = action.payload
+            client.outbuf = action.payload
+            self._flush(client)
+        else:
+            self._close(client)
+
+    def _flush(self, client):
+        try:
+            sent = client.sock.send(client.outbuf)
+        except BlockingIOError:
+            sent = 0
+        except OSError as e:
+            self._fail(client, f"send failed: {e}")
+            return
+        client.outbuf = client.outbuf[sent:]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbuf else 0)
+        if not client.eof:
+            self.selector.modify(client.sock, events, client)
+
+    def _close(self, client):
+        if client.sock is not None and not client.closed:
+            try:
+                self.selector.unregister(client.sock)
+            except (KeyError, ValueError):
+                pass
+            client.sock.close()
+        client.closed = True
+
+    def _on_readable(self, client):
+        try:
+            data = client.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            self._fail(client, f"connection error after {client.received} bytes: {e}")
+            return False
+        expected = client.stream.expected
+        if not data:
+            client.eof = True
+            self.selector.unregister(client.sock)
+            if client.received < len(expected) or not client.stream.eof:
+                self._fail(client, f"server closed the connection after {client.received} bytes, "
+                                   f"expected {_snippet(expected, client.received)!r}")
+            return True
+        pos = client.received
+        if expected[pos:pos + len(data)] != data:
+            # Locate the first differing byte for the report
+            diff = next((i for i in range(min(len(data), len(expected) - pos)) if data[i] != expected[pos + i]),
+                        min(len(data), len(expected) - pos))
+            if pos + diff >= len(expected):
+                self._fail(client, f"unexpected extra data after byte {len(expected)}: {_snippet(data, diff)!r}")
+            else:
+                self._fail(client, f"diverged at byte {pos + diff}: expected "
+                                   f"{_snippet(expected, pos + diff)!r}, got {_snippet(data, diff)!r}")
+            return True
+        client.received += len(data)
+        return True
+
+    def _stalled(self):
+        for client in self.clients:
+            if client.finished:
+                continue
+            actions = client.stream.actions
+            expected = client.stream.expected
+            if client.index < len(actions):
+                action = actions[client.index]
+                if client.received < action.offset:
+                    return self._fail(client, f"no reply within {self.reply_timeout}s, waiting for "
+                                              f"{_snippet(expected, client.received)!r} at byte {client.received}")
+                for other, offset in action.waits:
+                    peer = self.copies[client.copy][other]
+                    if peer.received < offset:
+                        return self._fail(peer, f"no reply within {self.reply_timeout}s, waiting for "
+                                                f"{_snippet(peer.stream.expected, peer.received)!r} "
+                                                f"at byte {peer.received}")
+            elif client.received < len(expected):
+                return self._fail(client, f"no reply within {self.reply_timeout}s, waiting for "
+                                          f"{_snippet(expected, client.received)!r} at byte {client.received}")
+            elif client.stream.eof and not client.eof:
+                return self._fail(client, f"server did not close the connection within {self.reply_timeout}s")
+        self.failure = self.failure or f"replay stalled for {self.reply_timeout}s"
+
+    def run(self):
+        """True if every client received exactly the recorded streams"""
+        last_progress = time.monotonic()
+        try:
+            while self.failure is None:
+                now = time.monotonic()
+                wake = None
+                for client in self.clients:
+                    actions = client.stream.actions
+                    while client.index < len(actions) and self.failure is None:
+                        action = actions[client.index]
+                        if not self._ready(client, action, now):
+                            if client.outbuf or client.connecting:
+                                break
+                            due = self._connect_due(now) if action.kind == CONNECT else now
+                            if self.recorded_timing:
+                                due = max(due, client.last_action + action.delay_ms / 1000.0)
+                            if due > now:
+                                wake = due if wake is None else min(wake, due)
+                            break
+                        self._perform(client, action, now)
+                        last_progress = now
+                    if client.finished and not client.closed:
+                        self._close(client)
+                if self.failure is not None or all(client.finished for client in self.clients):
+                    break
+                timeout = max(0.0, last_progress + self.reply_timeout - now)
+                if wake is not None:
+                    timeout = min(timeout, max(0.0, wake - now))
+                if self.selector.get_map():
+                    events = self.selector.select(timeout)
+                else:
+                    events = []
+                    time.sleep(timeout)
+                for key, mask in events:
+                    client = key.data
+                    if client.connecting:
+                        code = client.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                        if code:
+                            self._fail(client, f"could not connect: {os.strerror(code)}")
+                            break
+                        client.connecting = False
+                        self.selector.modify(client.sock, selectors.EVENT_READ, client)
+                        last_progress = time.monotonic()
+                        continue
+                    if mask & selectors.EVENT_WRITE and client.outbuf:
+                        self._flush(client)
+                        last_progress = time.monotonic()
+                    if mask & selectors.EVENT_READ and not client.eof and self._on_readable(client):
+                        last_progress = time.monotonic()
+                if not events and time.monotonic() - last_progress >= self.reply_timeout:
+                    self._stalled()
+        finally:
+            for client in self.clients:
+                self._close(client)
+            self.selector.close()
+        return self.failure is None
+
+def run_replay(port, testcase):
+    """Replay the test case's transcript against the server at `port`"""
+    try:
+        transcript = loads(testcase["transcript"])
+    except TranscriptError as e:
+        return "FAIL", str(e)
+    copies = testcase.get("replayCopies", 1)
+    reply_timeout = limits().timeout("replyTimeout", testcase.get("replyTimeout", DEFAULT_REPLY_TIMEOUT))
+    engine = Replay(port, transcript, copies, reply_timeout, testcase.get("replayTiming", "fast"))
+    start = time.monotonic()
+    ok = engine.run()
+    elapsed = (time.monotonic() - start) * 1000
+    summary = (f"{len(engine.clients)} clients, {transcript.total_bytes * copies} bytes in {elapsed:.0f}ms "
+               f"(recorded {transcript.duration_ms}ms)")
+    logger.info("Transcript replay: %s", summary)
+    if not ok:
+        return "FAIL", f"Transcript mismatch: {engine.failure}"
+    return "PASS", f"Server matched the reference transcript: {summary}"
+
+# Command line
+
+def describe(transcript):
+    lines = [f"{len(transcript.clients)} clients, recorded in {transcript.duration_ms}ms"]
+    for n, client in enumerate(transcript.clients):
+        lines.append(f"client {n}: receives {len(client.expected)} bytes"
+                     f"{', then the server closes' if client.eof else ''}")
+        for action in client.actions:
+            waits = "".join(f", client {c} has {o}B" for c, o in action.waits)
+            payload = f" {action.payload!r}" if action.kind == SEND else ""
+            lines.append(f"  +{action.delay_ms}ms {ACTION_NAMES[action.kind]}{payload} "
+                         f"(after {action.offset}B{waits})")
+        lines.append(f"  expects {client.expected[:200]!r}")
+    return "\n".join(lines)
+
+def record_reference(reference, testcase, quiet=DEFAULT_QUIET):
+    """Compile and start a reference server in a scratch directory and record the session"""
+    from utils import find_free_port, modify_server_port, compile_program, start_server, wait_for_server, \
+        stop_server
+
+    workdir = tempfile.mkdtemp(prefix="cn_transcript_")
+    cwd = os.getcwd()
+    try:
+        source = os.path.join(workdir, os.path.basename(reference))
+        shutil.copyfile(reference, source)
+        port = find_free_port()
+        modify_server_port(source, port)
+        os.chdir(workdir)
+        success, _, stderr = compile_program(source)
+        if not success:
+            raise TranscriptError(f"Reference compilation failed: {stderr.decode(errors='replace')}")
+        proc = start_server(port)
+        try:
+            if not wait_for_server(port, proc=proc):
+                raise TranscriptError("Reference server did not start")
+            return record(port, testcase.get("session") or default_session(testcase), quiet)
+        finally:
+            stop_server(proc)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or inspect golden transcripts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="Record a reference server for one test case")
+    rec.add_argument("reference", help="Reference server source code (C)")
+    rec.add_argument("test_file", help="Testcases JSON file")
+    rec.add_argument("test_idx", type=int, help="Testcase index")
+    rec.add_argument("--quiet", type=float, default=DEFAULT_QUIET,
+                     help="Seconds of silence that end a reply while recording")
+    rec.add_argument("--write", action="store_true", help="Store the transcript in the test file")
+    show = sub.add_parser("show", help="Print the transcript of a test case")
+    show.add_argument("test_file")
+    show.add_argument("test_idx", type=int)
+    args = parser.parse_args()
+
+    with open(args.test_file) as f:
+        test_data = json.load(f)
+    cases = test_data["testCases"]
+    cases = cases["server"] if isinstance(cases, dict) else cases
+    testcase = cases[args.test_idx]
+    try:
+        if args.command == "show":
+            print(describe(loads(testcase["transcript"])))
+            return
+        transcript = record_reference(args.reference, testcase, args.quiet)
+    except (KeyError, TranscriptError) as e:
+        sys.exit(f"error: {e}")
+    print(describe(transcript))
+    text = dumps(transcript)
+    if args.write:
+        testcase["transcript"] = text
+        with open(args.test_file, "w") as f:
+            json.dump(test_data, f, indent=2)
+            f.write("\n")
+        print(f"Stored {len(text)} characters in test case {args.test_idx} of {args.test_file}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
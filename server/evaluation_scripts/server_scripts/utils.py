@@ -3,13 +3,13 @@ import re
 import socket
 import subprocess
 import time
-import signal
 import random
 import logging
+from supervisor import SupervisedProcess, DEFAULT_GRACE
+from output_capture import OutputCapture
+from deadlines import limits
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Handlers are configured by the evaluator's main() via eval_logging.setup_logging
 logger = logging.getLogger('cn_evaluator')
 
 def find_free_port(start_port=10000, max_attempts=10):
@@ -86,7 +86,7 @@ def compile_program(src_file, output_name="server_exec", compiler="gcc", flags=N
             cmd,
             stdout=subprocess.PIPE, 
             stderr=subprocess.PIPE,
-            timeout=10  # Add timeout to prevent hanging
+            timeout=limits().timeout("compile")
         )
         success = result.returncode == 0
         
@@ -103,14 +103,19 @@ def compile_program(src_file, output_name="server_exec", compiler="gcc", flags=N
         logger.error(f"Error during compilation: {str(e)}")
         return False, b"", str(e).encode()
 
-def wait_for_server(port, timeout=5, protocol="tcp", check_interval=0.2):
-    """Wait for server to start and bind to port"""
+def wait_for_server(port, timeout=None, protocol="tcp", check_interval=0.2, proc=None):
+    """Wait for server to start and bind to port; gives up at once if `proc` exits"""
+    if timeout is None:
+        timeout = limits().timeout("server_start")
     deadline = time.time() + timeout
     attempts = 0
     
     logger.info(f"Waiting for {protocol} server to bind to port {port}")
     while time.time() < deadline:
         attempts += 1
+        if proc is not None and proc.poll() is not None:
+            logger.error(f"Server exited with code {proc.returncode} before binding to port {port}")
+            return False
         try:
             if protocol.lower() == "tcp":
                 with socket.create_connection(('127.0.0.1', port), check_interval):
@@ -129,64 +134,74 @@ def wait_for_server(port, timeout=5, protocol="tcp", check_interval=0.2):
         except Exception as e:
             if attempts % 5 == 0:  # Log only every 5th attempt to reduce noise
                 logger.debug(f"Server not ready yet: {str(e)}")
-            time.sleep(check_interval)
+            # Poll quickly at first: most servers bind within a few milliseconds
+            delay = min(check_interval, 0.005 * 2 ** min(attempts, 8))
+            if proc is not None:
+                proc.wait_exit(delay)
+            else:
+                time.sleep(delay)
     
     logger.error(f"Timed out waiting for server on port {port} after {attempts} attempts")
     return False
 
-def start_server(port, timeout=5):
-    """Start the server process with improved error handling"""
+def start_server(port, timeout=5, watch=(), watch_regex=False):
+    """Start the server process in its own session; readiness is checked by wait_for_server
+
+    The server's stdout/stderr are drained continuously into proc.output (an
+    OutputCapture watching for the `watch` patterns), so a chatty server never
+    blocks on a full pipe.
+    """
     env = os.environ.copy()
     env["PORT"] = str(port)
     
     try:
         logger.info(f"Starting server on port {port}")
-        proc = subprocess.Popen(
+        proc = SupervisedProcess(
             ["./server_exec"],
             env=env,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            preexec_fn=os.setsid
+            stderr=subprocess.PIPE
         )
-        
-        # Check for immediate failure
-        time.sleep(0.2)
-        if proc.poll() is not None:
-            stderr = proc.stderr.read().decode()
-            logger.error(f"Server immediately terminated with exit code {proc.returncode}: {stderr}")
-            raise RuntimeError(f"Server failed to start: {stderr}")
-        
+        proc.output = OutputCapture({"stdout": proc.stdout, "stderr": proc.stderr},
+                                    watch=watch, regex=watch_regex)
         return proc
-    except Exception as e:
+    except OSError as e:
         logger.error(f"Error starting server: {str(e)}")
-        raise
+        raise RuntimeError(f"Server failed to start: {e}")
 
-def stop_server(proc):
-    """Stop the server process with robust cleanup"""
+def stop_server(proc, grace=DEFAULT_GRACE):
+    """Stop the server and every process it forked, reaping them all"""
     if proc:
         try:
-            # Try gentle termination first
-            pgid = os.getpgid(proc.pid)
-            os.killpg(pgid, signal.SIGTERM)
-            
-            # Wait for it to terminate
-            try:
-                proc.wait(timeout=2)
-                logger.info("Server stopped gracefully")
-                return
-            except subprocess.TimeoutExpired:
-                logger.warning("Server didn't stop gracefully, forcing termination")
-                
-            # Force kill if still running
-            if proc.poll() is None:
-                os.killpg(pgid, signal.SIGKILL)
-                proc.wait(timeout=1)
-                logger.info("Server forcibly terminated")
-        except ProcessLookupError:
-            logger.info("Server process already terminated")
+            code = proc.stop(grace)
+            logger.info(f"Server stopped with exit code {code}")
+            output = getattr(proc, "output", None)
+            if output is not None and not output.close():
+                logger.warning("Server output pipes still open after teardown")
         except Exception as e:
             logger.error(f"Error stopping server: {str(e)}")
 
+class ServerHandle:
+    """The running server of a test case, for tests that need to restart it"""
+
+    def __init__(self, proc, port, protocol="tcp", watch=(), watch_regex=False):
+        self.proc = proc
+        self.port = port
+        self.protocol = protocol
+        self.watch = watch
+        self.watch_regex = watch_regex
+        self.restarts = 0
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def restart(self):
+        """Replace the server process with a fresh one; True once it is accepting again"""
+        stop_server(self.proc)
+        self.proc = start_server(self.port, watch=self.watch, watch_regex=self.watch_regex)
+        self.restarts += 1
+        return wait_for_server(self.port, protocol=self.protocol, proc=self.proc)
+
 def check_port_in_use(port):
     """Check if a port is in use"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
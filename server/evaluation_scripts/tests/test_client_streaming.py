@@ -0,0 +1,61 @@
+"""
+Early verdicts of run_streaming_client against the mock TCP server: a client
+whose output already passed is only stopped once the serverScript no longer
+waits for input from it (client_scripts/utils.py, test_servers.py).
+
+    cd server/evaluation_scripts && python3 -m pytest -q tests
+"""
+import os
+import subprocess
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(SCRIPTS_DIR, "client_scripts"), os.path.join(SCRIPTS_DIR, "common_scripts")]
+
+from supervisor import SupervisedProcess  # noqa: E402
+from test_servers import start_tcp_server  # noqa: E402
+from utils import find_free_port, output_matcher, run_streaming_client  # noqa: E402  (client_scripts/utils.py)
+
+# Prints the greeting, then answers the script's "expect" a little later
+CLIENT = """
+import socket, sys, time
+s = socket.create_connection(("127.0.0.1", int(sys.argv[1])))
+print(s.recv(256).decode().strip(), flush=True)
+time.sleep(float(sys.argv[2]))
+s.sendall(b"HELLO\\n")
+print(s.recv(256).decode().strip(), flush=True)
+time.sleep(float(sys.argv[3]))
+"""
+
+def run_client(script, think=0.02, linger=0.0):
+    testcase = {"timeMode": "fast", "expectedOutput": "Welcome", "serverScript": script}
+    port = find_free_port()
+    server, thread, state = start_tcp_server(port, testcase)
+    proc = SupervisedProcess([sys.executable, "-c", CLIENT, str(port), str(think), str(linger)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    start = time.monotonic()
+    try:
+        passed, _ = run_streaming_client(proc, None, output_matcher(testcase), 5, state)
+    finally:
+        proc.stop(grace=0)
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=2)
+    return passed, state["errors"], time.monotonic() - start
+
+def test_waits_for_pending_expect():
+    for _ in range(3):
+        passed, errors, _ = run_client([{"response": "Welcome"}, {"expect": "HELLO", "response": "Hi"}])
+        assert passed and not errors
+
+def test_stops_once_script_has_read_everything():
+    script = [{"response": "Welcome"}, {"expect": "HELLO", "response": "Hi"}]
+    passed, errors, elapsed = run_client(script, linger=10)
+    assert passed and not errors
+    assert elapsed < 3
+
+def test_no_expect_decides_at_once():
+    passed, errors, elapsed = run_client([{"response": "Welcome"}], think=10)
+    assert passed and not errors
+    assert elapsed < 3
@@ -0,0 +1,86 @@
+"""
+Streaming verdicts of StreamMatcher against the whole-output validate_output
+it replaced for non-interactive clients (client_scripts/utils.py).
+
+    cd server/evaluation_scripts && python3 -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(SCRIPTS_DIR, "client_scripts"), os.path.join(SCRIPTS_DIR, "common_scripts")]
+
+from utils import output_matcher  # noqa: E402  (client_scripts/utils.py)
+from validators import validate_output  # noqa: E402
+
+OUTPUTS = [
+    "",
+    "Server: WORLD\n",
+    "Connected\nServer: Hello\nWorld\nBye\n",
+    "Result from server: 42\n",
+    "  padded line  \n\n",
+    "x" * 70000 + "\nneedle at the end\n",
+    "first line\r\nsecond line\r\n",
+]
+
+CASES = [
+    ("contains", "WORLD"),
+    ("contains", "Hello\nWorld"),
+    ("contains", "needle at the end"),
+    ("contains", "missing"),
+    ("in", "Server:"),
+    ("in", "nothing"),
+    ("regex", r"Server: \w+"),
+    ("regex", "Hello\nWorld"),
+    ("regex", r"^Connected"),
+    ("regex", r"Bye$"),
+    ("regex", r"Hello\s+World"),
+    ("regex", r"\d{2}"),
+    ("regex", r"second line"),
+    ("regex", r"(?s)Connected.*Bye"),
+    ("regex", "zzz"),
+    ("regex", ""),
+]
+
+CHUNK_SIZES = [1, 3, 7, 4096, 1 << 20]
+
+def streamed(testcase, output, chunk):
+    matcher = output_matcher(testcase)
+    data = output.encode()
+    for start in range(0, len(data), chunk):
+        matcher.feed(data[start:start + chunk])
+    return matcher.finish(output.strip()) == "PASS"
+
+@pytest.mark.parametrize("match_type,expected", CASES)
+@pytest.mark.parametrize("output", OUTPUTS)
+@pytest.mark.parametrize("chunk", CHUNK_SIZES)
+def test_matches_validate_output(match_type, expected, output, chunk):
+    testcase = {"matchType": match_type, "expectedOutput": expected}
+    baseline, _ = validate_output(output.strip(), expected, match_type)
+    assert streamed(testcase, output, chunk) == baseline
+
+@pytest.mark.parametrize("chunk", CHUNK_SIZES)
+def test_expect_all_and_forbidden(chunk):
+    output = "Connected\nServer: Hello\nWorld\nBye\n"
+    case = {"expectedOutput": "Hello", "expectAll": ["Connected", "Bye"]}
+    assert streamed(case, output, chunk)
+    assert not streamed({**case, "expectAll": ["Connected", "Later"]}, output, chunk)
+    assert not streamed({**case, "forbidOutput": ["World"]}, output, chunk)
+    regex_case = {**case, "outputMatch": "regex", "expectAll": [r"^Connected", r"B.e"]}
+    assert streamed(regex_case, output, chunk)
+    assert not streamed({**regex_case, "forbidOutput": [r"Wor\w+"]}, output, chunk)
+
+def test_expected_formula_is_sufficient():
+    case = {"expectedOutput": "never printed", "expectedFormula": "42"}
+    assert streamed(case, "Result from server: 42\n", 5)
+    assert not streamed(case, "Result from server: 41\n", 5)
+
+def test_early_verdicts():
+    matcher = output_matcher({"expectedOutput": "WORLD"})
+    assert matcher.feed(b"Server: WOR") is None
+    assert matcher.feed(b"LD\nmore output") == "PASS"
+    matcher = output_matcher({"expectedOutput": "WORLD", "forbidOutput": ["Segmentation"]})
+    assert matcher.feed(b"Server: WORLD\n") is None
+    assert matcher.feed(b"Segmentation fault\n") == "FAIL"
@@ -91,6 +91,7 @@ router.post('/run-evaluate', async (req, res) => {
       testCases = [],
       clientCount = 1,
       clientDelay = 0.5,
+      sanitize = null,
     } = req.body;
     if (!filename || !code || !language) {
       return res.status(400).json({ error: 'Missing required fields (filename, code, language)' });
@@ -104,6 +105,7 @@ router.post('/run-evaluate', async (req, res) => {
       testCases,
       clientCount,
       clientDelay,
+      sanitize,
     });
     res.json({ success: true, ...result });
   } catch (err) {
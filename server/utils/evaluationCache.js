@@ -0,0 +1,280 @@
+import crypto from 'crypto';
+import fs from 'fs';
+import path from 'path';
+
+/**
+ * In-memory cache of per-test-case evaluation results.
+ *
+ * Entries are keyed on
+ *   - a hash of the submission with comments and insignificant whitespace removed,
+ *   - a hash of the test case (canonical JSON, without display-only fields),
+ *   - the evaluator version (hash of the evaluation scripts shipped to the container),
+ * so a resubmission that only touches comments or formatting returns the earlier
+ * verdict without running anything. Entries expire after a TTL and the least
+ * recently used ones are evicted past a size bound.
+ *
+ * Timing-sensitive test cases are never cached, and of the results only
+ * verdicts that depend on the code alone are kept (see isCacheableResult).
+ *
+ * Environment:
+ *   EVAL_CACHE_DISABLED     set to 1/true to bypass the cache
+ *   EVAL_CACHE_TTL_MS       entry lifetime (default 1 hour)
+ *   EVAL_CACHE_MAX_ENTRIES  size bound (default 5000)
+ */
+
+const DEFAULT_TTL_MS = 60 * 60 * 1000;
+const DEFAULT_MAX_ENTRIES = 5000;
+
+// Test case flags whose verdict depends on load and timing rather than on the code alone
+const TIMING_SENSITIVE_FLAGS = [
+  'performance',
+  'connectionReliability',
+  'connectionStorm',
+  'bulkTransfer',
+  'udpBurst',
+  'periodicPush',
+  'concurrency',
+  'http',
+  'periodicSend'
+];
+
+// Failures caused by the host or the evaluator rather than by the submission
+const TRANSIENT_FAILURE = /timed out|timeout|no (response|reply) within|stalled|address already in use|failed to start|error running evaluation|error during|evaluator did not finish/i;
+
+// Fields that only affect how a result is displayed
+const DISPLAY_ONLY_FIELDS = ['description', 'points'];
+
+const EVALUATION_SCRIPTS_DIR = path.resolve(process.cwd(), 'evaluation_scripts');
+
+const entries = new Map(); // key => { result, expiresAt }
+const stats = { hits: 0, misses: 0, stores: 0, evictions: 0 };
+let evaluatorVersion = null;
+
+function cacheDisabled() {
+  return ['1', 'true', 'yes'].includes(String(process.env.EVAL_CACHE_DISABLED || '').toLowerCase());
+}
+
+function ttlMs() {
+  const value = parseInt(process.env.EVAL_CACHE_TTL_MS, 10);
+  return Number.isFinite(value) && value > 0 ? value : DEFAULT_TTL_MS;
+}
+
+function maxEntries() {
+  const value = parseInt(process.env.EVAL_CACHE_MAX_ENTRIES, 10);
+  return Number.isFinite(value) && value > 0 ? value : DEFAULT_MAX_ENTRIES;
+}
+
+function sha256(text) {
+  return crypto.createHash('sha256').update(text).digest('hex');
+}
+
+const WORD_CHAR = /[A-Za-z0-9_]/;
+const OPERATOR_CHAR = /[+\-*/%&|<>=!^.]/;
+// A #define line up to the macro name; a space after it makes the macro object-like
+const MACRO_NAME = /^#define [A-Za-z_][A-Za-z0-9_]*$/;
+
+/**
+ * Strip C/C++ comments and whitespace outside string and character literals.
+ * A single space is kept only where dropping it would join two tokens (two
+ * identifiers, or two operators as in `a - -b`, or a macro name and its body
+ * as in `#define X (1)`), and line breaks are kept only to end preprocessor
+ * directives.
+ */
+export function normalizeSource(code) {
+  let out = '';
+  let lineStart = 0;
+  let pendingSpace = false;
+  let newLine = true;
+  let i = 0;
+  const n = code.length;
+
+  const separate = (next) => {
+    if (pendingSpace && out && !out.endsWith('\n')) {
+      const prev = out[out.length - 1];
+      if ((WORD_CHAR.test(prev) && WORD_CHAR.test(next)) ||
+          (OPERATOR_CHAR.test(prev) && OPERATOR_CHAR.test(next)) ||
+          (out[lineStart] === '#' && MACRO_NAME.test(out.slice(lineStart)))) {
+        out += ' ';
+      }
+    }
+    pendingSpace = false;
+  };
+
+  while (i < n) {
+    const ch = code[i];
+    const next = code[i + 1];
+    if (ch === '/' && next === '/') {
+      while (i < n && code[i] !== '\n') i++;
+    } else if (ch === '/' && next === '*') {
+      const end = code.indexOf('*/', i + 2);
+      i = end === -1 ? n : end + 2;
+      pendingSpace = true;
+    } else if (ch === '"' || ch === '\'') {
+      separate(ch);
+      let j = i + 1;
+      while (j < n && code[j] !== ch && code[j] !== '\n') {
+        j += code[j] === '\\' ? 2 : 1;
+      }
+      out += code.slice(i, j + 1);
+      newLine = false;
+      i = j + 1;
+    } else if (ch === '\n') {
+      const directive = out[lineStart] === '#' && !out.endsWith('\\');
+      if (directive) {
+        out += '\n';
+        lineStart = out.length;
+        pendingSpace = false;
+      } else {
+        pendingSpace = true;
+      }
+      newLine = true;
+      i++;
+    } else if (ch === ' ' || ch === '\t' || ch === '\r' || ch === '\f' || ch === '\v') {
+      pendingSpace = true;
+      i++;
+    } else {
+      if (ch === '#' && newLine && out && !out.endsWith('\n')) {
+        out += '\n';
+        lineStart = out.length;
+        pendingSpace = false;
+      }
+      separate(ch);
+      out += ch;
+      newLine = false;
+      i++;
+    }
+  }
+  return out;
+}
+
+/**
+ * JSON with object keys sorted, so equal test cases hash equally
+ */
+function canonicalJson(value) {
+  if (Array.isArray(value)) {
+    return `[${value.map(canonicalJson).join(',')}]`;
+  }
+  if (value && typeof value === 'object') {
+    return `{${Object.keys(value).sort()
+      .filter((key) => value[key] !== undefined)
+      .map((key) => `${JSON.stringify(key)}:${canonicalJson(value[key])}`)
+      .join(',')}}`;
+  }
+  return JSON.stringify(value);
+}
+
+function listScripts(dir) {
+  let files = [];
+  for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+    const fullPath = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      if (['benchmarks', 'tests', '__pycache__'].includes(entry.name)) continue;
+      files = files.concat(listScripts(fullPath));
+    } else if (entry.name.endsWith('.py')) {
+      files.push(fullPath);
+    }
+  }
+  return files.sort();
+}
+
+/**
+ * Hash of every evaluation script, computed once per process
+ */
+export function getEvaluatorVersion() {
+  if (evaluatorVersion === null) {
+    const hash = crypto.createHash('sha256');
+    try {
+      for (const file of listScripts(EVALUATION_SCRIPTS_DIR)) {
+        hash.update(path.relative(EVALUATION_SCRIPTS_DIR, file));
+        hash.update(fs.readFileSync(file));
+      }
+    } catch (err) {
+      console.warn('[EVAL CACHE] Could not hash evaluation scripts:', err.message);
+    }
+    evaluatorVersion = hash.digest('hex').slice(0, 16);
+  }
+  return evaluatorVersion;
+}
+
+/**
+ * Whether a test case's result may be served from the cache
+ */
+export function isCacheable(testCase) {
+  if (!testCase || typeof testCase !== 'object') return false;
+  if (testCase.cache === false) return false;
+  if (testCase.impairment) return false;
+  // A time-boxed fuzzing run explores different inputs every time
+  if (testCase.fuzz) return false;
+  if (TIMING_SENSITIVE_FLAGS.some((flag) => testCase[flag])) return false;
+  if ((testCase.steps || []).some((step) => step && step.interval)) return false;
+  return true;
+}
+
+/**
+ * Whether an evaluated result is a verdict on the code that a resubmission may reuse:
+ * a PASS, or a FAIL that is neither fatal (compile error, no bind, crash) nor a timeout
+ * or evaluator error that another run might not hit
+ */
+export function isCacheableResult(result) {
+  if (!result || result.fatal) return false;
+  if (result.exitCode !== 0 && result.exitCode !== 1) return false;
+  if (result.status === 'PASS') return true;
+  return result.status === 'FAIL' && !TRANSIENT_FAILURE.test(result.message || '');
+}
+
+/**
+ * Cache key for one test case of a submission, or null when it must not be cached
+ */
+export function evaluationCacheKey({ code, language, codeType, testCase, clientCount, clientDelay }) {
+  if (cacheDisabled() || !isCacheable(testCase)) return null;
+  const relevant = { ...testCase };
+  for (const field of DISPLAY_ONLY_FIELDS) delete relevant[field];
+  return [
+    getEvaluatorVersion(),
+    language || '',
+    codeType,
+    sha256(normalizeSource(code)),
+    sha256(canonicalJson({ testCase: relevant, clientCount, clientDelay }))
+  ].join(':');
+}
+
+export function getCachedResult(key) {
+  if (!key) return null;
+  const entry = entries.get(key);
+  if (!entry) {
+    stats.misses++;
+    return null;
+  }
+  if (entry.expiresAt <= Date.now()) {
+    entries.delete(key);
+    stats.misses++;
+    return null;
+  }
+  // Re-insert to mark as most recently used
+  entries.delete(key);
+  entries.set(key, entry);
+  stats.hits++;
+  return { ...entry.result };
+}
+
+export function storeResult(key, result) {
+  if (!key) return;
+  entries.delete(key);
+  entries.set(key, { result: { ...result }, expiresAt: Date.now() + ttlMs() });
+  stats.stores++;
+  const limit = maxEntries();
+  while (entries.size > limit) {
+    // Map iteration order is insertion order: the first key is the least recently used
+    entries.delete(entries.keys().next().value);
+    stats.evictions++;
+  }
+}
+
+export function clearEvaluationCache() {
+  entries.clear();
+  evaluatorVersion = null;
+}
+
+export function getEvaluationCacheStats() {
+  return { ...stats, size: entries.size };
+}
@@ -0,0 +1,113 @@
+/**
+ * Test case ordering and early termination for runAndEvaluate.
+ *
+ * Cases run in tiers: cheap smoke cases first, then the functional protocol
+ * cases, then the expensive load/timing cases. Within a tier the authored
+ * order is kept, and results are always returned in the authored order.
+ *
+ * The evaluators print a FATAL:<json> line (see common_scripts/fail_fast.py)
+ * when a failure is about the submission rather than the test case. After
+ * such a line the remaining cases are skipped with the same cause, and
+ * expensive cases only run once every earlier case has passed.
+ */
+
+export const TIER_SMOKE = 0;
+export const TIER_FUNCTIONAL = 1;
+export const TIER_EXPENSIVE = 2;
+
+const EXPENSIVE_FLAGS = [
+  'performance',
+  'connectionReliability',
+  'connectionStorm',
+  'bulkTransfer',
+  'udpBurst',
+  'periodicPush',
+  'concurrency',
+  'http',
+  'fuzz'
+];
+
+const FUNCTIONAL_FLAGS = [
+  'chatroom',
+  'stopAndWait',
+  'multiStep',
+  'errorHandling',
+  'periodicSend',
+  'interactive',
+  'transcript'
+];
+
+// Causes that fail every case of the submission, whichever case reported them
+const ALWAYS_FATAL = ['compile_error', 'no_bind'];
+
+const CAUSE_MESSAGES = {
+  compile_error: 'submission does not compile',
+  no_bind: 'server never bound its port',
+  server_crashed: 'server crashed on a basic connection',
+  earlier_failures: 'earlier functional test cases failed'
+};
+
+/**
+ * Tier of a test case; an explicit numeric `priority` on the case wins
+ */
+export function caseTier(testCase = {}) {
+  if (typeof testCase.priority === 'number') return testCase.priority;
+  if (testCase.impairment || EXPENSIVE_FLAGS.some((flag) => testCase[flag])) return TIER_EXPENSIVE;
+  if (FUNCTIONAL_FLAGS.some((flag) => testCase[flag])) return TIER_FUNCTIONAL;
+  return TIER_SMOKE;
+}
+
+/**
+ * Indexes of `testCases` in the order they should run
+ */
+export function executionOrder(testCases) {
+  return testCases
+    .map((testCase, index) => ({ index, tier: caseTier(testCase) }))
+    .sort((a, b) => a.tier - b.tier || a.index - b.index)
+    .map(({ index }) => index);
+}
+
+/**
+ * The evaluator's FATAL line, if it printed one
+ */
+export function parseFatal(stdout = '') {
+  const line = (stdout.match(/^FATAL:(.+)$/m) || [])[1];
+  if (!line) return null;
+  try {
+    const fatal = JSON.parse(line);
+    return fatal && fatal.cause ? fatal : null;
+  } catch (err) {
+    return null;
+  }
+}
+
+/**
+ * Whether a fatal cause reported by a case of the given tier stops the run
+ */
+export function stopsEvaluation(fatal, tier) {
+  if (!fatal) return false;
+  if (ALWAYS_FATAL.includes(fatal.cause)) return true;
+  // A crash under load or malformed input says nothing about the basic cases
+  return fatal.cause === 'server_crashed' && tier === TIER_SMOKE;
+}
+
+/**
+ * Result entry for a case that was not run
+ */
+export function skippedResult(testCase, cause, sourceIndex, detail = '') {
+  const message = `Skipped: ${CAUSE_MESSAGES[cause] || cause}` +
+    (sourceIndex !== null && sourceIndex !== undefined ? ` (test case ${sourceIndex + 1})` : '');
+  return {
+    stdout: '',
+    stderr: detail,
+    exitCode: null,
+    status: 'SKIPPED',
+    message,
+    description: testCase.description,
+    points: testCase.points,
+    actualOutput: message,
+    timings: null,
+    limits: null,
+    skipped: { cause, sourceIndex }
+  };
+}